@@ -0,0 +1,31 @@
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.views import redirect_to_login
+from django.utils.cache import add_never_cache_headers
+
+
+def async_login_required(view_func):
+    """
+    login_required for async views (Django 4.2's decorators only wrap sync
+    views). request.user is resolved in a thread - it reads the session
+    and user rows - so the view can use it without touching the database.
+    """
+    @wraps(view_func)
+    async def wrapper(request, *args, **kwargs):
+        is_authenticated = await sync_to_async(
+            lambda: request.user.is_authenticated)()
+        if not is_authenticated:
+            return redirect_to_login(request.get_full_path())
+        return await view_func(request, *args, **kwargs)
+    return wrapper
+
+
+def async_never_cache(view_func):
+    """never_cache for async views."""
+    @wraps(view_func)
+    async def wrapper(request, *args, **kwargs):
+        response = await view_func(request, *args, **kwargs)
+        add_never_cache_headers(response)
+        return response
+    return wrapper
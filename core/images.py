@@ -0,0 +1,30 @@
+from functools import lru_cache
+from pathlib import PurePosixPath
+
+from django.conf import settings
+from django.contrib.staticfiles import finders
+
+# Responsive variants live next to the originals, e.g.
+# images/hero.webp -> images/responsive/hero-960w.webp
+VARIANT_DIR = "responsive"
+
+
+def variant_path(path, width):
+    """Static path of the `width`-pixel variant of the image at `path`."""
+    source = PurePosixPath(path)
+    return str(source.parent / VARIANT_DIR
+               / f"{source.stem}-{width}w{source.suffix}")
+
+
+@lru_cache(maxsize=None)
+def available_variants(path):
+    """
+    (width, static path) of every built variant of `path`, narrowest first.
+    Looked up once per process - run build_responsive_images and restart
+    to pick up new variants.
+    """
+    return tuple(
+        (width, variant_path(path, width))
+        for width in sorted(settings.RESPONSIVE_IMAGE_WIDTHS)
+        if finders.find(variant_path(path, width))
+    )
@@ -0,0 +1,91 @@
+import statistics
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client
+
+DEFAULT_PATHS = ['/projects/', '/tasks/agenda/']
+
+
+class Command(BaseCommand):
+    help = (
+        "Fire concurrent GET requests at running servers and report "
+        "throughput and latency, e.g. gunicorn (WSGI, sync views) against "
+        "uvicorn (ASGI, async views) on the same database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'base_urls', nargs='+', metavar='base_url',
+            help='Server(s) to benchmark, e.g. http://127.0.0.1:8000')
+        parser.add_argument(
+            '--user', required=True,
+            help='Username to sign in as (a session is created for it).')
+        parser.add_argument(
+            '--path', action='append', dest='paths',
+            help=f'Path to request; repeatable (default: {DEFAULT_PATHS}).')
+        parser.add_argument(
+            '--requests', type=int, default=500,
+            help='Requests per server (default: 500).')
+        parser.add_argument(
+            '--concurrency', type=int, default=50,
+            help='Requests in flight at once (default: 50).')
+        parser.add_argument(
+            '--timeout', type=float, default=30,
+            help='Seconds before a request counts as an error.')
+
+    def handle(self, *args, **options):
+        user = User.objects.filter(username=options['user']).first()
+        if user is None:
+            raise CommandError(f"No user '{options['user']}'.")
+
+        # A real session row, shared by every server on this database
+        client = Client()
+        client.force_login(user)
+        cookie = (f"{settings.SESSION_COOKIE_NAME}="
+                  f"{client.cookies[settings.SESSION_COOKIE_NAME].value}")
+
+        paths = options['paths'] or DEFAULT_PATHS
+        for base_url in options['base_urls']:
+            urls = [base_url.rstrip('/') + paths[i % len(paths)]
+                    for i in range(options['requests'])]
+            self._run(base_url, urls, cookie, options)
+
+    def _fetch(self, url, cookie, timeout):
+        request = urllib.request.Request(url, headers={'Cookie': cookie})
+        started = time.perf_counter()
+        try:
+            with urllib.request.urlopen(request, timeout=timeout) as response:
+                response.read()
+                ok = response.status == 200
+        except (urllib.error.URLError, OSError):
+            ok = False
+        return ok, time.perf_counter() - started
+
+    def _run(self, base_url, urls, cookie, options):
+        started = time.perf_counter()
+        with ThreadPoolExecutor(options['concurrency']) as pool:
+            results = list(pool.map(
+                lambda url: self._fetch(url, cookie, options['timeout']),
+                urls))
+        elapsed = time.perf_counter() - started
+
+        latencies = sorted(latency for ok, latency in results if ok)
+        errors = len(results) - len(latencies)
+        if not latencies:
+            self.stdout.write(self.style.ERROR(
+                f"{base_url}: all {errors} requests failed"))
+            return
+        p95 = latencies[min(len(latencies) - 1,
+                            int(len(latencies) * 0.95))]
+        self.stdout.write(
+            f"{base_url}: {len(latencies) / elapsed:.1f} req/s, "
+            f"p50 {statistics.median(latencies) * 1000:.0f} ms, "
+            f"p95 {p95 * 1000:.0f} ms, {errors} errors "
+            f"({len(results)} requests, concurrency "
+            f"{options['concurrency']})")
@@ -0,0 +1,75 @@
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from core.images import VARIANT_DIR, variant_path
+
+# Raster formats Pillow can resize and write back in the same format
+IMAGE_SUFFIXES = {".webp", ".jpg", ".jpeg", ".png"}
+
+
+class Command(BaseCommand):
+    help = (
+        "Generate width-based variants of the images under static/images "
+        "(written to static/images/responsive/) for use in srcset via "
+        "{% responsive_image %}. Up-to-date variants are skipped."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--source', default=str(settings.BASE_DIR / 'static'),
+            help='Static directory holding images/ (default: static/).')
+        parser.add_argument(
+            '--widths', type=int, nargs='+',
+            default=settings.RESPONSIVE_IMAGE_WIDTHS,
+            help='Variant widths in pixels '
+                 '(default: settings.RESPONSIVE_IMAGE_WIDTHS).')
+        parser.add_argument(
+            '--quality', type=int, default=80,
+            help='Encoder quality for lossy formats (default: 80).')
+        parser.add_argument(
+            '--force', action='store_true',
+            help='Rebuild variants even if they are newer than the source.')
+
+    def handle(self, *args, **options):
+        try:
+            from PIL import Image
+        except ImportError:
+            raise CommandError(
+                "Pillow is required to build responsive images "
+                "(pip install Pillow).")
+
+        root = Path(options['source'])
+        images = root / 'images'
+        if not images.is_dir():
+            raise CommandError(f"No images directory at {images}.")
+
+        built = skipped = 0
+        for source in sorted(images.iterdir()):
+            if source.suffix.lower() not in IMAGE_SUFFIXES:
+                continue
+            relative = source.relative_to(root).as_posix()
+
+            with Image.open(source) as original:
+                for width in sorted(options['widths']):
+                    # Never upscale: the original already covers this width
+                    if width >= original.width:
+                        continue
+                    target = root / variant_path(relative, width)
+                    if (not options['force'] and target.exists()
+                            and target.stat().st_mtime
+                            >= source.stat().st_mtime):
+                        skipped += 1
+                        continue
+
+                    height = round(original.height * width / original.width)
+                    target.parent.mkdir(exist_ok=True)
+                    original.resize((width, height), Image.LANCZOS).save(
+                        target, quality=options['quality'], optimize=True)
+                    built += 1
+                    self.stdout.write(f"  {target.relative_to(root)}")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Built {built} variant(s) in {images / VARIANT_DIR} "
+            f"({skipped} already up to date)."))
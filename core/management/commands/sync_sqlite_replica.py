@@ -0,0 +1,36 @@
+import sqlite3
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS
+
+
+class Command(BaseCommand):
+    help = (
+        "Copy the SQLite primary database over each SQLite replica "
+        "(local stand-in for replication, see settings_replica)."
+    )
+
+    def handle(self, *args, **options):
+        primary = settings.DATABASES[DEFAULT_DB_ALIAS]
+        if not settings.DATABASE_REPLICAS:
+            raise CommandError("No DATABASE_REPLICAS configured.")
+        if primary["ENGINE"] != "django.db.backends.sqlite3":
+            raise CommandError("Only SQLite replicas can be synced.")
+
+        source = sqlite3.connect(primary["NAME"])
+        try:
+            for alias in settings.DATABASE_REPLICAS:
+                replica = settings.DATABASES[alias]
+                if replica["ENGINE"] != primary["ENGINE"]:
+                    raise CommandError(f"Replica {alias} is not SQLite.")
+                # The backup API copies a consistent snapshot page by page
+                target = sqlite3.connect(replica["NAME"])
+                try:
+                    source.backup(target)
+                finally:
+                    target.close()
+                self.stdout.write(f"Synced {alias} from {primary['NAME']}.")
+        finally:
+            source.close()
+        self.stdout.write(self.style.SUCCESS("Replicas are up to date."))
@@ -0,0 +1,125 @@
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.http import HttpResponse
+from whitenoise.middleware import WhiteNoiseMiddleware
+
+from projects.sharding import ShardMoving
+from . import routers
+
+# Set on responses to visitors who just wrote; while present, their
+# reads go to the primary so replica lag never hides their own changes
+STICKY_COOKIE = "use_primary"
+
+
+# Under ASGI Django runs any middleware that isn't async-capable in a
+# thread, and with it everything below it in the chain: a single sync-only
+# middleware ties up a worker thread for each request to an async view. So
+# every middleware in settings.MIDDLEWARE handles both modes; the ones
+# here follow the get_response they are given.
+
+class StaticFilesMiddleware(WhiteNoiseMiddleware):
+    """
+    WhiteNoise, able to run on the event loop (WhiteNoise 6 is sync-only).
+    Static files are served the same way in both modes - a lookup in the
+    files WhiteNoise indexed at startup - and everything else is passed
+    on.
+    """
+    sync_capable = async_capable = True
+
+    def __init__(self, get_response=None, **kwargs):
+        super().__init__(get_response, **kwargs)
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return super().__call__(request)
+
+    async def __acall__(self, request):
+        if self.autorefresh:
+            static_file = self.find_file(request.path_info)
+        else:
+            static_file = self.files.get(request.path_info)
+        if static_file is not None:
+            return self.serve(static_file, request)
+        return await self.get_response(request)
+
+
+class ReplicaStickinessMiddleware:
+    """
+    Pins a request to the primary database when the visitor wrote within
+    the last settings.REPLICA_STICKY_SECONDS (tracked with a cookie), and
+    starts that window whenever a request writes.
+
+    Sits above SessionMiddleware so the session save at the end of a
+    request counts as a write too.
+    """
+
+    sync_capable = async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not settings.DATABASE_REPLICAS:
+            return self.get_response(request)
+
+        with routers.pin_primary(STICKY_COOKIE in request.COOKIES):
+            response = self.get_response(request)
+            wrote = routers.has_written()
+        return self._start_sticky_window(request, response, wrote)
+
+    async def __acall__(self, request):
+        if not settings.DATABASE_REPLICAS:
+            return await self.get_response(request)
+
+        # The pin is a context variable: it follows the request into the
+        # threads the async ORM queries run in
+        with routers.pin_primary(STICKY_COOKIE in request.COOKIES):
+            response = await self.get_response(request)
+            wrote = routers.has_written()
+        return self._start_sticky_window(request, response, wrote)
+
+    def _start_sticky_window(self, request, response, wrote):
+        # Each write (re)starts the sticky window
+        if wrote:
+            response.set_cookie(
+                STICKY_COOKIE, "1",
+                max_age=settings.REPLICA_STICKY_SECONDS,
+                httponly=True, samesite="Lax",
+                secure=request.is_secure())
+        return response
+
+
+class ShardMovingMiddleware:
+    """
+    Answers 503 with Retry-After while rebalance_shard is moving the
+    user's projects to another shard (projects.sharding.ShardMoving);
+    everyone else is unaffected.
+    """
+
+    sync_capable = async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        # Returns the coroutine as is under ASGI; Django calls
+        # process_exception either way
+        return self.get_response(request)
+
+    def process_exception(self, request, exception):
+        if isinstance(exception, ShardMoving):
+            response = HttpResponse(
+                "Your projects are being moved. Please try again shortly.",
+                status=503, content_type="text/plain")
+            response["Retry-After"] = str(settings.SHARD_MOVE_RETRY_AFTER)
+            return response
+        return None
@@ -0,0 +1,107 @@
+from functools import wraps
+
+from django.conf import settings
+from django.contrib import messages
+from django.core.cache import caches
+from django.http import HttpResponse
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.utils.http import urlencode
+
+# Cached responses are stored under this prefix in the page cache
+KEY_PREFIX = "public-page"
+
+# Response headers replayed on a cache hit
+CACHED_HEADERS = ("Content-Type", "Cache-Control", "Content-Language")
+
+
+def _is_cacheable_request(request):
+    # Only plain anonymous reads; logged-in pages and anything carrying a
+    # flashed message (e.g. "You have been logged out") are rendered live
+    return (request.method in ("GET", "HEAD")
+            and not request.user.is_authenticated
+            and not len(messages.get_messages(request)))
+
+
+def is_public_render(request):
+    """True while a view's output is being rendered for the page cache."""
+    return getattr(request, "_public_page_render", False)
+
+
+def _cache_key(request, key, query_params):
+    # Only the query parameters the page depends on are part of the key,
+    # so arbitrary query strings can't fill the cache with copies of it
+    params = sorted((name, request.GET.getlist(name))
+                    for name in query_params if name in request.GET)
+    query = urlencode(params, doseq=True)
+    cache_key = f"{KEY_PREFIX}:{key or request.path}"
+    return f"{cache_key}?{query}" if query else cache_key
+
+
+def cache_public_page(view=None, *, key=None, status=200, query_params=()):
+    """
+    Full-page cache for anonymous visitors.
+
+    The first anonymous GET renders the view and stores the HTML; later
+    anonymous GETs are answered straight from the cache without running
+    the view or touching the database. Authenticated users, POSTs and
+    requests with pending messages always reach the view.
+
+    While rendering for the cache, {% csrf_field %} leaves its token empty
+    (see is_public_render) and csrf.js fills it in on the client, so the
+    stored HTML holds nothing visitor-specific.
+
+    `key` replaces the request path in the cache key, e.g. so every 404
+    shares one entry; `status` is the response status that may be cached.
+    `query_params` names the query string parameters that change the page;
+    any others are left out of the key.
+    """
+    def decorator(view_func):
+        @wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            if not _is_cacheable_request(request):
+                return view_func(request, *args, **kwargs)
+
+            cache = caches[settings.PUBLIC_PAGE_CACHE_ALIAS]
+            cache_key = _cache_key(request, key, query_params)
+            cached = cache.get(cache_key)
+            if cached is not None:
+                response = HttpResponse(cached["content"],
+                                        status=cached["status"])
+                for header, value in cached["headers"].items():
+                    response[header] = value
+            else:
+                # Template responses render lazily, so render them while
+                # the flag is still set. Reset it even if the view raises:
+                # a 500 page rendered afterwards must not see it
+                request._public_page_render = True
+                try:
+                    response = view_func(request, *args, **kwargs)
+                    if hasattr(response, "render"):
+                        response.render()
+                finally:
+                    request._public_page_render = False
+                # Anything setting cookies (a session, a CSRF cookie) is
+                # specific to this visitor and is not stored
+                if (response.status_code == status
+                        and not response.streaming
+                        and not response.cookies):
+                    cache.set(cache_key, {
+                        "content": response.content,
+                        "status": response.status_code,
+                        "headers": {h: response[h] for h in CACHED_HEADERS
+                                    if response.has_header(h)},
+                    }, settings.PUBLIC_PAGE_CACHE_SECONDS)
+
+            # Logged-in visitors see different pages at the same URLs, so
+            # shared caches must key on the session cookie
+            patch_vary_headers(response, ("Cookie",))
+            if not response.has_header("Cache-Control"):
+                patch_cache_control(
+                    response, public=True,
+                    max_age=settings.PUBLIC_PAGE_CACHE_SECONDS)
+            return response
+        return wrapper
+
+    if view is not None:
+        return decorator(view)
+    return decorator
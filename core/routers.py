@@ -0,0 +1,73 @@
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+# True while reads must go to the primary: after a write in this request,
+# during a sticky window after the visitor's last write (see
+# ReplicaStickinessMiddleware), or inside pin_primary()
+_pinned = ContextVar("pinned_to_primary", default=False)
+# True once the current pin_primary() block has written to the primary
+_wrote = ContextVar("wrote_to_primary", default=False)
+
+
+def is_pinned():
+    return _pinned.get()
+
+
+def has_written():
+    return _wrote.get()
+
+
+@contextmanager
+def pin_primary(pinned=True):
+    """
+    Route reads inside the block to the primary (or, with pinned=False,
+    to the replicas until the block writes). has_written() reports
+    whether the block wrote.
+    """
+    pinned_token = _pinned.set(pinned)
+    wrote_token = _wrote.set(False)
+    try:
+        yield
+    finally:
+        _wrote.reset(wrote_token)
+        _pinned.reset(pinned_token)
+
+
+class ReplicaRouter:
+    """
+    Reads go to a randomly chosen alias in settings.DATABASE_REPLICAS and
+    writes to the primary ('default').
+
+    A write pins the rest of the current request (or context) to the
+    primary so it reads its own writes, and so does an open transaction on
+    the primary - e.g. select_for_update() before an UPDATE. With no
+    replicas configured every query goes to the primary as before.
+    """
+
+    def _replicas(self):
+        return getattr(settings, "DATABASE_REPLICAS", [])
+
+    def db_for_read(self, model, **hints):
+        replicas = self._replicas()
+        if (not replicas or _pinned.get()
+                or connections[DEFAULT_DB_ALIAS].in_atomic_block):
+            return DEFAULT_DB_ALIAS
+        return random.choice(replicas)
+
+    def db_for_write(self, model, **hints):
+        if self._replicas():
+            # Read-your-writes for the rest of this request
+            _pinned.set(True)
+            _wrote.set(True)
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Primary and replicas hold the same data
+        databases = {DEFAULT_DB_ALIAS, *self._replicas()}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
@@ -0,0 +1,26 @@
+from django import template
+from django.templatetags.static import static
+from django.utils.html import format_html
+
+from core.images import available_variants
+
+register = template.Library()
+
+
+@register.simple_tag
+def responsive_image(path, alt="", sizes="100vw", css_class="",
+                     loading="lazy"):
+    """
+    Render an <img> for a static image with a width-based srcset built from
+    the variants generated by `manage.py build_responsive_images`. Without
+    variants it falls back to the original file alone.
+
+        {% responsive_image 'images/hero.webp' sizes='100vw' %}
+    """
+    variants = available_variants(path)
+    srcset = ", ".join(
+        f"{static(variant)} {width}w" for width, variant in variants)
+    return format_html(
+        '<img src="{}" srcset="{}" sizes="{}" alt="{}" class="{}" '
+        'loading="{}" decoding="async">',
+        static(path), srcset, sizes, alt, css_class, loading)
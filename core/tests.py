@@ -1,3 +1,486 @@
-from django.test import TestCase
+import importlib
+import json
+import shutil
+import tempfile
+from datetime import date, timedelta
+from io import StringIO
+from pathlib import Path
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.contrib.auth.models import AnonymousUser, User
+from django.core.cache import cache
+from django.core.handlers.asgi import ASGIHandler
+from django.conf import settings
+from django.core.management import call_command
+from django.db import transaction
+from django.http import HttpResponse
+from django.template import Context, Template
+from django.test import (AsyncClient, Client, RequestFactory,
+                         SimpleTestCase, TestCase, TransactionTestCase,
+                         override_settings)
+from django.urls import clear_url_caches, resolve, reverse
+
+from core import routers
+from core.images import available_variants, variant_path
+from core.page_cache import cache_public_page, is_public_render
+from core.middleware import STICKY_COOKIE, ReplicaStickinessMiddleware
+from projects import async_views as project_async_views
+from projects.events import LocalBroker
+from projects.lifecycle import reschedule_project
+from projects.models import (ArchivedProject, Project, ProjectTemplate,
+                             Tombstone)
+from projects.sharding import write_db
+from tasks import async_views as task_async_views
+from tasks.models import Task
+
+
+MANIFEST_STORAGES = {
+    "default": {
+        "BACKEND": "django.core.files.storage.FileSystemStorage",
+    },
+    "staticfiles": {
+        "BACKEND": "whitenoise.storage.CompressedManifestStaticFilesStorage",
+    },
+}
+
+
+class StaticManifestTests(SimpleTestCase):
+    def setUp(self):
+        self.static_root = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.static_root)
+
+    def collectstatic(self):
+        with override_settings(STATIC_ROOT=self.static_root,
+                               STORAGES=MANIFEST_STORAGES):
+            call_command('collectstatic', interactive=False, verbosity=0,
+                         stdout=StringIO())
+        with open(self.static_root / 'staticfiles.json') as manifest:
+            return json.load(manifest)['paths']
+
+    def test_manifest_maps_assets_to_hashed_names(self):
+        """Every asset gets a content-hashed copy plus compressed versions."""
+        paths = self.collectstatic()
+
+        for name in ('assets/stylesheets/base.css',
+                     'assets/stylesheets/homepage.css',
+                     'assets/javascript/fragments.js'):
+            hashed = paths[name]
+            self.assertNotEqual(hashed, name)
+            self.assertRegex(hashed, r'\.[0-9a-f]{12}\.(css|js)$')
+            self.assertTrue((self.static_root / hashed).exists())
+            # Text assets are precompressed for WhiteNoise to serve
+            self.assertTrue((self.static_root / f'{hashed}.gz').exists())
+            self.assertTrue((self.static_root / f'{hashed}.br').exists())
+
+        # Images are already compressed, so only hashed
+        image = 'images/project_management_system_front_page_background.webp'
+        self.assertIn(image, paths)
+        self.assertFalse(
+            (self.static_root / f'{paths[image]}.gz').exists())
+
+        # Built responsive variants are part of the manifest too
+        self.assertIn(variant_path(image, 480), paths)
+
+
+class ResponsiveImageTests(TestCase):
+    def setUp(self):
+        available_variants.cache_clear()
+        self.addCleanup(available_variants.cache_clear)
+
+    def render(self, path):
+        return Template(
+            "{% load responsive_images %}"
+            "{% responsive_image path alt='Hero' sizes='50vw' %}"
+        ).render(Context({'path': path}))
+
+    def test_srcset_lists_built_variants(self):
+        """Each built width appears in srcset, narrowest first."""
+        html = self.render(
+            'images/project_management_system_front_page_background.webp')
+        self.assertIn(
+            '/static/images/responsive/project_management_system_'
+            'front_page_background-480w.webp 480w, ', html)
+        self.assertIn('-1600w.webp 1600w"', html)
+        self.assertIn('sizes="50vw"', html)
+        self.assertIn('alt="Hero"', html)
+
+    @override_settings(RESPONSIVE_IMAGE_WIDTHS=[123])
+    def test_missing_variants_fall_back_to_original(self):
+        """Without built variants only the original is referenced."""
+        html = self.render(
+            'images/project_management_system_front_page_background.webp')
+        self.assertIn('srcset=""', html)
+        self.assertIn('src="/static/images/project_management_system_'
+                      'front_page_background.webp"', html)
+
+    def test_homepage_uses_responsive_backgrounds(self):
+        response = self.client.get('/')
+        self.assertContains(response, 'class="cover-image"', count=5)
+        self.assertContains(response, 'loading="eager"', count=1)
+
+
+class PublicPageCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+
+    def test_anonymous_homepage_is_served_from_cache(self):
+        """Only the first anonymous hit renders the template."""
+        first = self.client.get(reverse('homepage'))
+        self.assertTemplateUsed(first, 'core/homepage.html')
+
+        with self.assertNumQueries(0):
+            second = self.client.get(reverse('homepage'))
+        self.assertTemplateNotUsed(second, 'core/homepage.html')
+        self.assertEqual(second.content, first.content)
+        self.assertIn('Cookie', second['Vary'])
+        self.assertIn('public', second['Cache-Control'])
+
+    def test_cached_login_page_has_no_csrf_token(self):
+        """The shared copy leaves the token for csrf.js to fill in."""
+        response = self.client.get(reverse('login'))
+        self.assertContains(response, 'data-csrf-fill', count=2)
+        self.assertNotIn('csrftoken', response.cookies)
+        # Browsers still must not keep the login page
+        self.assertIn('no-store', response['Cache-Control'])
+
+        response = self.client.get(reverse('login'))
+        self.assertTemplateNotUsed(response, 'users/login.html')
+        self.assertContains(response, 'data-csrf-fill', count=2)
+
+    def test_login_with_token_from_csrf_endpoint(self):
+        """A cached login form can be posted with the fetched token."""
+        User.objects.create_user(
+            username='a@example.com', email='a@example.com',
+            password='MyStrongPass123')
+        client = Client(enforce_csrf_checks=True)
+        client.get(reverse('login'))
+
+        token = client.get(reverse('csrf_token')).json()['token']
+        response = client.post(reverse('login'), {
+            'csrfmiddlewaretoken': token,
+            'username': 'a@example.com',
+            'password': 'MyStrongPass123',
+            'login_submit': 'Login',
+        })
+        self.assertRedirects(response, reverse('project_list'))
+
+    def test_authenticated_and_flashed_requests_bypass_cache(self):
+        """Logged-in users and pending messages always get a live page."""
+        self.client.get(reverse('login'))
+
+        User.objects.create_user(username='b', password='pass')
+        self.client.login(username='b', password='pass')
+        response = self.client.get(reverse('login'))
+        self.assertTemplateUsed(response, 'users/login.html')
+        self.assertNotContains(response, 'data-csrf-fill')
+
+        # logout flashes "You have been logged out." on the login page
+        response = self.client.get(reverse('logout'), follow=True)
+        self.assertContains(response, 'You have been logged out.')
+
+    def test_only_listed_query_params_are_keyed(self):
+        """Unlisted query strings are answered from the path's entry."""
+        rendered = []
+
+        @cache_public_page(query_params=['tab'])
+        def view(request):
+            rendered.append(request.get_full_path())
+            return HttpResponse(request.GET.get('tab', ''))
+
+        factory = RequestFactory()
+        for path in ['/page/', '/page/?x=1', '/page/?x=2&tab=a',
+                     '/page/?tab=a', '/page/?tab=b']:
+            request = factory.get(path)
+            request.user = AnonymousUser()
+            view(request)
+        self.assertEqual(rendered,
+                         ['/page/', '/page/?x=2&tab=a', '/page/?tab=b'])
+
+    def test_render_flag_is_reset_when_the_view_fails(self):
+        @cache_public_page
+        def view(request):
+            raise ValueError
+
+        request = RequestFactory().get('/')
+        request.user = AnonymousUser()
+        with self.assertRaises(ValueError):
+            view(request)
+        self.assertFalse(is_public_render(request))
+
+    def test_anonymous_404s_share_one_entry(self):
+        """Any missing URL is answered from the same cached 404 page."""
+        first = self.client.get('/no-such-page/')
+        self.assertEqual(first.status_code, 404)
+        self.assertTemplateUsed(first, '404.html')
+
+        second = self.client.get('/another-missing-page/')
+        self.assertEqual(second.status_code, 404)
+        self.assertTemplateNotUsed(second, '404.html')
+        self.assertEqual(second.content, first.content)
+
+
+@override_settings(DATABASE_REPLICAS=['replica'])
+class ReplicaRouterTests(SimpleTestCase):
+    databases = {'default'}
+
+    def setUp(self):
+        self.router = routers.ReplicaRouter()
+
+    def test_reads_go_to_replica_until_a_write(self):
+        with routers.pin_primary(False):
+            self.assertEqual(self.router.db_for_read(Project), 'replica')
+            self.assertEqual(self.router.db_for_write(Project), 'default')
+            # Read-after-write stays on the primary
+            self.assertEqual(self.router.db_for_read(Project), 'default')
+            self.assertTrue(routers.has_written())
+
+    def test_pinned_and_transactional_reads_use_primary(self):
+        with routers.pin_primary():
+            self.assertEqual(self.router.db_for_read(Project), 'default')
+        with routers.pin_primary(False), transaction.atomic():
+            # e.g. select_for_update() ahead of an UPDATE
+            self.assertEqual(self.router.db_for_read(Project), 'default')
+
+    @override_settings(DATABASE_REPLICAS=[])
+    def test_without_replicas_everything_uses_primary(self):
+        with routers.pin_primary(False):
+            self.assertEqual(self.router.db_for_read(Project), 'default')
+            self.router.db_for_write(Project)
+            self.assertFalse(routers.has_written())
+
+    def test_owner_scoped_reads_go_to_replica(self):
+        """for_user() leaves the choice to the routers without sharding."""
+        user = User(pk=1)
+        querysets = [Project.objects.for_user(user),
+                     ArchivedProject.objects.for_user(user),
+                     ProjectTemplate.objects.for_user(user),
+                     Tombstone.objects.for_user(user),
+                     Task.objects.for_user(user)]
+        with routers.pin_primary(False):
+            for queryset in querysets:
+                self.assertEqual(queryset.db, 'replica')
+        with routers.pin_primary():
+            for queryset in querysets:
+                self.assertEqual(queryset.db, 'default')
+
+    def test_rows_read_from_replica_are_written_to_primary(self):
+        project = Project(pk=1, owner_id=1)
+        project._state.db = 'replica'
+        with routers.pin_primary(False):
+            self.assertEqual(write_db(project), 'default')
+            # The rest of the request reads its own write
+            self.assertTrue(routers.has_written())
+
+    def test_middleware_sets_sticky_window_after_write(self):
+        seen = []
+
+        def view(request):
+            seen.append(routers.is_pinned())
+            if request.method == 'POST':
+                self.router.db_for_write(Project)
+            return HttpResponse()
+
+        middleware = ReplicaStickinessMiddleware(view)
+        factory = RequestFactory()
+        pinned_before = routers.is_pinned()
+
+        response = middleware(factory.get('/'))
+        self.assertNotIn(STICKY_COOKIE, response.cookies)
+
+        response = middleware(factory.post('/'))
+        cookie = response.cookies[STICKY_COOKIE]
+        self.assertEqual(cookie['max-age'], settings.REPLICA_STICKY_SECONDS)
+
+        request = factory.get('/')
+        request.COOKIES[STICKY_COOKIE] = '1'
+        middleware(request)
+        self.assertEqual(seen, [False, False, True])
+        # The pin ends with the request
+        self.assertEqual(routers.is_pinned(), pinned_before)
+
+
+@skipUnless('replica' in settings.DATABASES,
+            'run with project_management_systems.settings_replica')
+class SqliteReplicaTests(TransactionTestCase):
+    """Routing against two real SQLite databases (see settings_replica)."""
+    # The runner sets up every alias named here, even for skipped tests
+    databases = {'default'} | ({'replica'} & set(settings.DATABASES))
+
+    def test_unsynced_writes_are_only_read_back_while_pinned(self):
+        user = User.objects.create_user(username='r', password='pass')
+        Project.objects.create(
+            name='Primary only', description='', owner=user,
+            start_date='2025-01-01', end_date='2025-01-02')
+        with routers.pin_primary(False):
+            # The replica has not caught up with the write yet
+            self.assertFalse(
+                Project.objects.filter(name='Primary only').exists())
+        with routers.pin_primary():
+            self.assertTrue(
+                Project.objects.filter(name='Primary only').exists())
+
+    def test_owner_scoped_reads_use_the_replica(self):
+        user = User.objects.create_user(username='r', password='pass')
+        Project.objects.create(
+            name='Primary only', description='', owner=user,
+            start_date='2025-01-01', end_date='2025-01-02')
+        with routers.pin_primary(False):
+            self.assertFalse(Project.objects.for_user(user).exists())
+        with routers.pin_primary():
+            self.assertTrue(Project.objects.for_user(user).exists())
+
+    def test_changes_to_replica_reads_go_to_the_primary(self):
+        user = User.objects.create_user(username='r', password='pass')
+        user.save(using='replica')
+        project = Project.objects.create(
+            name='Synced', description='', owner=user,
+            start_date=date(2025, 1, 1), end_date=date(2025, 1, 2))
+        project.save(using='replica')
+        with routers.pin_primary(False):
+            project = Project.objects.for_user(user).get()
+            self.assertEqual(project._state.db, 'replica')
+            reschedule_project(project, 1)
+        self.assertEqual(
+            Project.objects.using('default').get().start_date,
+            date(2025, 1, 2))
+        self.assertEqual(
+            Project.objects.using('replica').get().start_date,
+            date(2025, 1, 1))
+
+
+def _reload_urlconfs():
+    # The URL modules pick sync or async views when imported
+    import project_management_systems.urls
+    import projects.urls
+    import tasks.urls
+    for module in (projects.urls, tasks.urls,
+                   project_management_systems.urls):
+        importlib.reload(module)
+    clear_url_caches()
+
+
+class AsyncReadViewTests(TestCase):
+    """The read-only pages as served under ASGI (ASYNC_VIEWS on)."""
+
+    def setUp(self):
+        settings_override = override_settings(ASYNC_VIEWS=True)
+        settings_override.enable()
+        _reload_urlconfs()
+        self.addCleanup(_reload_urlconfs)
+        self.addCleanup(settings_override.disable)
+
+        self.user = User.objects.create_user(username='a', password='pass')
+        other = User.objects.create_user(username='b', password='pass')
+        self.project = Project.objects.create(
+            name='Async project', description='Served from the event loop',
+            owner=self.user, start_date=date.today(),
+            end_date=date.today())
+        self.task = Task.objects.create(
+            project=self.project, name='Due soon',
+            end_date=date.today() + timedelta(days=1))
+        Project.objects.create(
+            name='Not mine', description='', owner=other,
+            start_date=date.today(), end_date=date.today())
+        self.async_client.force_login(self.user)
+
+    @override_settings(DEBUG=True)
+    def test_middleware_chain_is_not_adapted(self):
+        """
+        Every middleware runs on the event loop, so an async view holds no
+        thread (Django logs each sync/async adaptation when DEBUG is on).
+        """
+        with self.assertNoLogs('django.request', 'DEBUG'):
+            ASGIHandler()
+
+    async def test_sticky_window_under_asgi(self):
+        seen = []
+
+        async def view(request):
+            seen.append(routers.is_pinned())
+            if request.method == 'POST':
+                routers.ReplicaRouter().db_for_write(Project)
+            return HttpResponse()
+
+        middleware = ReplicaStickinessMiddleware(view)
+        factory = RequestFactory()
+        with self.settings(DATABASE_REPLICAS=['replica']):
+            response = await middleware(factory.post('/'))
+            request = factory.get('/')
+            request.COOKIES[STICKY_COOKIE] = '1'
+            await middleware(request)
+        self.assertIn(STICKY_COOKIE, response.cookies)
+        self.assertEqual(seen, [False, True])
+
+    def test_urls_switch_to_async_views(self):
+        self.assertIs(resolve(reverse('project_list')).func,
+                      project_async_views.project_list)
+        self.assertIs(
+            resolve(reverse('task_detail', args=[self.task.id])).func,
+            task_async_views.task_detail)
+
+    async def test_project_pages(self):
+        response = await self.async_client.get(reverse('project_list'))
+        self.assertContains(response, 'Async project')
+        self.assertNotContains(response, 'Not mine')
+        self.assertIn('no-cache', response['Cache-Control'])
+
+        response = await self.async_client.get(
+            reverse('project_detail', args=[self.project.id]))
+        self.assertContains(response, 'Due soon')
+
+    async def test_missing_project_is_404(self):
+        response = await self.async_client.get(
+            reverse('project_detail', args=[self.project.id + 100]))
+        self.assertEqual(response.status_code, 404)
+
+    async def test_task_pages(self):
+        response = await self.async_client.get(
+            reverse('task_detail', args=[self.task.id]))
+        self.assertContains(response, 'Due soon')
+
+        response = await self.async_client.get(reverse('agenda'))
+        self.assertContains(response, 'Due soon')
+        self.assertContains(response, 'Async project')
+
+    async def test_large_projects_stream_from_aiterator(self):
+        with self.settings(PROJECT_DETAIL_STREAM_THRESHOLD=1):
+            await Task.objects.acreate(project=self.project, name='Another')
+            response = await self.async_client.get(
+                reverse('project_detail', args=[self.project.id]))
+        self.assertTrue(response.streaming)
+        content = b''.join([chunk async for chunk in
+                            response.streaming_content])
+        self.assertIn(b'Due soon', content)
+        self.assertIn(b'Another', content)
+
+    async def test_anonymous_visitors_are_sent_to_login(self):
+        response = await AsyncClient().get(reverse('project_list'))
+        self.assertEqual(response.status_code, 302)
+        self.assertIn(settings.LOGIN_URL, response['Location'])
+
+    async def test_project_events_stream(self):
+        url = reverse('project_events', args=[self.project.id])
+        response = await self.async_client.get(
+            reverse('project_detail', args=[self.project.id]))
+        self.assertContains(response, f'data-events-url="{url}"')
+
+        # A broker of its own: the test client never finalizes the stream
+        broker = LocalBroker()
+        with mock.patch('projects.events.get_broker', return_value=broker):
+            response = await self.async_client.get(url)
+            self.assertEqual(response['Content-Type'], 'text/event-stream')
+            stream = response.streaming_content
+            self.assertTrue((await anext(stream)).startswith(b'retry: '))
+
+        self.assertTrue(broker.has_listeners(self.project.id))
+        broker.publish(self.project.id, {
+            'type': 'task.deleted', 'task_id': self.task.id})
+        chunk = await anext(stream)
+        self.assertTrue(chunk.startswith(b'event: task.deleted\ndata: {'))
+
+    async def test_project_events_are_scoped_to_owner(self):
+        other = await Project.objects.exclude(owner=self.user).aget()
+        response = await self.async_client.get(
+            reverse('project_events', args=[other.id]))
+        self.assertEqual(response.status_code, 404)
@@ -7,4 +7,6 @@ from . import views
 # Define the list of URL patterns for this app
 urlpatterns = [
     path('', views.homepage, name='homepage'),
+    # CSRF token for the forms on cached public pages (JSON)
+    path('csrf/', views.csrf_token, name='csrf_token'),
 ]
@@ -1,6 +1,27 @@
 # Import the render function to generate an HttpResponse using a template
 from django.shortcuts import render
+from django.http import JsonResponse
+from django.middleware.csrf import get_token
+from django.views.decorators.cache import never_cache
+from .page_cache import cache_public_page
 
-# Define the homepage view
+
+# Define the homepage view (served from the page cache for anonymous users)
+@cache_public_page
 def homepage(request):
- return render(request, 'core/homepage.html')
+    return render(request, 'core/homepage.html')
+
+
+@never_cache
+def csrf_token(request):
+    """
+    CSRF token for forms on cached public pages (see csrf.js). Also sets
+    the CSRF cookie the token is checked against.
+    """
+    return JsonResponse({'token': get_token(request)})
+
+
+# Every anonymous 404 looks the same, so they share one cache entry
+@cache_public_page(key='404', status=404)
+def page_not_found(request, exception):
+    return render(request, '404.html', status=404)
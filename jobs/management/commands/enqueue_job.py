@@ -0,0 +1,31 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from jobs.registry import JOBS, enqueue
+
+
+class Command(BaseCommand):
+    help = (
+        "Queue a registered background job, e.g. from a scheduler: "
+        "manage.py enqueue_job tasks.sweep_overdue"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('name', help='Registered job name.')
+        parser.add_argument(
+            '--payload', default='{}',
+            help='Job keyword arguments as a JSON object.')
+
+    def handle(self, *args, **options):
+        if options['name'] not in JOBS:
+            raise CommandError(
+                f"Unknown job '{options['name']}'. Registered jobs: "
+                f"{', '.join(sorted(JOBS))}")
+        try:
+            payload = json.loads(options['payload'])
+        except ValueError as error:
+            raise CommandError(f"Invalid --payload: {error}")
+
+        job = enqueue(options['name'], **payload)
+        self.stdout.write(self.style.SUCCESS(f"Queued job {job.id}."))
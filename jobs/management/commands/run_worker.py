@@ -0,0 +1,70 @@
+import os
+import socket
+import threading
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core.routers import pin_primary
+from jobs.worker import requeue_stale, work
+
+
+class Command(BaseCommand):
+    help = (
+        "Run background jobs from the database queue. Each of the "
+        "--concurrency threads claims and runs one job at a time."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--concurrency', type=int,
+            default=settings.JOBS_WORKER_CONCURRENCY,
+            help='Number of jobs run in parallel '
+                 f'(default: {settings.JOBS_WORKER_CONCURRENCY}).')
+        parser.add_argument(
+            '--poll-interval', type=float, default=1.0,
+            help='Seconds to wait when the queue is empty (default: 1).')
+        parser.add_argument(
+            '--once', action='store_true',
+            help='Exit once no job is due instead of polling forever.')
+
+    def handle(self, *args, **options):
+        requeued = requeue_stale()
+        if requeued:
+            self.stdout.write(f"Re-queued {requeued} stale jobs.")
+
+        worker_name = f"{socket.gethostname()}:{os.getpid()}"
+        stop_event = threading.Event()
+        totals = []
+
+        def run(index):
+            # Claims must see the queue as it is now, not a lagging replica
+            with pin_primary():
+                totals.append(work(
+                    f"{worker_name}:{index}",
+                    once=options['once'],
+                    poll_interval=options['poll_interval'],
+                    stop_event=stop_event))
+
+        concurrency = max(1, options['concurrency'])
+        threads = [threading.Thread(target=run, args=(index,), daemon=True)
+                   for index in range(1, concurrency)]
+        for thread in threads:
+            thread.start()
+
+        try:
+            # Worker 0 runs in this thread alongside any extra threads
+            run(0)
+            for thread in threads:
+                while thread.is_alive():
+                    thread.join(timeout=0.5)
+        except KeyboardInterrupt:
+            # Worker 0's job was interrupted and is back in the queue (see
+            # run_job); let the other threads' jobs finish, then stop
+            # claiming new ones
+            stop_event.set()
+            for thread in threads:
+                thread.join()
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Worker stopped after running {sum(totals)} jobs."))
@@ -0,0 +1,60 @@
+from django.db import models
+from django.contrib.auth.models import User
+from django.utils import timezone
+
+
+class Job(models.Model):
+    """
+    A unit of background work stored in the database, so no external
+    broker is needed. Jobs are claimed and run by `manage.py run_worker`.
+    """
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('succeeded', 'Succeeded'),
+        ('failed', 'Failed'),
+    ]
+
+    # Registered handler name, e.g. 'projects.purge'
+    name = models.CharField(max_length=100)
+
+    # Keyword arguments passed to the handler
+    payload = models.JSONField(default=dict, blank=True)
+
+    # User the job runs on behalf of; only they can see its status page
+    owner = models.ForeignKey(
+        User, null=True, blank=True, on_delete=models.CASCADE,
+        related_name='jobs')
+
+    status = models.CharField(
+        max_length=10, choices=STATUS_CHOICES, default='queued')
+
+    # Retry bookkeeping
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=5)
+    run_after = models.DateTimeField(default=timezone.now)
+
+    # Which worker holds the job, and since when
+    locked_by = models.CharField(max_length=100, blank=True)
+    locked_at = models.DateTimeField(null=True, blank=True)
+
+    # Outcome of the last attempt
+    result = models.JSONField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # Serves the worker's "next due job" lookup
+            models.Index(fields=['status', 'run_after'],
+                         name='job_status_run_after_idx'),
+        ]
+
+    def __str__(self):
+        return f"Job {self.id}: {self.name} ({self.status})"
+
+    @property
+    def is_finished(self):
+        return self.status in ('succeeded', 'failed')
@@ -0,0 +1,42 @@
+from django.utils import timezone
+
+from .models import Job
+
+# Handler name -> (function, max_attempts)
+JOBS = {}
+
+
+def job(name, max_attempts=5):
+    """
+    Register a function as a background job handler:
+
+        @job('projects.purge')
+        def purge(project_id):
+            ...
+
+    The handler is called with the job payload as keyword arguments; its
+    return value (if JSON serialisable) is stored as the job result.
+    """
+    def decorator(func):
+        JOBS[name] = (func, max_attempts)
+        return func
+    return decorator
+
+
+def enqueue(name, owner=None, run_after=None, **payload):
+    """Queue a registered job and return the Job row."""
+    if name not in JOBS:
+        raise KeyError(f"Unknown job '{name}'.")
+    return Job.objects.create(
+        name=name,
+        payload=payload,
+        owner=owner,
+        max_attempts=JOBS[name][1],
+        run_after=run_after or timezone.now(),
+    )
+
+
+def pending_jobs(**payload):
+    """Queued or running jobs whose payload contains these values."""
+    lookups = {f'payload__{key}': value for key, value in payload.items()}
+    return Job.objects.filter(status__in=['queued', 'running'], **lookups)
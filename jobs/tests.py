@@ -0,0 +1,252 @@
+from datetime import date, timedelta
+from io import StringIO
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from jobs.models import Job
+from jobs.registry import JOBS, enqueue, job
+from jobs.worker import Heartbeat, claim, requeue_stale, run_job, work
+from projects.models import Project
+from tasks.models import Task
+
+# Calls made to the test handlers below
+CALLS = []
+
+
+@job('tests.record')
+def record(value):
+    CALLS.append(value)
+    return {'value': value}
+
+
+@job('tests.explode', max_attempts=2)
+def explode():
+    raise RuntimeError('boom')
+
+
+@job('tests.unstorable')
+def unstorable():
+    CALLS.append('ran')
+    return {'when': date.today()}
+
+
+@job('tests.interrupted')
+def interrupted():
+    # As if Ctrl+C reached the worker while it ran this job
+    raise KeyboardInterrupt
+
+
+class JobQueueTests(TestCase):
+    def setUp(self):
+        CALLS.clear()
+        self.user = User.objects.create_user(
+            'user', 'user@example.com', 'pass')
+
+    def test_enqueue_unknown_job_is_rejected(self):
+        """Only registered handlers can be queued."""
+        with self.assertRaises(KeyError):
+            enqueue('tests.missing')
+
+    def test_worker_runs_due_jobs(self):
+        """run_worker --once drains the queue and records results."""
+        first = enqueue('tests.record', value=1)
+        second = enqueue('tests.record', value=2)
+        later = enqueue('tests.record', value=3,
+                        run_after=timezone.now() + timedelta(hours=1))
+
+        call_command('run_worker', once=True, concurrency=1,
+                     stdout=StringIO())
+
+        self.assertEqual(CALLS, [1, 2])
+        first.refresh_from_db()
+        self.assertEqual(first.status, 'succeeded')
+        self.assertEqual(first.result, {'value': 1})
+        self.assertEqual(Job.objects.get(pk=second.pk).status, 'succeeded')
+        self.assertEqual(Job.objects.get(pk=later.pk).status, 'queued')
+
+    def test_claim_is_exclusive(self):
+        """A claimed job can't be claimed again by another worker."""
+        queued = enqueue('tests.record', value=1)
+        claimed = claim('worker-a')
+        self.assertEqual(claimed.pk, queued.pk)
+        self.assertEqual(claimed.status, 'running')
+        self.assertEqual(claimed.locked_by, 'worker-a')
+        self.assertEqual(claimed.attempts, 1)
+        self.assertIsNone(claim('worker-b'))
+
+    @override_settings(JOBS_RETRY_BACKOFF_SECONDS=10)
+    def test_failed_job_is_retried_with_backoff_then_fails(self):
+        """Failures are retried later, up to max_attempts."""
+        failing = enqueue('tests.explode')
+
+        with self.assertLogs('jobs.worker', 'WARNING'):
+            run_job(claim('worker'))
+        failing.refresh_from_db()
+        self.assertEqual(failing.status, 'queued')
+        self.assertIn('boom', failing.last_error)
+        self.assertGreater(failing.run_after,
+                           timezone.now() + timedelta(seconds=5))
+
+        # Not due yet
+        self.assertIsNone(claim('worker'))
+
+        Job.objects.filter(pk=failing.pk).update(run_after=timezone.now())
+        with self.assertLogs('jobs.worker', 'WARNING'):
+            run_job(claim('worker'))
+        failing.refresh_from_db()
+        self.assertEqual(failing.status, 'failed')
+        self.assertEqual(failing.attempts, 2)
+
+    def test_stale_running_jobs_are_requeued(self):
+        """Jobs left running by a dead worker go back to the queue."""
+        stale = enqueue('tests.record', value=1)
+        claim('dead-worker')
+        Job.objects.filter(pk=stale.pk).update(
+            locked_at=timezone.now() - timedelta(hours=2))
+
+        self.assertEqual(requeue_stale(), 1)
+        self.assertEqual(Job.objects.get(pk=stale.pk).status, 'queued')
+
+    def test_heartbeat_keeps_long_jobs_claimed(self):
+        """A job still being run is never taken for a stale one."""
+        running = enqueue('tests.record', value=1)
+        claimed = claim('worker')
+        Job.objects.filter(pk=running.pk).update(
+            locked_at=timezone.now() - timedelta(hours=2))
+
+        self.assertEqual(Heartbeat(claimed).beat(), 1)
+        self.assertEqual(requeue_stale(), 0)
+
+        # Once re-queued (its worker went quiet) the job is not ours
+        Job.objects.filter(pk=running.pk).update(
+            locked_at=timezone.now() - timedelta(hours=2))
+        self.assertEqual(requeue_stale(), 1)
+        self.assertEqual(Heartbeat(claimed).beat(), 0)
+
+    def test_running_workers_requeue_stale_jobs(self):
+        stale = enqueue('tests.record', value=1)
+        claim('dead-worker')
+        Job.objects.filter(pk=stale.pk).update(
+            locked_at=timezone.now() - timedelta(hours=2))
+
+        self.assertEqual(work('worker', once=True), 1)
+        self.assertEqual(CALLS, [1])
+        self.assertEqual(Job.objects.get(pk=stale.pk).status, 'succeeded')
+
+    def test_unstorable_result_fails_the_job(self):
+        """A result that isn't JSON doesn't leave the job running."""
+        unstored = enqueue('tests.unstorable')
+        with self.assertLogs('jobs.worker', 'WARNING'):
+            self.assertFalse(run_job(claim('worker')))
+        unstored.refresh_from_db()
+        self.assertEqual(CALLS, ['ran'])
+        self.assertEqual(unstored.status, 'failed')
+        self.assertIn('not JSON serializable', unstored.last_error)
+        self.assertEqual(unstored.locked_by, '')
+
+    def test_interrupted_job_goes_back_to_the_queue(self):
+        """Stopping the worker mid-run doesn't leave the job running."""
+        stopped = enqueue('tests.interrupted')
+        with self.assertRaises(KeyboardInterrupt):
+            run_job(claim('worker'))
+        stopped.refresh_from_db()
+        self.assertEqual(stopped.status, 'queued')
+        self.assertEqual(stopped.locked_by, '')
+        self.assertIsNone(stopped.locked_at)
+        self.assertEqual(stopped.attempts, 0)
+
+    def test_job_status_pages_are_owner_only(self):
+        """Users only see their own jobs."""
+        own = enqueue('tests.record', owner=self.user, value=1)
+        other_user = User.objects.create_user(
+            'other', 'other@example.com', 'pass2')
+        other = enqueue('tests.record', owner=other_user, value=2)
+        self.client.login(username='user', password='pass')
+
+        response = self.client.get(reverse('job_detail', args=[own.id]))
+        self.assertContains(response, 'Queued')
+        response = self.client.get(reverse('job_detail', args=[own.id]),
+                                   {'format': 'json'})
+        self.assertEqual(response.json()['status'], 'queued')
+        response = self.client.get(reverse('job_detail', args=[other.id]))
+        self.assertEqual(response.status_code, 404)
+        response = self.client.get(reverse('job_list'))
+        self.assertEqual(list(response.context['jobs']), [own])
+
+    def test_handlers_are_discovered(self):
+        """Jobs declared in app jobs.py modules are registered."""
+        for name in ['projects.close', 'projects.reopen', 'projects.purge',
+                     'projects.archive', 'tasks.sweep_overdue']:
+            self.assertIn(name, JOBS)
+
+
+class BackgroundViewTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            'user', 'user@example.com', 'pass')
+        self.client.login(username='user', password='pass')
+        self.project = Project.objects.create(
+            name='Huge Project', description='Many tasks', owner=self.user,
+            start_date=date.today(), end_date=date.today())
+        Task.objects.bulk_create(
+            Task(project=self.project, name=f'Task {i}') for i in range(5))
+
+    def run_worker(self):
+        call_command('run_worker', once=True, concurrency=1,
+                     stdout=StringIO())
+
+    @override_settings(JOBS_INLINE_TASK_LIMIT=3)
+    def test_large_project_close_runs_in_background(self):
+        """Closing a large project queues a job instead of doing the work."""
+        self.client.get(
+            reverse('project_toggle_complete', args=[self.project.id]))
+        self.project.refresh_from_db()
+        self.assertEqual(self.project.status, 'open')
+        self.assertTrue(Job.objects.filter(
+            name='projects.close', owner=self.user).exists())
+
+        # A second click doesn't queue a duplicate
+        self.client.get(
+            reverse('project_toggle_complete', args=[self.project.id]))
+        self.assertEqual(Job.objects.count(), 1)
+
+        self.run_worker()
+        self.project.refresh_from_db()
+        self.assertEqual(self.project.status, 'closed')
+        self.assertFalse(
+            self.project.tasks.exclude(status='completed').exists())
+
+    def test_delete_queues_purge_job(self):
+        """Deleting a project queues the purge for the worker."""
+        self.client.post(
+            reverse('project_confirm_delete', args=[self.project.id]),
+            {'password': 'pass'})
+        self.assertTrue(Job.objects.filter(name='projects.purge').exists())
+
+        self.run_worker()
+        self.assertFalse(
+            Project.all_objects.filter(id=self.project.id).exists())
+        self.assertFalse(Task.objects.exists())
+
+    def test_overdue_sweep_job(self):
+        """The sweep updates stored statuses in bulk."""
+        self.project.tasks.update(end_date=date.today() - timedelta(days=1))
+        enqueue('tasks.sweep_overdue')
+        self.run_worker()
+        self.assertFalse(
+            self.project.tasks.exclude(status='overdue').exists())
+
+    def test_overdue_sweep_skips_deleted_projects(self):
+        """Tasks of projects waiting to be purged are not touched."""
+        self.project.tasks.update(end_date=date.today() - timedelta(days=1))
+        Project.objects.filter(id=self.project.id).update(
+            deleted_at=timezone.now())
+        enqueue('tasks.sweep_overdue')
+        self.run_worker()
+        self.assertFalse(
+            Task.objects.filter(project=self.project,
+                                status='overdue').exists())
@@ -0,0 +1,10 @@
+from django.urls import path
+from . import views
+
+urlpatterns = [
+    # Recent background jobs started by the user
+    path('', views.job_list, name='job_list'),
+
+    # Status of a single job (add ?format=json for polling)
+    path('<int:job_id>/', views.job_detail, name='job_detail'),
+]
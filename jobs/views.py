@@ -0,0 +1,36 @@
+from django.shortcuts import render, get_object_or_404
+from django.contrib.auth.decorators import login_required
+from django.views.decorators.cache import never_cache
+from django.http import JsonResponse
+
+from .models import Job
+
+# Number of recent jobs listed on the status page
+JOB_LIST_LIMIT = 50
+
+
+@login_required
+@never_cache
+def job_list(request):
+    jobs = Job.objects.filter(owner=request.user).order_by('-id')[
+        :JOB_LIST_LIMIT]
+    return render(request, 'jobs/job_list.html', {'jobs': jobs})
+
+
+@login_required
+@never_cache
+def job_detail(request, job_id):
+    job = get_object_or_404(Job, id=job_id, owner=request.user)
+
+    # Scripts can poll ?format=json until the job has finished
+    if request.GET.get('format') == 'json':
+        return JsonResponse({
+            'id': job.id,
+            'name': job.name,
+            'status': job.status,
+            'attempts': job.attempts,
+            'max_attempts': job.max_attempts,
+            'result': job.result,
+            'finished': job.is_finished,
+        })
+    return render(request, 'jobs/job_detail.html', {'job': job})
@@ -0,0 +1,190 @@
+import json
+import logging
+import threading
+import time
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Job
+from .registry import JOBS
+
+logger = logging.getLogger(__name__)
+
+
+def backoff_delay(attempts):
+    """Exponential backoff: base, 2x base, 4x base ... capped."""
+    delay = settings.JOBS_RETRY_BACKOFF_SECONDS * 2 ** max(attempts - 1, 0)
+    return timedelta(seconds=min(delay, settings.JOBS_RETRY_BACKOFF_MAX))
+
+
+def due_jobs():
+    return Job.objects.filter(
+        status='queued', run_after__lte=timezone.now()
+    ).order_by('run_after', 'id')
+
+
+def claim(worker_id):
+    """
+    Atomically take the next due job for `worker_id`, or return None.
+
+    PostgreSQL: SELECT ... FOR UPDATE SKIP LOCKED, so concurrent workers
+    never wait on (or double-claim) the same row.
+    Other backends (SQLite): a compare-and-set UPDATE ... WHERE status =
+    'queued'. SQLite serialises writers, so only one worker's UPDATE can
+    match; a loser just moves on to the next candidate.
+    """
+    now = timezone.now()
+    claimed = {'status': 'running', 'locked_by': worker_id,
+               'locked_at': now, 'attempts': F('attempts') + 1}
+
+    if connection.features.has_select_for_update_skip_locked:
+        with transaction.atomic():
+            job = due_jobs().select_for_update(skip_locked=True).first()
+            if job is None:
+                return None
+            Job.objects.filter(pk=job.pk).update(**claimed)
+    else:
+        for job_id in due_jobs().values_list('id', flat=True)[:10]:
+            if Job.objects.filter(
+                    pk=job_id, status='queued').update(**claimed):
+                break
+        else:
+            return None
+        job = Job(pk=job_id)
+
+    job.refresh_from_db()
+    return job
+
+
+def requeue_stale(timeout=None):
+    """
+    Put back jobs whose worker died mid-run: a running worker refreshes
+    its job's lock every JOBS_HEARTBEAT_SECONDS (see Heartbeat), so a lock
+    older than the timeout means nobody is running it any more. Returns
+    the number of jobs re-queued.
+    """
+    timeout = timeout or settings.JOBS_LOCK_TIMEOUT_SECONDS
+    cutoff = timezone.now() - timedelta(seconds=timeout)
+    return Job.objects.filter(status='running', locked_at__lt=cutoff).update(
+        status='queued', locked_by='', locked_at=None)
+
+
+class Heartbeat:
+    """
+    Refreshes a running job's locked_at every `interval` seconds from a
+    background thread while the block runs, so requeue_stale() only ever
+    picks up jobs whose worker has stopped, however long they take.
+    """
+
+    def __init__(self, job, interval=None):
+        self.job = job
+        self.interval = interval or settings.JOBS_HEARTBEAT_SECONDS
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def beat(self):
+        """Refresh the lock, unless the job has been taken from us."""
+        return Job.objects.filter(
+            pk=self.job.pk, status='running',
+            locked_by=self.job.locked_by).update(locked_at=timezone.now())
+
+    def _run(self):
+        try:
+            while not self._stop.wait(self.interval):
+                try:
+                    self.beat()
+                except Exception:
+                    # Try again next time; the job itself carries on
+                    logger.exception("Heartbeat of job %s failed",
+                                     self.job.id)
+        finally:
+            # The thread's own database connection
+            connection.close()
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+
+
+def run_job(job):
+    """Run a claimed job and record success, a retry, or failure."""
+    func = JOBS.get(job.name, (None, 0))[0]
+    try:
+        if func is None:
+            raise KeyError(f"No handler registered for '{job.name}'.")
+        with Heartbeat(job):
+            result = func(**job.payload)
+    except KeyboardInterrupt:
+        # The worker is shutting down mid-run: hand the job straight back
+        # rather than leaving it running until requeue_stale() times it
+        # out. The interrupted run doesn't count as an attempt.
+        Job.objects.filter(
+            pk=job.pk, status='running', locked_by=job.locked_by).update(
+            status='queued', locked_by='', locked_at=None,
+            attempts=F('attempts') - 1)
+        raise
+    except Exception:
+        error = traceback.format_exc()
+        logger.warning("Job %s (%s) failed: %s", job.id, job.name, error)
+        fields = {'last_error': error, 'locked_by': '', 'locked_at': None}
+        if job.attempts < job.max_attempts:
+            fields.update(status='queued',
+                          run_after=timezone.now() + backoff_delay(
+                              job.attempts))
+        else:
+            fields.update(status='failed', finished_at=timezone.now())
+        Job.objects.filter(pk=job.pk).update(**fields)
+        return False
+
+    done = {'locked_by': '', 'locked_at': None,
+            'finished_at': timezone.now()}
+    try:
+        # Checked up front: a failed UPDATE would leave the job running
+        json.dumps(result, cls=Job._meta.get_field('result').encoder)
+    except (TypeError, ValueError):
+        # The handler ran, so it isn't retried; only its result is lost
+        error = traceback.format_exc()
+        logger.warning("Job %s (%s) returned a result that can't be "
+                       "stored: %s", job.id, job.name, error)
+        Job.objects.filter(pk=job.pk).update(
+            status='failed', result=None, last_error=error, **done)
+        return False
+
+    Job.objects.filter(pk=job.pk).update(
+        status='succeeded', result=result, last_error='', **done)
+    return True
+
+
+def work(worker_id, once=False, poll_interval=1.0, stop_event=None):
+    """
+    Claim and run jobs until stopped. With once=True, return as soon as
+    no job is due. Returns the number of jobs run.
+    """
+    ran = 0
+    last_requeue = None
+    while stop_event is None or not stop_event.is_set():
+        close_old_connections()
+        # Every running worker looks for jobs whose worker has gone
+        # quiet, not just one starting up
+        if (last_requeue is None or time.monotonic() - last_requeue
+                >= settings.JOBS_HEARTBEAT_SECONDS):
+            requeue_stale()
+            last_requeue = time.monotonic()
+        job = claim(worker_id)
+        if job is None:
+            if once:
+                break
+            time.sleep(poll_interval)
+            continue
+        run_job(job)
+        ran += 1
+    return ran
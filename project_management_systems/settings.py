@@ -36,16 +36,19 @@ INSTALLED_APPS = [
     'core',
     'users',
     'projects',
-    'tasks'
+    'tasks',
+    'jobs',
 ]
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
-    'whitenoise.middleware.WhiteNoiseMiddleware',
+    'core.middleware.StaticFilesMiddleware',
+    'core.middleware.ReplicaStickinessMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'core.middleware.ShardMovingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -70,6 +73,12 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'project_management_systems.wsgi.application'
 
+# Serve the read-only pages (project list/detail, task detail, agenda) from
+# their async views in projects/async_views.py and tasks/async_views.py.
+# asgi.py turns this on for uvicorn deployments; under WSGI every async
+# view would need its own event loop, so the sync views stay the default.
+ASYNC_VIEWS = os.getenv("DJANGO_ASYNC_VIEWS", "False") == "True"
+
 # Database
 DATABASES = {
     'default': dj_database_url.config(
@@ -77,6 +86,42 @@ DATABASES = {
     )
 }
 
+# Read replicas: comma-separated database URLs in DATABASE_REPLICA_URLS.
+# Reads are spread over them and writes go to `default` (see
+# core.routers.ReplicaRouter); tests read the primary through them.
+DATABASE_REPLICAS = []
+for index, url in enumerate(
+        filter(None, os.getenv("DATABASE_REPLICA_URLS", "").split(","))):
+    alias = f"replica{index + 1}"
+    DATABASES[alias] = {
+        **dj_database_url.parse(url.strip()),
+        "TEST": {"MIRROR": "default"},
+    }
+    DATABASE_REPLICAS.append(alias)
+
+# Owner-based sharding: each user's projects and tasks live on one alias in
+# PROJECT_SHARDS (see projects/sharding.py). Extra shards come from the
+# comma-separated database URLs in DATABASE_SHARD_URLS; run migrate with
+# --database for each of them.
+PROJECT_SHARDS = ["default"]
+for index, url in enumerate(
+        filter(None, os.getenv("DATABASE_SHARD_URLS", "").split(","))):
+    alias = f"shard{index + 1}"
+    DATABASES[alias] = dj_database_url.parse(url.strip())
+    PROJECT_SHARDS.append(alias)
+
+# Seconds a user is asked to wait while rebalance_shard moves their data
+SHARD_MOVE_RETRY_AFTER = 30
+
+DATABASE_ROUTERS = [
+    "projects.sharding.ShardRouter",
+    "core.routers.ReplicaRouter",
+]
+
+# After a visitor writes, their reads stay on the primary this long so
+# replication lag never hides their own changes
+REPLICA_STICKY_SECONDS = int(os.getenv("REPLICA_STICKY_SECONDS", "15"))
+
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
     {'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator'},
@@ -96,6 +141,28 @@ STATIC_URL = '/static/'
 STATICFILES_DIRS = [BASE_DIR / "static"]
 STATIC_ROOT = BASE_DIR / "staticfiles"  # For collectstatic in production
 
+# Outside DEBUG, collectstatic writes content-hashed copies of every asset
+# plus gzip/brotli versions of text files, and WhiteNoise serves the hashed
+# names with far-future, immutable cache headers
+MANIFEST_STATIC = os.getenv("DJANGO_MANIFEST_STATIC", str(not DEBUG)) == "True"
+STORAGES = {
+    "default": {
+        "BACKEND": "django.core.files.storage.FileSystemStorage",
+    },
+    "staticfiles": {
+        "BACKEND": (
+            "whitenoise.storage.CompressedManifestStaticFilesStorage"
+            if MANIFEST_STATIC else
+            "django.contrib.staticfiles.storage.StaticFilesStorage"),
+    },
+}
+# Non-hashed URLs (e.g. favicons linked by browsers directly) get a day
+WHITENOISE_MAX_AGE = 24 * 60 * 60
+
+# Widths (px) generated by `manage.py build_responsive_images` and offered
+# in the srcset of {% responsive_image %}
+RESPONSIVE_IMAGE_WIDTHS = [480, 960, 1600]
+
 # Default primary key field type
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
@@ -107,6 +174,74 @@ AUTHENTICATION_BACKENDS = [
 
 LOGIN_URL = 'login'
 
+# Closed projects untouched for this many days are moved to the archive
+# tables by the archive_projects management command
+ARCHIVE_AFTER_DAYS = int(os.getenv("ARCHIVE_AFTER_DAYS", "90"))
+
+# Occurrences of recurring tasks are created as tasks this many days
+# ahead by the tasks.materialize_recurrences job; later ones are worked
+# out on the fly
+RECURRENCE_HORIZON_DAYS = int(os.getenv("RECURRENCE_HORIZON_DAYS", "14"))
+
+# Email: written to files under sent_emails/ unless a backend is
+# configured (e.g. django.core.mail.backends.smtp.EmailBackend)
+EMAIL_BACKEND = os.getenv(
+    "EMAIL_BACKEND", "django.core.mail.backends.filebased.EmailBackend")
+EMAIL_FILE_PATH = os.getenv("EMAIL_FILE_PATH", BASE_DIR / "sent_emails")
+DEFAULT_FROM_EMAIL = os.getenv("DEFAULT_FROM_EMAIL", "no-reply@localhost")
+# Base of the links in emails
+SITE_URL = os.getenv("SITE_URL", "http://127.0.0.1:8000")
+
+# The daily deadline digest (tasks.send_digests job) lists open tasks due
+# within this many days, and keeps its log of sent digests this long
+DIGEST_DUE_DAYS = int(os.getenv("DIGEST_DUE_DAYS", "3"))
+DIGEST_LOG_KEEP_DAYS = 30
+
+# Background jobs (see the jobs app and `manage.py run_worker`)
+# Projects with more tasks than this are closed/reopened by the worker
+JOBS_INLINE_TASK_LIMIT = int(os.getenv("JOBS_INLINE_TASK_LIMIT", "1000"))
+# Jobs run in parallel by one run_worker process
+JOBS_WORKER_CONCURRENCY = int(os.getenv("JOBS_WORKER_CONCURRENCY", "2"))
+# Retry delay doubles from this base after each failed attempt, up to the max
+JOBS_RETRY_BACKOFF_SECONDS = 10
+JOBS_RETRY_BACKOFF_MAX = 3600
+# A worker refreshes the lock on the job it is running this often, and
+# looks for stale jobs (below) as often
+JOBS_HEARTBEAT_SECONDS = 60
+# A running job whose worker has been silent this long is re-queued
+JOBS_LOCK_TIMEOUT_SECONDS = 30 * 60
+
+# project_detail streams its task cards instead of rendering the page in
+# one go when more than this many tasks are shown (0 turns streaming off)
+PROJECT_DETAIL_STREAM_THRESHOLD = int(
+    os.getenv("PROJECT_DETAIL_STREAM_THRESHOLD", "500"))
+
+# Live updates for open project pages (projects/events.py, ASGI only).
+# The default broker reaches pages streamed by the same process; with
+# several processes (or to include the background worker's changes) use
+# projects.events.PostgresBroker, which relays events via LISTEN/NOTIFY
+PROJECT_EVENTS_BROKER = os.getenv(
+    "PROJECT_EVENTS_BROKER", "projects.events.LocalBroker")
+# Seconds between keep-alive comments on an idle event stream
+PROJECT_EVENTS_KEEPALIVE = 25
+
+# Cache backends; set DJANGO_CACHE_LOCATION to share the page cache
+# between processes (e.g. a directory for the file-based backend)
+CACHES = {
+    "default": {
+        "BACKEND": os.getenv(
+            "DJANGO_CACHE_BACKEND",
+            "django.core.cache.backends.locmem.LocMemCache"),
+        "LOCATION": os.getenv("DJANGO_CACHE_LOCATION", ""),
+    },
+}
+
+# Anonymous homepage/login/register/404 responses are served from this
+# cache for this long (see core.page_cache)
+PUBLIC_PAGE_CACHE_ALIAS = "default"
+PUBLIC_PAGE_CACHE_SECONDS = int(
+    os.getenv("PUBLIC_PAGE_CACHE_SECONDS", "300"))
+
 # Django messages framework
 MESSAGE_TAGS = {
     message_constants.DEBUG: 'secondary',
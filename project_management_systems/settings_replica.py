@@ -0,0 +1,31 @@
+"""
+Local stand-in for a primary + read replica setup, using two SQLite files:
+
+    export DJANGO_SETTINGS_MODULE=project_management_systems.settings_replica
+    python manage.py migrate
+    python manage.py sync_sqlite_replica
+    python manage.py runserver
+
+db.sqlite3 is the primary and db_replica.sqlite3 the replica. SQLite does
+not replicate, so sync_sqlite_replica copies the primary over the replica;
+anything written since the last sync is only visible on the primary,
+which is how replication lag shows up.
+
+The replica is a separate test database (no TEST MIRROR), so running the
+test suite with these settings exercises the routing for real.
+"""
+from .settings import *  # noqa: F401,F403
+from .settings import BASE_DIR
+
+DATABASES = {
+    "default": {
+        "ENGINE": "django.db.backends.sqlite3",
+        "NAME": BASE_DIR / "db.sqlite3",
+    },
+    "replica": {
+        "ENGINE": "django.db.backends.sqlite3",
+        "NAME": BASE_DIR / "db_replica.sqlite3",
+    },
+}
+
+DATABASE_REPLICAS = ["replica"]
@@ -0,0 +1,40 @@
+"""
+Local stand-in for a sharded setup, using three SQLite files:
+
+    export DJANGO_SETTINGS_MODULE=project_management_systems.settings_sharded
+    python manage.py migrate
+    python manage.py migrate --database shard1
+    python manage.py migrate --database shard2
+    python manage.py runserver
+
+db.sqlite3 holds users, sessions, jobs and the shard directory, and is
+also the first project shard; db_shard1.sqlite3 and db_shard2.sqlite3 hold
+the projects and tasks of the other users. Move a user between them with
+
+    python manage.py rebalance_shard <username> --to shard2
+
+Each shard is a separate test database, so running SqliteShardTests with
+these settings exercises the routing for real:
+
+    python manage.py test projects.tests.SqliteShardTests \
+        --settings=project_management_systems.settings_sharded
+"""
+from .settings import *  # noqa: F401,F403
+from .settings import BASE_DIR
+
+DATABASES = {
+    "default": {
+        "ENGINE": "django.db.backends.sqlite3",
+        "NAME": BASE_DIR / "db.sqlite3",
+    },
+    "shard1": {
+        "ENGINE": "django.db.backends.sqlite3",
+        "NAME": BASE_DIR / "db_shard1.sqlite3",
+    },
+    "shard2": {
+        "ENGINE": "django.db.backends.sqlite3",
+        "NAME": BASE_DIR / "db_shard2.sqlite3",
+    },
+}
+
+PROJECT_SHARDS = ["default", "shard1", "shard2"]
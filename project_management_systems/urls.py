@@ -6,5 +6,9 @@ urlpatterns = [
     path('', include('core.urls')),
     path('users/', include('users.urls')),
     path('projects/', include('projects.urls')),
-    path('tasks/', include('tasks.urls'))
+    path('tasks/', include('tasks.urls')),
+    path('jobs/', include('jobs.urls')),
 ]
+
+# Anonymous 404 pages are served from the public page cache
+handler404 = 'core.views.page_not_found'
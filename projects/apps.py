@@ -1,6 +1,21 @@
 from django.apps import AppConfig
+from django.db import connections
+from django.db.models.signals import post_migrate, pre_delete
+
+
+def create_search_index(sender, using, **kwargs):
+    """Make sure the full-text index exists after every migrate."""
+    from .search import ensure_search_index
+    ensure_search_index(connections[using])
 
 
 class ProjectsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'projects'
+
+    def ready(self):
+        from django.contrib.auth.models import User
+        from .sharding import delete_user_rows
+        post_migrate.connect(create_search_index, sender=self)
+        pre_delete.connect(delete_user_rows, sender=User,
+                           dispatch_uid='projects.delete_user_rows')
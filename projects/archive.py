@@ -0,0 +1,249 @@
+"""
+Moving closed projects into the archive tables and back.
+
+archive_projects() works through the closed projects old enough to
+archive in id order, one transaction per ARCHIVE_BATCH_SIZE tasks: small
+projects are moved together, a larger one on its own, its tasks a chunk
+per transaction ahead of the project row (see archive_large_project).
+Rows are copied with bulk INSERTs and removed with chunked DELETE
+statements, as in purge.py, so nothing is loaded into models or walked by
+the deletion collector. Recurring task rules go with their project.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import Count
+from django.utils import timezone
+
+from .changes import record_deletions
+from .models import Project, ArchivedProject
+from .sharding import shard_aliases, write_db
+from tasks.models import (Task, ArchivedTask, TaskRecurrence,
+                          ArchivedTaskRecurrence)
+
+# Number of rows copied per INSERT when moving tasks between tiers
+COPY_BATCH_SIZE = 1000
+
+# Tasks moved per transaction by archive_projects
+ARCHIVE_BATCH_SIZE = 1000
+
+
+def _shared_fields(source, target):
+    """Column attnames present on both models (ids are kept as-is)."""
+    source_fields = {f.attname for f in source._meta.concrete_fields}
+    return [f.attname for f in target._meta.concrete_fields
+            if f.attname in source_fields]
+
+
+def _copy_rows(queryset, target, batch_size=COPY_BATCH_SIZE, using=None,
+               exclude=()):
+    """
+    Copy the rows of `queryset` into `target` (in the `using` database,
+    by default the queryset's own) in batches without instantiating the
+    source models. Columns named in `exclude` are left to their defaults.
+    Returns the number of rows copied.
+    """
+    using = using or queryset.db
+    fields = [name for name in _shared_fields(queryset.model, target)
+              if name not in exclude]
+    copied = 0
+    batch = []
+    for row in queryset.order_by('pk').values(*fields).iterator(
+            chunk_size=batch_size):
+        batch.append(target(**row))
+        if len(batch) >= batch_size:
+            target.objects.using(using).bulk_create(batch)
+            copied += len(batch)
+            batch = []
+    if batch:
+        target.objects.using(using).bulk_create(batch)
+        copied += len(batch)
+    return copied
+
+
+def _delete_rows(model, column, values, using,
+                 chunk_size=COPY_BATCH_SIZE):
+    """
+    Delete the rows of `model` whose `column` is in `values` with plain
+    DELETE statements of at most `chunk_size` rows each, skipping the
+    deletion collector. Returns the number of rows deleted.
+    """
+    connection = connections[using]
+    table = connection.ops.quote_name(model._meta.db_table)
+    column = connection.ops.quote_name(column)
+    deleted = 0
+    for start in range(0, len(values), chunk_size):
+        chunk = values[start:start + chunk_size]
+        placeholders = ', '.join(['%s'] * len(chunk))
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"DELETE FROM {table} WHERE {column} IN ({placeholders})",
+                chunk)
+            deleted += cursor.rowcount
+    return deleted
+
+
+def _move_tasks(task_ids, using):
+    """Copy the tasks `task_ids` into ArchivedTask and delete them."""
+    _copy_rows(Task.objects.using(using).filter(id__in=task_ids),
+               ArchivedTask)
+    return _delete_rows(Task, 'id', task_ids, using)
+
+
+def archivable_projects(days=None, using=None):
+    """Closed projects on shard `using` closed more than `days` ago."""
+    if days is None:
+        days = settings.ARCHIVE_AFTER_DAYS
+    cutoff = timezone.now() - timedelta(days=days)
+    return Project.objects.using(using or shard_aliases()[0]).filter(
+        status='closed', closed_at__lt=cutoff)
+
+
+def archive_batch(project_ids, using=None):
+    """
+    Move one batch of projects, their remaining tasks and their recurring
+    task rules on shard `using` into the archive tables. The whole batch
+    is one transaction, so a failure leaves nothing half-moved; callers
+    keep it small (see archive_projects). Returns (projects moved, tasks
+    moved).
+    """
+    using = using or shard_aliases()[0]
+    with transaction.atomic(using=using):
+        # Re-check inside the transaction in case a project was reopened
+        projects = Project.objects.using(using).select_for_update().filter(
+            id__in=project_ids, status='closed')
+        owners = dict(projects.values_list('id', 'owner_id'))
+        project_ids = sorted(owners)
+        if not project_ids:
+            return 0, 0
+
+        moved_projects = _copy_rows(
+            Project.objects.using(using).filter(id__in=project_ids),
+            ArchivedProject)
+        moved_tasks = _move_tasks(list(
+            Task.objects.using(using).filter(project_id__in=project_ids)
+            .values_list('id', flat=True)), using)
+        _copy_rows(
+            TaskRecurrence.objects.using(using).filter(
+                project_id__in=project_ids),
+            ArchivedTaskRecurrence)
+        _delete_rows(TaskRecurrence, 'project_id', project_ids, using)
+        _delete_rows(Project, 'id', project_ids, using)
+
+        # Archived projects leave sync clients like deleted ones
+        for owner_id in set(owners.values()):
+            record_deletions(owner_id, using, 'project', [
+                (project_id, None) for project_id, owner in owners.items()
+                if owner == owner_id])
+    return moved_projects, moved_tasks
+
+
+def archive_large_project(project_id, using=None,
+                          batch_size=ARCHIVE_BATCH_SIZE):
+    """
+    Archive a project with more than `batch_size` tasks without one
+    transaction growing with it: its tasks move `batch_size` per
+    transaction (re-checking that the project is still closed each time),
+    then archive_batch() moves the project row and its rules.
+
+    Until then the project stays live, missing the tasks moved so far.
+    Should it be reopened in between, Project.save() or the task views'
+    reopen brings them back (recover_moved_tasks). Returns (projects
+    moved, tasks moved).
+    """
+    using = using or shard_aliases()[0]
+    moved = 0
+    while True:
+        with transaction.atomic(using=using):
+            if not Project.objects.using(using).select_for_update().filter(
+                    id=project_id, status='closed').exists():
+                return 0, 0
+            task_ids = list(
+                Task.objects.using(using).filter(project_id=project_id)
+                .order_by('id').values_list('id', flat=True)[:batch_size])
+            moved += _move_tasks(task_ids, using)
+        if len(task_ids) < batch_size:
+            projects, tasks = archive_batch([project_id], using)
+            return projects, moved + tasks
+
+
+def recover_moved_tasks(project):
+    """
+    Move back the tasks an unfinished archive_large_project() took out of
+    `project`, e.g. when it is reopened part way. Returns the number of
+    tasks moved back.
+    """
+    using = write_db(project)
+    moved = ArchivedTask.objects.using(using).filter(project_id=project.id)
+    if not moved.exists():
+        return 0
+    with transaction.atomic(using=using):
+        recovered = _copy_rows(moved, Task)
+        _delete_rows(ArchivedTask, 'project_id', [project.id], using)
+    return recovered
+
+
+def archive_projects(days=None, batch_size=ARCHIVE_BATCH_SIZE):
+    """
+    Archive every eligible project, shard by shard, with about
+    `batch_size` tasks per transaction: projects are taken in id order
+    and grouped until their tasks would pass `batch_size`, and a project
+    with more tasks than that is moved by archive_large_project(). Yields
+    (projects moved, tasks moved) per batch so callers can report
+    progress.
+    """
+    for using in shard_aliases():
+        last_id = 0
+        while True:
+            # Task counts of the next candidates, one grouped index scan
+            candidates = list(
+                archivable_projects(days, using).filter(id__gt=last_id)
+                .order_by('id').annotate(task_count=Count('tasks'))
+                .values_list('id', 'task_count')[:batch_size])
+            if not candidates:
+                break
+            project_id, task_count = candidates[0]
+            if task_count > batch_size:
+                last_id = project_id
+                yield archive_large_project(project_id, using, batch_size)
+                continue
+            batch = []
+            total = 0
+            for project_id, task_count in candidates:
+                if total + task_count > batch_size:
+                    break
+                batch.append(project_id)
+                total += task_count
+            last_id = batch[-1]
+            yield archive_batch(batch, using)
+
+
+def restore_project(archived):
+    """
+    Move an archived project, its tasks and its recurring task rules back
+    into the live tables of the same shard, keeping their ids. Returns
+    the restored Project.
+    """
+    using = write_db(archived)
+    archived_project = ArchivedProject.objects.using(using).filter(
+        id=archived.id)
+    archived_rules = ArchivedTaskRecurrence.objects.using(using).filter(
+        project_id=archived.id)
+    archived_tasks = ArchivedTask.objects.using(using).filter(
+        project_id=archived.id)
+    with transaction.atomic(using=using):
+        _copy_rows(archived_project, Project)
+        _copy_rows(archived_rules, TaskRecurrence)
+        _copy_rows(archived_tasks, Task)
+        _delete_rows(ArchivedTask, 'project_id', [archived.id], using)
+        _delete_rows(ArchivedTaskRecurrence, 'project_id', [archived.id],
+                     using)
+        _delete_rows(ArchivedProject, 'id', [archived.id], using)
+
+        # Sync clients get the project and its tasks back as new changes
+        Project.objects.using(using).filter(
+            id=archived.id).update_changed(archived.owner_id)
+        Task.objects.using(using).filter(
+            project_id=archived.id).update_changed(archived.owner_id)
+    return Project.objects.using(using).get(id=archived.id)
@@ -0,0 +1,120 @@
+"""
+Async versions of the read-only project pages, served instead of the sync
+views when settings.ASYNC_VIEWS is on (the default under asgi.py).
+
+While a view waits on the database or on a slow client, the event loop
+serves other requests instead of holding a whole worker. Everything a
+template shows is loaded with the async ORM (aget/afirst/aiterator)
+before rendering, so templates never query the database themselves.
+"""
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import Http404, StreamingHttpResponse
+from django.shortcuts import redirect, render
+
+from core.decorators import async_login_required, async_never_cache
+from .events import event_stream
+from .models import ArchivedProject, Project, description_excerpt
+from .sharding import ashard_for_user
+from .streaming import astream_page, STREAM_CHUNK_SIZE
+from .views import DETAIL_EXCERPT_LENGTH
+
+
+@async_login_required
+@async_never_cache
+async def project_list(request):
+    status_filter = request.GET.get("status", "all")
+    await ashard_for_user(request.user)
+
+    # Same single query as the sync view, read without blocking
+    projects = Project.objects.for_user(request.user).for_list()
+    if status_filter in ["open", "closed"]:
+        projects = projects.filter(status=status_filter)
+
+    context = {
+        "projects": [project async for project in projects],
+        "status_filter": status_filter,
+        "error_project_id": request.GET.get("error_project_id"),
+        "error_message": request.GET.get("error_message"),
+    }
+    return render(request, "projects/project_list.html", context)
+
+
+@async_login_required
+@async_never_cache
+async def project_detail(request, project_id):
+    await ashard_for_user(request.user)
+    project = await Project.objects.for_user(request.user).filter(
+        id=project_id).defer('description').annotate(
+        description_excerpt=description_excerpt(DETAIL_EXCERPT_LENGTH)
+    ).afirst()
+    if project is None:
+        # Archived projects keep their id; show the read-only copy
+        if not await ArchivedProject.objects.for_user(request.user).filter(
+                id=project_id).aexists():
+            raise Http404("No Project matches the given query.")
+        return redirect("archived_project_detail", project_id=project_id)
+    status_filter = request.GET.get('status', 'all')
+    error_task_id = request.GET.get('error_task_id')
+
+    # Bring overdue/outstanding up to date in bulk, then count once
+    await sync_to_async(project.tasks.refresh_statuses)()
+    await project.aupdate_task_counts()
+
+    tasks = project.tasks.for_cards()
+    statuses = ('completed', 'outstanding', 'overdue')
+    if status_filter in statuses:
+        tasks = tasks.filter(status=status_filter)
+    else:
+        tasks = tasks.order_by('start_date')
+
+    # Extra task stats for UI display (counts within the current filter)
+    counts = {
+        status: (getattr(project, f'{status}_count')
+                 if status_filter not in statuses or status == status_filter
+                 else 0)
+        for status in statuses
+    }
+    shown = sum(counts.values())
+
+    context = {
+        'project': project,
+        'has_tasks': shown > 0,
+        'status_filter': status_filter,
+        'completed_count': counts['completed'],
+        'outstanding_count': counts['outstanding'],
+        'overdue_count': counts['overdue'],
+        'error_task_id': error_task_id,
+    }
+
+    # Large projects stream their task cards straight from aiterator()
+    threshold = settings.PROJECT_DETAIL_STREAM_THRESHOLD
+    if threshold and shown > threshold:
+        return astream_page(
+            request, 'projects/project_detail.html', context,
+            'tasks/partials/task_card.html',
+            tasks.aiterator(chunk_size=STREAM_CHUNK_SIZE), 'task',
+            row_context={'error_task_id': error_task_id})
+
+    context['tasks'] = [task async for task in tasks]
+    return render(request, 'projects/project_detail.html', context)
+
+
+@async_login_required
+@async_never_cache
+async def project_events(request, project_id):
+    """
+    Server-Sent Events stream of changes to one project, for an open
+    project_detail page (see projects/events.py). Only served under ASGI,
+    where an idle stream is a waiting coroutine rather than a worker.
+    """
+    await ashard_for_user(request.user)
+    if not await Project.objects.for_user(request.user).filter(
+            id=project_id).aexists():
+        raise Http404("No Project matches the given query.")
+
+    response = StreamingHttpResponse(
+        event_stream(project_id), content_type="text/event-stream")
+    # Don't let nginx and friends hold events back in a buffer
+    response["X-Accel-Buffering"] = "no"
+    return response
@@ -0,0 +1,156 @@
+"""
+Change feed for sync clients.
+
+Every write to a Project or Task stamps the row with its owner's next
+change number (change_seq) and updated_at; deletions leave a Tombstone
+numbered the same way. A client keeps the cursor of the last change it
+has seen and asks for everything after it (see changes_since), so a sync
+reads only what changed.
+
+The numbers come from the owner's ChangeCounter row, bumped inside the
+transaction that makes the change. The row stays locked until that
+transaction commits, so one owner's changes always commit in number order
+and a cursor can never skip past a change that is still in flight.
+
+Model.save() does this itself, and QuerySet.update_changed() stamps bulk
+updates. Rows inserted with bulk_create() are not stamped: callers set
+change_seq from next_change_seq() (see cloning and recurrence.materialize),
+or stamp them afterwards with update_changed() (archive.restore_project).
+
+Tombstones are written by record_deletions(), called from:
+- Task.delete() and TaskQuerySet.delete_changed(), for deleted tasks;
+- purge.mark_deleted(), when a project is deleted (its tasks go without
+  tombstones of their own when it is purged later);
+- archive.archive_batch(), for projects moved to the archive.
+"""
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+# Changes returned per page by default, and at most
+DEFAULT_PAGE_SIZE = 500
+MAX_PAGE_SIZE = 1000
+
+# Order of the three kinds of change within one change number
+PROJECT, TASK, DELETION = 0, 1, 2
+
+# Cursor parts must fit a 64-bit integer column to be queried
+MAX_CURSOR_VALUE = 2 ** 63 - 1
+
+PROJECT_FIELDS = ('id', 'name', 'description', 'status', 'start_date',
+                  'end_date', 'closed_at', 'updated_at', 'change_seq')
+TASK_FIELDS = ('id', 'project_id', 'name', 'description', 'status',
+               'start_date', 'end_date', 'completed_at', 'rank',
+               'updated_at', 'change_seq')
+DELETION_FIELDS = ('id', 'kind', 'object_id', 'project_id', 'deleted_at',
+                   'change_seq')
+
+
+class InvalidCursor(ValueError):
+    """The cursor passed to changes_since wasn't issued by it."""
+
+
+def next_change_seq(owner_id, using):
+    """
+    The next change number of `owner_id`'s data on `using`. Must run in
+    the transaction making the change (see the module docstring).
+    """
+    from .models import ChangeCounter
+
+    counters = ChangeCounter.objects.using(using).filter(owner_id=owner_id)
+    if not counters.update(last_seq=F('last_seq') + 1):
+        try:
+            with transaction.atomic(using=using):
+                ChangeCounter.objects.using(using).create(
+                    owner_id=owner_id, last_seq=1)
+            return 1
+        except IntegrityError:
+            # Another request created the counter first
+            counters.update(last_seq=F('last_seq') + 1)
+    return counters.values_list('last_seq', flat=True).get()
+
+
+def next_change(owner_id, using):
+    """Fields stamping one change by `owner_id`, for QuerySet.update()."""
+    return {'change_seq': next_change_seq(owner_id, using),
+            'updated_at': timezone.now()}
+
+
+def record_deletions(owner_id, using, kind, objects):
+    """
+    Leave tombstones for deleted `objects` (Project or Task instances, or
+    (id, project_id) pairs) so sync clients drop them too.
+    """
+    from .models import Tombstone
+
+    seq = next_change_seq(owner_id, using)
+    Tombstone.objects.using(using).bulk_create([
+        Tombstone(owner_id=owner_id, kind=kind, object_id=object_id,
+                  project_id=project_id, change_seq=seq)
+        for object_id, project_id in (
+            (obj.pk, getattr(obj, 'project_id', None))
+            if hasattr(obj, 'pk') else obj
+            for obj in objects)
+    ])
+
+
+def parse_cursor(cursor):
+    """(change_seq, kind, id) from a cursor string; None starts afresh."""
+    if not cursor:
+        return (-1, PROJECT, 0)
+    try:
+        seq, kind, pk = (int(part) for part in cursor.split('.'))
+    except ValueError:
+        raise InvalidCursor(cursor)
+    if not (-1 <= seq <= MAX_CURSOR_VALUE
+            and kind in (PROJECT, TASK, DELETION)
+            and 0 <= pk <= MAX_CURSOR_VALUE):
+        raise InvalidCursor(cursor)
+    return seq, kind, pk
+
+
+def _after(queryset, kind, cursor):
+    """Rows of `queryset` (of one kind) that come after `cursor`."""
+    seq, cursor_kind, pk = cursor
+    if kind < cursor_kind:
+        return queryset.filter(change_seq__gt=seq)
+    if kind > cursor_kind:
+        return queryset.filter(change_seq__gte=seq)
+    # A range on the (owner/project, change_seq, id) index either way
+    return queryset.filter(change_seq__gte=seq).exclude(
+        change_seq=seq, id__lte=pk)
+
+
+def changes_since(user, cursor=None, limit=DEFAULT_PAGE_SIZE):
+    """
+    One page of `user`'s changes after `cursor`: new and changed projects
+    and tasks (current values) and deletions, in change order. Each kind
+    is one index range scan of at most `limit` + 1 rows.
+    """
+    from .models import Project, Tombstone
+    from tasks.models import Task
+
+    position = parse_cursor(cursor)
+    sources = [
+        (PROJECT, 'projects', Project.objects.for_user(user),
+         PROJECT_FIELDS),
+        (TASK, 'tasks', Task.objects.for_user(user).select_related(None),
+         TASK_FIELDS),
+        (DELETION, 'deleted', Tombstone.objects.for_user(user),
+         DELETION_FIELDS),
+    ]
+    rows = []
+    for kind, key, queryset, fields in sources:
+        rows.extend(
+            (row['change_seq'], kind, row['id'], key, row)
+            for row in _after(queryset, kind, position)
+            .order_by('change_seq', 'id').values(*fields)[:limit + 1])
+    rows.sort(key=lambda row: row[:3])
+
+    page = {'projects': [], 'tasks': [], 'deleted': []}
+    for seq, kind, pk, key, row in rows[:limit]:
+        page[key].append(row)
+        position = (seq, kind, pk)
+    page['cursor'] = '.'.join(str(part) for part in position)
+    page['has_more'] = len(rows) > limit
+    return page
@@ -0,0 +1,142 @@
+"""
+Copying project structures: cloning a project, saving one as a
+ProjectTemplate and starting a project from a template.
+
+Tasks are read and written in batches of CLONE_BATCH_SIZE: one keyset
+SELECT and one bulk INSERT per batch, never a save() per task. Dates are
+laid out from the new start date and every copied task starts afresh
+(outstanding, or overdue if its new end date has passed).
+"""
+from datetime import timedelta
+
+from django.db import transaction
+from django.utils import timezone
+
+from .changes import next_change_seq
+from .models import Project, ProjectTemplate
+from .sharding import write_db
+from tasks.models import Task, TaskDailyRollup, TaskTemplate
+
+# Tasks read and inserted per statement
+CLONE_BATCH_SIZE = 1000
+
+# Task columns carried over by a copy
+TASK_FIELDS = ('name', 'description', 'start_date', 'end_date', 'rank')
+TASK_TEMPLATE_FIELDS = ('name', 'description', 'start_offset', 'end_offset',
+                        'rank')
+
+
+def _batches(queryset, fields, batch_size=CLONE_BATCH_SIZE):
+    """Rows of `queryset` as value tuples, one keyset page at a time."""
+    last_id = 0
+    while True:
+        rows = list(queryset.filter(id__gt=last_id).order_by('id')
+                    .values_list('id', *fields)[:batch_size])
+        if not rows:
+            return
+        last_id = rows[-1][0]
+        yield [row[1:] for row in rows]
+
+
+def _offset(day, start):
+    return (day - start).days if day else None
+
+
+def _on(start, offset):
+    return start + timedelta(days=offset) if offset is not None else None
+
+
+def _new_project(owner_id, name, description, start_date, duration_days):
+    project = Project(
+        owner_id=owner_id, name=name, description=description,
+        status='open', start_date=start_date,
+        end_date=start_date + timedelta(days=duration_days))
+    project.save()
+    return project
+
+
+def _insert_tasks(project, batches):
+    """
+    bulk_create the tasks of a new `project` from batches of
+    (name, description, start_date, end_date, rank). Bulk inserts skip
+    save(), so the rows are stamped for sync clients here, as one change.
+    Returns the number of tasks created.
+    """
+    using = project._state.db
+    change_seq = next_change_seq(project.owner_id, using)
+    today = timezone.now().date()
+    created = 0
+    for batch in batches:
+        tasks = []
+        for name, description, start_date, end_date, rank in batch:
+            # project_id rather than project: skips the relation
+            # descriptor, which is a measurable share of a 10k-task copy
+            task = Task(project_id=project.id, name=name,
+                        description=description, start_date=start_date,
+                        end_date=end_date, rank=rank, change_seq=change_seq)
+            task.status = task.open_status(today)
+            tasks.append(task)
+        Task.objects.using(using).bulk_create(tasks)
+        created += len(tasks)
+    if created:
+        TaskDailyRollup.refresh_snapshot(project)
+    return created
+
+
+def clone_project(project, name, start_date):
+    """
+    Copy `project` and all of its tasks into a new open project starting
+    on `start_date`, moving every date by the same amount. Returns the
+    new Project.
+    """
+    shift = start_date - project.start_date
+    with transaction.atomic(using=write_db(project)):
+        clone = _new_project(
+            project.owner_id, name, project.description, start_date,
+            (project.end_date - project.start_date).days)
+        _insert_tasks(clone, (
+            [(task_name, description,
+              start and start + shift, end and end + shift, rank)
+             for task_name, description, start, end, rank in batch]
+            for batch in _batches(project.tasks.all(), TASK_FIELDS)))
+    return clone
+
+
+def save_as_template(project, name):
+    """
+    Save the structure of `project` (its description, length and tasks,
+    with dates relative to its start) as a ProjectTemplate.
+    """
+    start = project.start_date
+    using = write_db(project)
+    with transaction.atomic(using=using):
+        template = ProjectTemplate(
+            owner_id=project.owner_id, name=name,
+            description=project.description,
+            duration_days=max((project.end_date - start).days, 0))
+        template.save(using=using)
+        for batch in _batches(project.tasks.all(), TASK_FIELDS):
+            TaskTemplate.objects.using(using).bulk_create([
+                TaskTemplate(template=template, name=task_name,
+                             description=description,
+                             start_offset=_offset(start_date, start),
+                             end_offset=_offset(end_date, start), rank=rank)
+                for task_name, description, start_date, end_date, rank
+                in batch])
+    return template
+
+
+def create_from_template(template, name, start_date):
+    """Start a new open project from `template` on `start_date`."""
+    with transaction.atomic(using=write_db(template)):
+        project = _new_project(
+            template.owner_id, name, template.description, start_date,
+            template.duration_days)
+        _insert_tasks(project, (
+            [(task_name, description, _on(start_date, start_offset),
+              _on(start_date, end_offset), rank)
+             for task_name, description, start_offset, end_offset, rank
+             in batch]
+            for batch in _batches(template.tasks.all(),
+                                  TASK_TEMPLATE_FIELDS)))
+    return project
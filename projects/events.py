@@ -0,0 +1,247 @@
+"""
+Live updates for open project pages, sent as Server-Sent Events.
+
+The write paths in projects.views and tasks.views call publish() with what
+changed (task created/updated/toggled/deleted, project updated/closed/
+reopened/deleted). Once the transaction commits, the broker hands the
+event to every project_events stream open on that project; the page then
+fetches just the affected card (see fragments.js).
+
+- LocalBroker (the default) fans out in-process: it reaches the pages
+  streamed by the same ASGI process.
+- PostgresBroker sends each event through NOTIFY, and every process
+  LISTENs on one connection, so pages served by any process (and changes
+  made by the background worker) are covered.
+
+An open stream is an asyncio.Queue waiting on the event loop: no thread,
+no database connection and no polling while nothing changes.
+"""
+import asyncio
+import json
+import threading
+from collections import defaultdict
+from functools import lru_cache
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.utils.module_loading import import_string
+
+from .sharding import write_db
+
+# Events buffered per stream before a slow client is told to reload
+QUEUE_SIZE = 100
+
+# Milliseconds the browser waits before reconnecting a dropped stream
+RECONNECT_DELAY = 3000
+
+# Sent in place of the events a slow or disconnected stream missed
+RESYNC = {"type": "resync"}
+
+
+class Subscription:
+    """One open stream: a queue on the event loop serving it."""
+    __slots__ = ("project_id", "loop", "queue")
+
+    def __init__(self, project_id, loop):
+        self.project_id = project_id
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+
+    def put(self, event):
+        # Runs on self.loop. A stream this far behind reloads instead of
+        # replaying everything it missed.
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(RESYNC)
+
+    async def get(self):
+        return await self.queue.get()
+
+
+class LocalBroker:
+    """In-process fan-out from publish() to the streams of this process."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscriptions = defaultdict(set)
+
+    def subscribe(self, project_id):
+        """Start receiving a project's events (call from the event loop)."""
+        subscription = Subscription(project_id, asyncio.get_running_loop())
+        with self._lock:
+            self._subscriptions[project_id].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            streams = self._subscriptions.get(subscription.project_id)
+            if streams is not None:
+                streams.discard(subscription)
+                if not streams:
+                    del self._subscriptions[subscription.project_id]
+
+    def has_listeners(self, project_id):
+        """False when publishing to `project_id` would reach nobody."""
+        return project_id in self._subscriptions
+
+    def publish(self, project_id, event):
+        self.deliver(project_id, event)
+
+    def deliver(self, project_id, event):
+        """Queue `event` on each stream of `project_id` (from any thread)."""
+        with self._lock:
+            streams = list(self._subscriptions.get(project_id, ()))
+        for subscription in streams:
+            try:
+                subscription.loop.call_soon_threadsafe(
+                    subscription.put, event)
+            except RuntimeError:
+                # The stream's event loop has shut down
+                self.unsubscribe(subscription)
+
+    def resync_all(self):
+        """Tell every stream it may have missed events."""
+        with self._lock:
+            project_ids = list(self._subscriptions)
+        for project_id in project_ids:
+            self.deliver(project_id, RESYNC)
+
+
+class PostgresBroker(LocalBroker):
+    """
+    Fan-out across processes with PostgreSQL LISTEN/NOTIFY on `default`.
+    Each process keeps one listening connection, opened with the first
+    stream, and passes what it hears to its own streams.
+    """
+    channel = "project_events"
+
+    # Seconds between attempts to re-open a lost listening connection
+    reconnect_delay = 5
+
+    def __init__(self):
+        super().__init__()
+        if connections[DEFAULT_DB_ALIAS].vendor != "postgresql":
+            raise ImproperlyConfigured(
+                "PostgresBroker needs a PostgreSQL default database.")
+        self._listener = None
+
+    def subscribe(self, project_id):
+        subscription = super().subscribe(project_id)
+        if self._listener is None or self._listener.done():
+            self._listener = subscription.loop.create_task(self._listen())
+        return subscription
+
+    def has_listeners(self, project_id):
+        # Other processes may be streaming the project
+        return True
+
+    def publish(self, project_id, event):
+        payload = json.dumps({"project_id": project_id, "event": event})
+        with connections[DEFAULT_DB_ALIAS].cursor() as cursor:
+            cursor.execute("SELECT pg_notify(%s, %s)",
+                           [self.channel, payload])
+
+    def _listen_params(self):
+        settings_dict = connections[DEFAULT_DB_ALIAS].settings_dict
+        params = {
+            "dbname": settings_dict["NAME"],
+            "user": settings_dict["USER"],
+            "password": settings_dict["PASSWORD"],
+            "host": settings_dict["HOST"],
+            "port": settings_dict["PORT"],
+        }
+        return {name: value for name, value in params.items() if value}
+
+    async def _listen(self):
+        import psycopg
+
+        reconnecting = False
+        while True:
+            try:
+                async with await psycopg.AsyncConnection.connect(
+                        **self._listen_params(), autocommit=True) as conn:
+                    await conn.execute(f"LISTEN {self.channel}")
+                    if reconnecting:
+                        # Events sent while the connection was down are lost
+                        self.resync_all()
+                    async for notify in conn.notifies():
+                        message = json.loads(notify.payload)
+                        self.deliver(message["project_id"], message["event"])
+            except (OSError, psycopg.Error):
+                reconnecting = True
+                await asyncio.sleep(self.reconnect_delay)
+
+
+@lru_cache(maxsize=None)
+def _load_broker(path):
+    return import_string(path)()
+
+
+def get_broker():
+    """The broker named by settings.PROJECT_EVENTS_BROKER (one per process)."""
+    return _load_broker(settings.PROJECT_EVENTS_BROKER)
+
+
+def publish(project, event_type, **data):
+    """
+    Send an event about `project` to its open pages once the current
+    transaction commits. Task events also carry the project's task counts;
+    nothing is queried while nobody is listening.
+    """
+    from tasks.models import Task
+
+    project_id = project.pk
+    # Where the change was just written, not a lagging replica
+    using = write_db(project)
+
+    def send():
+        broker = get_broker()
+        if not broker.has_listeners(project_id):
+            return
+        event = {"type": event_type, "project_id": project_id, **data}
+        if event_type.startswith("task."):
+            event["counts"] = Task.objects.using(using).filter(
+                project_id=project_id).aggregate(**project.TASK_COUNTS)
+        broker.publish(project_id, event)
+
+    transaction.on_commit(send, using=using)
+
+
+def _release_connections():
+    # An idle stream shouldn't keep the database connection its request
+    # opened; one inside a transaction is left to its owner
+    for conn in connections.all(initialized_only=True):
+        if not conn.in_atomic_block:
+            conn.close()
+
+
+def format_event(event):
+    return f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+
+
+async def event_stream(project_id):
+    """
+    The body of a project_events response. A comment line goes out every
+    PROJECT_EVENTS_KEEPALIVE seconds: it keeps proxies from timing the
+    stream out and lets the server notice clients that have gone away.
+    """
+    broker = get_broker()
+    subscription = broker.subscribe(project_id)
+    try:
+        await sync_to_async(_release_connections)()
+        yield f"retry: {RECONNECT_DELAY}\n\n"
+        while True:
+            try:
+                event = await asyncio.wait_for(
+                    subscription.get(), settings.PROJECT_EVENTS_KEEPALIVE)
+            except asyncio.TimeoutError:
+                yield ": keepalive\n\n"
+                continue
+            yield format_event(event)
+    finally:
+        broker.unsubscribe(subscription)
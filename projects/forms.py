@@ -1,4 +1,7 @@
+from datetime import timedelta
+
 from django import forms
+from django.utils import timezone
 from .models import Project
 
 # Form to create or update Project instances
@@ -17,3 +20,52 @@ class ProjectForm(forms.ModelForm):
             'end_date': forms.DateInput(attrs={'type': 'date'}),
             'description': forms.Textarea(attrs={'rows': 3}),
         }
+
+
+# Form to move a whole project schedule by a number of days
+
+class RescheduleForm(forms.Form):
+    # About ten years either way
+    MAX_DAYS = 3650
+
+    days = forms.IntegerField(
+        min_value=-MAX_DAYS, max_value=MAX_DAYS,
+        help_text="Days to move the project and its tasks by "
+                  "(negative to bring them forward).",
+        widget=forms.NumberInput(attrs={'class': 'form-control'}))
+
+    def clean_days(self):
+        days = self.cleaned_data['days']
+        if days == 0:
+            raise forms.ValidationError("Enter a number of days other than 0.")
+        return days
+
+
+# Form to copy a project, or start one from a saved template
+
+class CopyProjectForm(forms.Form):
+    name = forms.CharField(
+        max_length=200,
+        widget=forms.TextInput(attrs={'class': 'form-control'}))
+    start_date = forms.DateField(
+        help_text="Task dates are moved to match the new start date.",
+        widget=forms.DateInput(attrs={'type': 'date'}))
+
+    def clean_start_date(self):
+        # Within RescheduleForm's range of today, so the moved dates stay
+        # well inside what a date can hold
+        start_date = self.cleaned_data['start_date']
+        limit = timedelta(days=RescheduleForm.MAX_DAYS)
+        today = timezone.now().date()
+        if not today - limit <= start_date <= today + limit:
+            raise forms.ValidationError(
+                "Enter a start date within ten years of today.")
+        return start_date
+
+
+# Form to save a project's structure as a reusable template
+
+class ProjectTemplateForm(forms.Form):
+    name = forms.CharField(
+        max_length=200,
+        widget=forms.TextInput(attrs={'class': 'form-control'}))
@@ -0,0 +1,45 @@
+from django.conf import settings
+
+from jobs.registry import job
+from .archive import ARCHIVE_BATCH_SIZE, archive_projects
+from .lifecycle import close_project, reopen_project, get_live_project
+from .purge import purge_project
+from .sharding import shard_for_user
+
+
+@job('projects.close')
+def close(project_id, owner_id=None):
+    project = get_live_project(project_id, owner_id)
+    if project is None or project.status == 'closed':
+        return {'skipped': True}
+    close_project(project)
+    return {'tasks': len(project.previous_task_statuses or {})}
+
+
+@job('projects.reopen')
+def reopen(project_id, owner_id=None):
+    project = get_live_project(project_id, owner_id)
+    if project is None or project.status == 'open':
+        return {'skipped': True}
+    reopen_project(project)
+    return {'tasks': project.tasks.count()}
+
+
+@job('projects.purge', max_attempts=10)
+def purge(project_id, owner_id=None):
+    # Resumable: each chunk commits, so a retry continues where it stopped
+    using = shard_for_user(owner_id) if owner_id is not None else None
+    removed = 0
+    for removed in purge_project(project_id, using=using):
+        pass
+    return {'tasks_removed': removed}
+
+
+@job('projects.archive')
+def archive(days=None, batch_size=ARCHIVE_BATCH_SIZE):
+    days = settings.ARCHIVE_AFTER_DAYS if days is None else days
+    moved = [0, 0]
+    for projects, tasks in archive_projects(days, batch_size):
+        moved[0] += projects
+        moved[1] += tasks
+    return {'projects': moved[0], 'tasks': moved[1]}
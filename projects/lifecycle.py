@@ -0,0 +1,140 @@
+from collections import Counter, defaultdict
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import DateField, ExpressionWrapper, F, Max, Min
+from django.utils import timezone
+
+from .events import publish
+from .models import Project
+from .sharding import shard_for_user, write_db
+from tasks.models import TaskDailyRollup
+
+# Maximum number of task ids per UPDATE ... WHERE id IN (...) statement
+UPDATE_BATCH_SIZE = 500
+
+
+def close_project(project):
+    """
+    Close a project and mark all of its tasks completed, remembering each
+    task's status so reopen_project can put it back.
+    """
+    # One transaction on the shard holding the project
+    with transaction.atomic(using=write_db(project)):
+        _close_project(project)
+        publish(project, "project.closed")
+
+
+def _close_project(project):
+    # Store current task statuses before marking all complete
+    task_statuses = {
+        str(task_id): status
+        for task_id, status in project.tasks.values_list("id", "status")}
+    project.previous_task_statuses = task_statuses
+    project.status = "closed"
+    project.save()
+
+    # Mark all tasks as completed
+    completed_at = timezone.now()
+    newly_completed = project.tasks.exclude(
+        status="completed").update_changed(
+        project.owner_id, status="completed", completed_at=completed_at)
+    TaskDailyRollup.record_completions(project, newly_completed, completed_at)
+    TaskDailyRollup.refresh_snapshot(project)
+
+
+def reopen_project(project):
+    """Reopen a project and restore the task statuses saved on close."""
+    with transaction.atomic(using=write_db(project)):
+        _reopen_project(project)
+        publish(project, "project.reopened")
+
+
+def _reopen_project(project):
+    project.status = "open"
+    project.save()
+    prev_statuses = project.previous_task_statuses or {}
+
+    # Group task ids by the status they go back to, and count the
+    # completions being undone per day for the rollups
+    restored = defaultdict(list)
+    reopened_per_day = Counter()
+    for task_id, completed_at in project.tasks.values_list(
+            "id", "completed_at"):
+        status = prev_statuses.get(str(task_id), "outstanding")
+        restored[status].append(task_id)
+        if status != "completed" and completed_at:
+            reopened_per_day[TaskDailyRollup.day_of(completed_at)] += 1
+
+    # One UPDATE per status (in batches) instead of one save per task
+    for status, task_ids in restored.items():
+        fields = {"status": status}
+        if status != "completed":
+            fields["completed_at"] = None
+        for start in range(0, len(task_ids), UPDATE_BATCH_SIZE):
+            project.tasks.filter(
+                id__in=task_ids[start:start + UPDATE_BATCH_SIZE]
+            ).update_changed(project.owner_id, **fields)
+
+    for day, count in reopened_per_day.items():
+        TaskDailyRollup.record_completions(project, -count, day)
+    TaskDailyRollup.refresh_snapshot(project)
+
+
+def _shifted(field, delta):
+    # `field` moved by `delta`, computed by the database (NULL stays NULL)
+    return ExpressionWrapper(F(field) + delta, output_field=DateField())
+
+
+def _check_shift(project, delta):
+    """
+    Raise OverflowError if moving the project and its tasks by `delta`
+    would take a date outside the calendar (year 1 to 9999): the UPDATE
+    would fail in the database instead.
+    """
+    fields = ("start_date", "end_date", "earliest_start", "latest_start")
+    limit = Min if delta < timedelta(0) else Max
+    bounds = project.tasks.aggregate(
+        *[limit(field) for field in fields]).values()
+    for value in (project.start_date, project.end_date, *bounds):
+        if value is not None:
+            value + delta
+
+
+def reschedule_project(project, days):
+    """
+    Move a project and every one of its tasks `days` days later (earlier
+    when negative): one UPDATE for the project and one for its tasks,
+    then a bulk status refresh, since tasks may have become overdue or
+    stopped being so. Returns the number of tasks moved; raises
+    OverflowError, changing nothing, if a date would leave the calendar.
+    """
+    delta = timedelta(days=days)
+    dates = {"start_date": _shifted("start_date", delta),
+             "end_date": _shifted("end_date", delta)}
+    using = write_db(project)
+    with transaction.atomic(using=using):
+        _check_shift(project, delta)
+        Project.objects.using(using).filter(
+            pk=project.pk).update_changed(project.owner_id, **dates)
+        # The critical-path figures move with the dates; slack is unchanged
+        moved = project.tasks.update_changed(
+            project.owner_id, **dates,
+            earliest_start=_shifted("earliest_start", delta),
+            latest_start=_shifted("latest_start", delta))
+        project.tasks.refresh_statuses()
+        TaskDailyRollup.refresh_snapshot(project)
+        publish(project, "project.updated")
+    project.refresh_from_db(fields=["start_date", "end_date"])
+    return moved
+
+
+def get_live_project(project_id, owner_id=None):
+    """
+    The project if it still exists and isn't being deleted, else None.
+    Pass the owner's id to look on their shard.
+    """
+    projects = Project.objects
+    if owner_id is not None:
+        projects = projects.using(shard_for_user(owner_id))
+    return projects.filter(id=project_id).first()
@@ -0,0 +1,35 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from projects.archive import ARCHIVE_BATCH_SIZE, archive_projects
+
+
+class Command(BaseCommand):
+    help = (
+        "Move closed projects (and their tasks) that were closed more than "
+        "N days ago into the archive tables, about --batch-size tasks per "
+        "transaction."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days', type=int, default=settings.ARCHIVE_AFTER_DAYS,
+            help='Archive projects closed more than this many days ago '
+                 f'(default: {settings.ARCHIVE_AFTER_DAYS}).')
+        parser.add_argument(
+            '--batch-size', type=int, default=ARCHIVE_BATCH_SIZE,
+            help='Tasks moved per transaction; larger projects are moved '
+                 f'in several (default: {ARCHIVE_BATCH_SIZE}).')
+
+    def handle(self, *args, **options):
+        total_projects = total_tasks = 0
+        for projects, tasks in archive_projects(
+                days=options['days'], batch_size=options['batch_size']):
+            total_projects += projects
+            total_tasks += tasks
+            self.stdout.write(
+                f"Archived {projects} projects / {tasks} tasks")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Done: {total_projects} projects and {total_tasks} tasks "
+            f"archived."))
@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand
+
+from projects.purge import pending_purges, purge_project, PURGE_CHUNK_SIZE
+from tasks.models import Task
+
+
+class Command(BaseCommand):
+    help = (
+        "Remove projects marked as deleted, deleting their tasks in chunks. "
+        "Safe to interrupt: re-running resumes where it stopped."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size', type=int, default=PURGE_CHUNK_SIZE,
+            help=f'Tasks deleted per statement (default: {PURGE_CHUNK_SIZE}).')
+        parser.add_argument(
+            '--status', action='store_true',
+            help='Only report the progress of pending purges.')
+
+    def handle(self, *args, **options):
+        projects = pending_purges()
+        if not projects:
+            self.stdout.write("No deleted projects waiting to be purged.")
+            return
+
+        for project in projects:
+            if options['status']:
+                remaining = Task.objects.using(project._state.db).filter(
+                    project_id=project.id).count()
+                self.stdout.write(
+                    f"Project {project.id} '{project.name}': "
+                    f"{project.purged_task_count} tasks removed, "
+                    f"{remaining} remaining "
+                    f"(deleted {project.deleted_at:%Y-%m-%d %H:%M}).")
+                continue
+
+            removed = project.purged_task_count
+            for removed in purge_project(project.id, options['chunk_size'],
+                                         using=project._state.db):
+                self.stdout.write(
+                    f"Project {project.id}: {removed} tasks removed")
+            self.stdout.write(self.style.SUCCESS(
+                f"Purged project {project.id} '{project.name}' "
+                f"({removed} tasks)."))
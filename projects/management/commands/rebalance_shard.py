@@ -0,0 +1,51 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from projects.sharding import MOVE_BATCH_SIZE, move_user, shard_aliases
+from projects.models import ShardAssignment
+
+
+class Command(BaseCommand):
+    help = (
+        "Move a user's projects, tasks, rollups and archived projects to "
+        "another shard. Other users are unaffected; the user being moved "
+        "gets a 503 asking them to retry until the copy finishes."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'user', help='Username or id of the user to move.')
+        parser.add_argument(
+            '--to', required=True, choices=shard_aliases(),
+            help='Shard to move the user to.')
+        parser.add_argument(
+            '--batch-size', type=int, default=MOVE_BATCH_SIZE,
+            help=f'Rows copied per INSERT (default: {MOVE_BATCH_SIZE}).')
+        parser.add_argument(
+            '--force', action='store_true',
+            help='Move even if an earlier run was interrupted mid-move.')
+
+    def handle(self, *args, **options):
+        lookup = options['user']
+        user = User.objects.filter(username=lookup).first()
+        if user is None and lookup.isdigit():
+            user = User.objects.filter(pk=lookup).first()
+        if user is None:
+            raise CommandError(f"No user '{lookup}'.")
+
+        assignment = ShardAssignment.objects.filter(user=user).first()
+        if (assignment is not None and assignment.moving
+                and not options['force']):
+            raise CommandError(
+                f"User '{user.username}' is already being moved "
+                f"(use --force if that run was interrupted).")
+
+        copied = move_user(user, options['to'], options['batch_size'])
+        if not copied:
+            self.stdout.write(
+                f"User '{user.username}' is already on {options['to']}.")
+            return
+        for model, rows in copied.items():
+            self.stdout.write(f"Copied {rows} {model} rows")
+        self.stdout.write(self.style.SUCCESS(
+            f"Moved user '{user.username}' to {options['to']}."))
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+from django.db import connections, DEFAULT_DB_ALIAS
+
+from projects.search import ensure_search_index
+
+
+class Command(BaseCommand):
+    help = (
+        "Create the project/task full-text index if it is missing and "
+        "re-index every row (SQLite FTS5). On PostgreSQL the generated "
+        "tsvector column is created by migrations and always current, so "
+        "there is nothing to do."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--database', default=DEFAULT_DB_ALIAS,
+            help='Database alias to index (default: "default").')
+
+    def handle(self, *args, **options):
+        connection = connections[options['database']]
+        ensure_search_index(connection, rebuild=True)
+        self.stdout.write(self.style.SUCCESS(
+            f"Search index rebuilt on {connection.vendor} "
+            f"({options['database']})."))
@@ -0,0 +1,61 @@
+from django.db import migrations
+
+
+# PostgreSQL: a stored generated tsvector column is recomputed by the
+# database on every write, and a GIN index serves the @@ lookups. SQLite
+# keeps its FTS5 index outside the schema (see projects.search), as its
+# triggers have to be recreated after every migrate.
+SEARCH_VECTOR_SQL = """
+ALTER TABLE {table} ADD COLUMN IF NOT EXISTS search_vector tsvector
+GENERATED ALWAYS AS (
+    setweight(to_tsvector('english', coalesce(name, '')), 'A') ||
+    setweight(to_tsvector('english', coalesce(description, '')), 'B')
+) STORED
+"""
+
+SEARCH_INDEX_SQL = """
+CREATE INDEX IF NOT EXISTS {table}_search_gin
+ON {table} USING GIN (search_vector)
+"""
+
+
+class PostgresRunSQL(migrations.RunSQL):
+    """RunSQL that leaves other database backends untouched."""
+
+    def database_forwards(self, app_label, schema_editor, from_state,
+                          to_state):
+        if schema_editor.connection.vendor == 'postgresql':
+            super().database_forwards(app_label, schema_editor, from_state,
+                                      to_state)
+
+    def database_backwards(self, app_label, schema_editor, from_state,
+                           to_state):
+        if schema_editor.connection.vendor == 'postgresql':
+            super().database_backwards(app_label, schema_editor, from_state,
+                                       to_state)
+
+
+def search_index(table):
+    # IF NOT EXISTS: databases indexed before this migration already have
+    # the column and index
+    return PostgresRunSQL(
+        sql=[SEARCH_VECTOR_SQL.format(table=table),
+             SEARCH_INDEX_SQL.format(table=table)],
+        reverse_sql=[
+            f"DROP INDEX IF EXISTS {table}_search_gin",
+            f"ALTER TABLE {table} DROP COLUMN IF EXISTS search_vector",
+        ],
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('projects', '0006_project_templates'),
+        ('tasks', '0012_archived_recurrences'),
+    ]
+
+    operations = [
+        search_index('projects_project'),
+        search_index('tasks_task'),
+    ]
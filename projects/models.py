@@ -1,5 +1,104 @@
-from django.db import models
+from django.db import models, router, transaction
+from django.db.models import Count, Q
+from django.db.models.functions import Substr
 from django.contrib.auth.models import User
+from django.utils import timezone
+
+from .changes import next_change, next_change_seq
+from .sharding import assign_ids, is_sharded, on_user_shard
+
+# Characters of a description shown on list cards
+EXCERPT_LENGTH = 100
+
+
+def description_excerpt(length=EXCERPT_LENGTH):
+    """
+    The start of `description`, cut in the database so list pages never
+    fetch the full text. One character beyond `length` is kept: templates
+    use it to tell a truncated excerpt from a short description, and
+    truncatechars renders it exactly as it would the full text.
+    """
+    return Substr('description', 1, length + 1)
+
+
+class ProjectQuerySet(models.QuerySet):
+
+    def with_task_counts(self):
+        """Annotate the task counters in the same query as the projects."""
+        return self.annotate(
+            completed_count=Count(
+                'tasks', filter=Q(tasks__status='completed')),
+            outstanding_count=Count(
+                'tasks', filter=Q(tasks__status='outstanding')),
+            overdue_count=Count('tasks', filter=Q(tasks__status='overdue')),
+            total_tasks=Count('tasks'),
+        )
+
+    def for_list(self):
+        """
+        Only what a project card shows: name, status, a description
+        excerpt and the task counters.
+        """
+        return self.only('name', 'status').annotate(
+            description_excerpt=description_excerpt()).with_task_counts()
+
+    def create(self, **kwargs):
+        if self._db is None and is_sharded():
+            # Let ShardRouter place the row by its owner or project rather
+            # than saving to the manager's (hint-less) default database
+            obj = self.model(**kwargs)
+            obj.save(force_insert=True)
+            return obj
+        return super().create(**kwargs)
+
+    def bulk_create(self, objs, *args, **kwargs):
+        # Sharded rows take their ids from the shared sequence
+        objs = list(objs)
+        assign_ids(objs)
+        return super().bulk_create(objs, *args, **kwargs)
+
+    def update_changed(self, owner_id=None, **fields):
+        """
+        update() that also stamps the rows as changed for sync clients
+        (see projects.changes): one change per owner, whose id can be
+        passed when it is already known. Returns the rows updated.
+        """
+        self._for_write = True
+        using = self.db
+        if owner_id is None:
+            owner_ids = self.order_by().values_list(
+                'owner_id', flat=True).distinct()
+        else:
+            owner_ids = [owner_id]
+        updated = 0
+        for owner_id in owner_ids:
+            with transaction.atomic(using=using, savepoint=False):
+                updated += self.filter(owner_id=owner_id).update(
+                    **fields, **next_change(owner_id, using))
+        return updated
+
+
+class ProjectManager(models.Manager.from_queryset(ProjectQuerySet)):
+    """
+    Default manager: hides projects marked for deletion while their
+    tasks are purged in the background (see purge_deleted_projects).
+    """
+
+    def get_queryset(self):
+        return super().get_queryset().filter(deleted_at__isnull=True)
+
+    def for_user(self, user):
+        # Projects visible to `user`, read from the shard holding them
+        return on_user_shard(self.get_queryset(), user).filter(
+            owner=user)
+
+
+class ArchivedProjectManager(models.Manager):
+
+    def for_user(self, user):
+        # Archived projects of `user`, on the shard holding them
+        return on_user_shard(self.get_queryset(), user).filter(
+            owner=user)
 
 
 class Project(models.Model):
@@ -15,10 +114,13 @@ class Project(models.Model):
     # Full project description
     description = models.TextField()
 
-    # Reference to the user who owns the project
+    # Reference to the user who owns the project. No database constraint:
+    # with sharding, projects live in a different database from users
     owner = models.ForeignKey(
-        # If the user is deleted, delete their projects too
-        User, on_delete=models.CASCADE, related_name='projects')
+        # If the user is deleted, delete their projects too (rows on other
+        # shards are removed by projects.sharding.delete_user_rows)
+        User, on_delete=models.CASCADE, related_name='projects',
+        db_constraint=False)
 
     # Status of the project - 'open' or 'closed'
     status = models.CharField(
@@ -31,10 +133,70 @@ class Project(models.Model):
     # JSON storage for task status snapshots
     previous_task_statuses = models.JSONField(null=True, blank=True)
 
+    # When the project was last closed; used to pick projects to archive
+    closed_at = models.DateTimeField(null=True, blank=True)
+
+    # Set when the user deletes the project; the row and its tasks are then
+    # removed in chunks by purge_deleted_projects
+    deleted_at = models.DateTimeField(null=True, blank=True)
+
+    # Number of tasks removed so far by the background purge
+    purged_task_count = models.PositiveIntegerField(default=0)
+
+    # Last change, for sync clients (see projects/changes.py)
+    updated_at = models.DateTimeField(auto_now=True)
+    change_seq = models.BigIntegerField(default=0)
+
+    # Live projects only (the default) / every row, including deleted ones
+    objects = ProjectManager()
+    all_objects = models.Manager()
+
+    class Meta:
+        indexes = [
+            # Finds closed projects old enough to be archived
+            models.Index(fields=['status', 'closed_at'],
+                         name='project_status_closed_idx'),
+            # Serves the change feed: an owner's changes after a cursor
+            models.Index(fields=['owner', 'change_seq', 'id'],
+                         name='project_owner_change_idx'),
+        ]
+
+    # Aggregates behind task_counts(): one filtered COUNT per status
+    TASK_COUNTS = {
+        "completed_count": Count("id", filter=Q(status="completed")),
+        "outstanding_count": Count("id", filter=Q(status="outstanding")),
+        "overdue_count": Count("id", filter=Q(status="overdue")),
+        "total_tasks": Count("id"),
+    }
+
     def __str__(self):
         # What to display when the project is printed
         return self.name
 
+    def save(self, *args, **kwargs):
+        # Keep closed_at in step with the status, whichever path changed it
+        reopening = self.status == 'open' and self.closed_at is not None
+        if self.status == 'closed' and self.closed_at is None:
+            self.closed_at = timezone.now()
+        elif self.status == 'open':
+            self.closed_at = None
+        if self.pk is None and is_sharded():
+            # Ids are unique across shards so rows can move between them
+            assign_ids([self])
+            kwargs['force_insert'] = True
+        if kwargs.get('update_fields') is not None:
+            kwargs['update_fields'] = {
+                *kwargs['update_fields'], 'change_seq', 'updated_at'}
+        using = kwargs.get('using') or router.db_for_write(
+            type(self), instance=self)
+        with transaction.atomic(using=using, savepoint=False):
+            self.change_seq = next_change_seq(self.owner_id, using)
+            super().save(*args, **kwargs)
+            if reopening:
+                # Tasks an unfinished archive run had moved out come back
+                from .archive import recover_moved_tasks
+                recover_moved_tasks(self)
+
     def update_task_counts(self):
         """
         Dynamically add task-related counters to this instance:
@@ -43,8 +205,164 @@ class Project(models.Model):
         - overdue_count: tasks past due
         - total_tasks: total number of tasks
         """
-        self.completed_count = self.tasks.filter(status="completed").count()
-        self.outstanding_count = self.tasks.filter(
-            status="outstanding").count()
-        self.overdue_count = self.tasks.filter(status="overdue").count()
-        self.total_tasks = self.tasks.count()
+        for name, value in self.task_counts().items():
+            setattr(self, name, value)
+
+    def task_counts(self):
+        """Task counters for this project, computed in a single query."""
+        return self.tasks.aggregate(**self.TASK_COUNTS)
+
+    async def aupdate_task_counts(self):
+        """Async version of update_task_counts (for the async views)."""
+        counts = await self.tasks.aaggregate(**self.TASK_COUNTS)
+        for name, value in counts.items():
+            setattr(self, name, value)
+
+
+class ArchivedProject(models.Model):
+    """
+    Cold storage for closed projects that have not been touched for a while.
+    Rows keep their original id so links keep working; see
+    projects/archive.py for moving projects in and out.
+    """
+    id = models.BigIntegerField(primary_key=True)
+    name = models.CharField(max_length=200)
+    description = models.TextField()
+    owner = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name='archived_projects',
+        db_constraint=False)
+    status = models.CharField(
+        max_length=10, choices=Project.STATUS_CHOICES, default='closed')
+    start_date = models.DateField()
+    end_date = models.DateField()
+    previous_task_statuses = models.JSONField(null=True, blank=True)
+    closed_at = models.DateTimeField(null=True, blank=True)
+
+    # When the project was moved into the archive
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    objects = ArchivedProjectManager()
+
+    def __str__(self):
+        return f"{self.name} (archived)"
+
+
+class ShardAssignment(models.Model):
+    """
+    Which database in settings.PROJECT_SHARDS holds a user's projects and
+    tasks (see projects/sharding.py). Lives on `default` with the users.
+    """
+    user = models.OneToOneField(
+        User, on_delete=models.CASCADE, primary_key=True,
+        related_name='shard_assignment')
+    shard = models.CharField(max_length=100)
+
+    # Set by rebalance_shard while the user's rows are being copied
+    moving = models.BooleanField(default=False)
+
+    def __str__(self):
+        return f"{self.user_id} on {self.shard}"
+
+
+class IdSequence(models.Model):
+    """
+    Next free id of a sharded table, so ids stay unique across shards.
+    Lives on `default`; see projects.sharding.allocate_ids.
+    """
+    name = models.CharField(max_length=100, primary_key=True)
+    next_id = models.BigIntegerField()
+
+    def __str__(self):
+        return f"{self.name}: {self.next_id}"
+
+
+class ChangeCounter(models.Model):
+    """
+    Last change number handed out for a user's projects and tasks (see
+    projects/changes.py). Sits on the user's shard next to their rows.
+    """
+    owner = models.OneToOneField(
+        User, on_delete=models.CASCADE, primary_key=True,
+        related_name='change_counter', db_constraint=False)
+    last_seq = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.owner_id}: change {self.last_seq}"
+
+
+class TombstoneManager(models.Manager):
+
+    def for_user(self, user):
+        # Deletions of `user`'s projects and tasks, on their shard
+        return on_user_shard(self.get_queryset(), user).filter(
+            owner=user)
+
+
+class Tombstone(models.Model):
+    """
+    Marks a deleted (or archived) project or task in the change feed, so
+    sync clients remove their copy.
+    """
+    KIND_CHOICES = [
+        ('project', 'Project'),
+        ('task', 'Task'),
+    ]
+
+    owner = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name='tombstones',
+        db_constraint=False)
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    object_id = models.BigIntegerField()
+    # The task's project, so clients can find the task without a lookup
+    project_id = models.BigIntegerField(null=True, blank=True)
+    deleted_at = models.DateTimeField(auto_now_add=True)
+    change_seq = models.BigIntegerField()
+
+    objects = TombstoneManager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['owner', 'change_seq', 'id'],
+                         name='tombstone_owner_change_idx'),
+        ]
+
+    def __str__(self):
+        return f"Deleted {self.kind} {self.object_id}"
+
+
+class ProjectTemplateManager(models.Manager):
+
+    def for_user(self, user):
+        # Saved templates of `user`, on their shard
+        return on_user_shard(self.get_queryset(), user).filter(
+            owner=user)
+
+
+class ProjectTemplate(models.Model):
+    """
+    A project structure saved for reuse: its tasks are stored as
+    TaskTemplate rows with dates relative to the project start (see
+    projects/cloning.py).
+    """
+    owner = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name='project_templates',
+        db_constraint=False)
+    name = models.CharField(max_length=200)
+    description = models.TextField(blank=True)
+
+    # Length of the project, so a new start date gives the end date
+    duration_days = models.PositiveIntegerField(default=0)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    objects = ProjectTemplateManager()
+
+    def __str__(self):
+        return f"{self.name} (template)"
+
+    def save(self, *args, **kwargs):
+        if self.pk is None and is_sharded():
+            # Ids are unique across shards so rows can move between them
+            assign_ids([self])
+            kwargs['force_insert'] = True
+        super().save(*args, **kwargs)
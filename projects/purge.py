@@ -0,0 +1,80 @@
+from django.db import connections, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .changes import record_deletions
+from .models import Project
+from .sharding import shard_aliases, write_db
+from tasks.models import Task, TaskDependency
+
+# Tasks removed per DELETE statement
+PURGE_CHUNK_SIZE = 1000
+
+
+def mark_deleted(project):
+    """
+    Hide a project from every view straight away. The rows themselves are
+    removed later by purge_deleted_projects, so the request never has to
+    load or cascade over the project's tasks.
+    """
+    using = write_db(project)
+    with transaction.atomic(using=using):
+        Project.objects.using(using).filter(pk=project.pk).update(
+            deleted_at=timezone.now())
+        record_deletions(project.owner_id, using, 'project', [project])
+    # Rollups don't cascade from Project; they are small, drop them now
+    project.daily_rollups.all().delete()
+
+
+def _delete_task_chunk(project_id, chunk_size, using):
+    """Delete up to `chunk_size` of a project's tasks with one statement."""
+    connection = connections[using]
+    table = connection.ops.quote_name(Task._meta.db_table)
+    with transaction.atomic(using=using):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"DELETE FROM {table} WHERE id IN ("
+                f"SELECT id FROM {table} WHERE project_id = %s LIMIT %s)",
+                [project_id, chunk_size])
+            deleted = cursor.rowcount
+        # Progress is committed together with the chunk it describes
+        Project.all_objects.using(using).filter(pk=project_id).update(
+            purged_task_count=F('purged_task_count') + deleted)
+    return deleted
+
+
+def purge_project(project_id, chunk_size=PURGE_CHUNK_SIZE, using=None):
+    """
+    Remove a deleted project's tasks chunk by chunk, then the project row,
+    on shard `using`. Each chunk commits on its own, so an interrupted
+    purge simply carries on from where it stopped when run again. Yields
+    the running total of tasks removed.
+    """
+    using = using or shard_aliases()[0]
+    projects = Project.all_objects.using(using).filter(pk=project_id)
+    while True:
+        deleted = _delete_task_chunk(project_id, chunk_size, using)
+        if deleted:
+            yield projects.values_list(
+                'purged_task_count', flat=True).first()
+        if deleted < chunk_size:
+            break
+
+    # Dependencies don't cascade from the project (see TaskDependency); no
+    # tasks are left, so the collector has nothing to cascade over
+    with transaction.atomic(using=using):
+        TaskDependency.objects.using(using).filter(
+            project_id=project_id).delete()
+        projects.filter(deleted_at__isnull=False).delete()
+
+
+def pending_purges():
+    """
+    Projects marked as deleted that still have rows to remove, from every
+    shard (each row's _state.db says which).
+    """
+    projects = [
+        project for using in shard_aliases()
+        for project in Project.all_objects.using(using).filter(
+            deleted_at__isnull=False)]
+    return sorted(projects, key=lambda project: project.deleted_at)
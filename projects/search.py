@@ -0,0 +1,258 @@
+import re
+
+from django.db import connection, connections, router
+from django.db.models import Q
+
+from .models import Project
+
+
+# Weighting applied to matches: a hit in the name ranks above
+# a hit in the description
+NAME_WEIGHT = 10.0
+DESCRIPTION_WEIGHT = 1.0
+
+
+# --- Index maintenance ---------------------------------------------------
+
+# SQLite: contentless FTS5 tables, kept in step with every write by
+# triggers. Each row is indexed with its owner as a token ('o' + owner
+# id), so a search matches the owner's token alongside the terms and
+# FTS5 narrows the matches down to one user's rows itself, rather than
+# every user's matches being joined to the table and filtered. The update
+# triggers only fire when the indexed values change, so bulk status updates
+# never touch the index.
+SQLITE_OWNER_SQL = {
+    'projects_project': "'o' || {row}.owner_id",
+    # A task's owner is its project's; projects outlive their tasks (the
+    # purge and the archive delete tasks first), so it is always found
+    'tasks_task': ("(SELECT 'o' || owner_id FROM projects_project "
+                   "WHERE id = {row}.project_id)"),
+}
+
+# The column the owner token is read from, watched by the update trigger
+SQLITE_OWNER_COLUMN = {
+    'projects_project': 'owner_id',
+    'tasks_task': 'project_id',
+}
+
+SQLITE_INDEX_SQL = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS {table}_fts USING fts5(
+        owner, name, description, content='',
+        tokenize='unicode61 remove_diacritics 2'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS {table}_fts_ai AFTER INSERT ON {table}
+    BEGIN
+        INSERT INTO {table}_fts(rowid, owner, name, description)
+        VALUES (new.id, {new_owner}, new.name, new.description);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS {table}_fts_ad AFTER DELETE ON {table}
+    BEGIN
+        INSERT INTO {table}_fts({table}_fts, rowid, owner, name,
+                                description)
+        VALUES ('delete', old.id, {old_owner}, old.name, old.description);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS {table}_fts_au
+    AFTER UPDATE OF name, description, {owner_column} ON {table}
+    BEGIN
+        INSERT INTO {table}_fts({table}_fts, rowid, owner, name,
+                                description)
+        VALUES ('delete', old.id, {old_owner}, old.name, old.description);
+        INSERT INTO {table}_fts(rowid, owner, name, description)
+        VALUES (new.id, {new_owner}, new.name, new.description);
+    END
+    """,
+]
+
+SQLITE_TRIGGERS = ['fts_ai', 'fts_ad', 'fts_au']
+
+SEARCHABLE_TABLES = ['projects_project', 'tasks_task']
+
+
+def _sqlite_format(statement, table):
+    owner = SQLITE_OWNER_SQL[table]
+    return statement.format(table=table,
+                            owner_column=SQLITE_OWNER_COLUMN[table],
+                            new_owner=owner.format(row='new'),
+                            old_owner=owner.format(row='old'))
+
+
+def _rebuild_sqlite_index(cursor, table):
+    # A contentless table can't re-read its rows: empty it and index every
+    # row again
+    cursor.execute(f"INSERT INTO {table}_fts({table}_fts) "
+                   f"VALUES ('delete-all')")
+    owner = SQLITE_OWNER_SQL[table].format(row='t')
+    cursor.execute(
+        f"INSERT INTO {table}_fts(rowid, owner, name, description) "
+        f"SELECT t.id, {owner}, t.name, t.description FROM {table} t")
+
+
+def ensure_search_index(using_connection=None, rebuild=False):
+    """
+    Create the SQLite full-text index tables and triggers. Safe to call
+    repeatedly - every statement is idempotent. SQLite drops triggers
+    when Django rebuilds a table during a migration, so this runs after
+    every migrate (see ProjectsConfig.ready). An index from before owners
+    were indexed is replaced and rebuilt. On PostgreSQL the index is part
+    of the schema (migration 0007_search_index).
+    """
+    conn = using_connection or connection
+    if conn.vendor != 'sqlite':
+        return
+
+    existing = conn.introspection.table_names()
+    with conn.cursor() as cursor:
+        for table in SEARCHABLE_TABLES:
+            if table not in existing:
+                continue
+            rebuild_table = rebuild
+            if f'{table}_fts' in existing:
+                cursor.execute(f"PRAGMA table_info({table}_fts)")
+                if 'owner' not in [row[1] for row in cursor.fetchall()]:
+                    for trigger in SQLITE_TRIGGERS:
+                        cursor.execute(
+                            f"DROP TRIGGER IF EXISTS {table}_{trigger}")
+                    cursor.execute(f"DROP TABLE {table}_fts")
+                    rebuild_table = True
+            else:
+                rebuild_table = True
+            for statement in SQLITE_INDEX_SQL:
+                cursor.execute(_sqlite_format(statement, table))
+            if rebuild_table:
+                _rebuild_sqlite_index(cursor, table)
+
+
+# --- Querying --------------------------------------------------------------
+
+def search_terms(query):
+    """Split free text into word tokens (drops FTS operators/punctuation)."""
+    return re.findall(r'\w+', query or '')[:10]
+
+
+def _match_expression(terms, vendor, owner_id=None):
+    # Every term must match; the last word is treated as a prefix
+    # so results appear while the user is still typing.
+    if vendor == 'sqlite':
+        parts = [f'"{term}"' for term in terms]
+        parts[-1] += '*'
+        # Terms match the text columns only, and only the owner's rows
+        return (f'owner : "o{owner_id}" AND '
+                f'{{name description}} : ({" ".join(parts)})')
+    parts = list(terms)
+    parts[-1] += ':*'
+    return ' & '.join(parts)
+
+
+class SearchResults:
+    """
+    Lazily evaluated, ranked search results for one model.
+
+    Implements count() and slicing so it can be handed straight to
+    django.core.paginator.Paginator - only the requested page is fetched.
+    Counting stops at COUNT_LIMIT matches, and so does paging.
+    """
+    COUNT_LIMIT = 1000
+
+    def __init__(self, model, owner, query):
+        self.model = model
+        self.owner = owner
+        self.terms = search_terms(query)
+        # Searches are reads, so they may be served by a replica; with
+        # sharding, the owner's shard is the only one holding their rows
+        self.using = router.db_for_read(model, instance=owner)
+        self.vendor = connections[self.using].vendor
+
+    def _from_where(self):
+        """Return the FROM/WHERE SQL and params for this search."""
+        table = self.model._meta.db_table
+        match = _match_expression(self.terms, self.vendor, self.owner.pk)
+
+        # Projects waiting to be purged are left out of the results
+        if self.model is Project:
+            owner_join = ""
+            owner_column = "t.owner_id"
+            deleted_column = "t.deleted_at"
+        else:
+            owner_join = "JOIN projects_project p ON p.id = t.project_id"
+            owner_column = "p.owner_id"
+            deleted_column = "p.deleted_at"
+
+        if self.vendor == 'sqlite':
+            sql = (f"FROM {table}_fts f "
+                   f"JOIN {table} t ON t.id = f.rowid {owner_join} "
+                   f"WHERE {table}_fts MATCH %s AND {owner_column} = %s "
+                   f"AND {deleted_column} IS NULL")
+        else:
+            sql = (f"FROM {table} t {owner_join} "
+                   f"WHERE t.search_vector @@ to_tsquery('english', %s) "
+                   f"AND {owner_column} = %s AND {deleted_column} IS NULL")
+        return sql, [match, self.owner.pk]
+
+    def _rank_sql(self):
+        table = self.model._meta.db_table
+        if self.vendor == 'sqlite':
+            # bm25() is lower-is-better; the owner column carries no weight
+            return (f"bm25({table}_fts, 0, {NAME_WEIGHT}, "
+                    f"{DESCRIPTION_WEIGHT})"), []
+        return ("-ts_rank(t.search_vector, to_tsquery('english', %s))",
+                [_match_expression(self.terms, self.vendor)])
+
+    def _fallback_queryset(self):
+        # Backends without a full-text index (e.g. MySQL in development)
+        # fall back to a plain containment filter.
+        queryset = self.model.objects.for_user(self.owner).using(self.using)
+        for term in self.terms:
+            queryset = queryset.filter(
+                Q(name__icontains=term) | Q(description__icontains=term))
+        return queryset.order_by('-id')
+
+    def count(self):
+        if not self.terms:
+            return 0
+        if self.vendor not in ('sqlite', 'postgresql'):
+            return self._fallback_queryset()[:self.COUNT_LIMIT].count()
+
+        # A common word stops counting at the limit instead of counting
+        # every one of the owner's matches
+        from_where, params = self._from_where()
+        with connections[self.using].cursor() as cursor:
+            cursor.execute(
+                f"SELECT COUNT(*) FROM (SELECT 1 {from_where} LIMIT %s) m",
+                params + [self.COUNT_LIMIT])
+            return cursor.fetchone()[0]
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, key):
+        if not isinstance(key, slice):
+            raise TypeError("SearchResults only supports slicing.")
+        start = key.start or 0
+        stop = key.stop if key.stop is not None else start + 1000
+        if not self.terms or stop <= start:
+            return []
+        if self.vendor not in ('sqlite', 'postgresql'):
+            return list(self._fallback_queryset()[start:stop])
+
+        from_where, params = self._from_where()
+        rank_sql, rank_params = self._rank_sql()
+        with connections[self.using].cursor() as cursor:
+            cursor.execute(
+                f"SELECT t.id {from_where} ORDER BY {rank_sql}, t.id "
+                f"LIMIT %s OFFSET %s",
+                params + rank_params + [stop - start, start])
+            ids = [row[0] for row in cursor.fetchall()]
+
+        # Fetch the page of objects and keep them in rank order
+        queryset = self.model.objects.using(self.using)
+        if self.model is not Project:
+            queryset = queryset.select_related('project')
+        objects = queryset.in_bulk(ids)
+        return [objects[pk] for pk in ids if pk in objects]
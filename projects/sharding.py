@@ -0,0 +1,325 @@
+"""
+Owner-based sharding of projects and tasks.
+
+Every query in the project and task views is scoped to one owner, so each
+user's projects, tasks, rollups and archived rows live together on one
+database alias from settings.PROJECT_SHARDS. Users, sessions, jobs and the
+ShardAssignment directory stay on `default`.
+
+- ShardAssignment records each user's shard (new users are spread by id).
+- Project.objects.for_user() / Task.objects.for_user() query that shard;
+  related lookups (project.tasks, task.project, user.projects) follow the
+  instance they start from through ShardRouter.
+- Ids come from IdSequence on `default`, so rows can move between shards
+  without colliding.
+- move_user() (the rebalance_shard command) copies a user's rows to
+  another shard while their requests briefly get a 503.
+
+With a single shard (the default) none of this costs a query.
+"""
+from asgiref.sync import sync_to_async
+from django.apps import apps
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import DEFAULT_DB_ALIAS, router, transaction
+from django.db.models import F, Max, Q
+
+# Models whose rows live on their owner's shard
+SHARDED_MODELS = {
+    'projects.project', 'projects.archivedproject',
+    'projects.changecounter', 'projects.tombstone',
+    'projects.projecttemplate',
+    'tasks.task', 'tasks.archivedtask', 'tasks.taskdailyrollup',
+    'tasks.tasktemplate', 'tasks.taskdependency', 'tasks.taskrecurrence',
+    'tasks.archivedtaskrecurrence', 'tasks.digestlog',
+}
+
+# Directory tables, always read from and written to `default`
+DIRECTORY_MODELS = {'projects.shardassignment', 'projects.idsequence'}
+
+# Tables sharing one id space: an archived row keeps its live id
+ID_SPACES = {
+    'projects.project': ['projects.project', 'projects.archivedproject'],
+    'tasks.task': ['tasks.task', 'tasks.archivedtask'],
+    'projects.projecttemplate': ['projects.projecttemplate'],
+    'tasks.taskrecurrence': ['tasks.taskrecurrence',
+                             'tasks.archivedtaskrecurrence'],
+}
+
+# Tables whose ids are local to each shard: rows get new ids when moved
+LOCAL_ID_MODELS = {'tasks.taskdailyrollup', 'projects.tombstone',
+                   'tasks.tasktemplate', 'tasks.taskdependency',
+                   'tasks.digestlog'}
+
+# Rows copied per INSERT when moving a user between shards
+MOVE_BATCH_SIZE = 1000
+
+
+class ShardMoving(Exception):
+    """The user's data is being moved to another shard; retry shortly."""
+
+
+def shard_aliases():
+    return list(getattr(settings, 'PROJECT_SHARDS', None)
+                or [DEFAULT_DB_ALIAS])
+
+
+def is_sharded():
+    return len(shard_aliases()) > 1
+
+
+def default_shard(user_id):
+    """Shard for a user without an assignment yet."""
+    aliases = shard_aliases()
+    return aliases[user_id % len(aliases)]
+
+
+def _assignment(user_id):
+    from .models import ShardAssignment
+    assignment = ShardAssignment.objects.filter(user_id=user_id).first()
+    if assignment is None:
+        assignment, _ = ShardAssignment.objects.get_or_create(
+            user_id=user_id, defaults={'shard': default_shard(user_id)})
+    return assignment
+
+
+def shard_for_user(user):
+    """
+    Database alias holding `user`'s projects (a User or a user id).
+    Raises ShardMoving while rebalance_shard is moving them.
+    """
+    if not is_sharded():
+        return shard_aliases()[0]
+    if isinstance(user, User):
+        # One directory lookup per request: memoised on the user object
+        if not hasattr(user, '_project_shard'):
+            assignment = _assignment(user.pk)
+            if assignment.moving:
+                raise ShardMoving(user.pk)
+            user._project_shard = assignment.shard
+        return user._project_shard
+    assignment = _assignment(user)
+    if assignment.moving:
+        raise ShardMoving(user)
+    return assignment.shard
+
+
+def on_user_shard(queryset, user):
+    """
+    `queryset` on the shard holding `user`'s rows. Without sharding the
+    routers pick the database, so reads can be served by a replica.
+    """
+    if not is_sharded():
+        return queryset
+    return queryset.using(shard_for_user(user))
+
+
+def write_db(instance):
+    """
+    Database `instance`'s rows are written to: its shard, and never the
+    replica it may have been read from.
+    """
+    return router.db_for_write(type(instance), instance=instance)
+
+
+# For async views: the directory lookup runs in a thread, and the result
+# is memoised on the user for the queries that follow
+ashard_for_user = sync_to_async(shard_for_user)
+
+
+def allocate_ids(model, count=1):
+    """
+    Reserve `count` consecutive ids for `model` from its IdSequence row on
+    `default`. Returns the reserved range.
+    """
+    from .models import IdSequence
+    name = model._meta.label_lower
+    with transaction.atomic(using=DEFAULT_DB_ALIAS):
+        sequence = (IdSequence.objects.select_for_update()
+                    .filter(name=name).first())
+        if sequence is None:
+            # First id handed out: start above every existing row
+            highest = max(
+                (apps.get_model(label).objects.using(alias)
+                 .aggregate(top=Max('id'))['top'] or 0)
+                for label in ID_SPACES[name] for alias in shard_aliases())
+            sequence = IdSequence.objects.create(
+                name=name, next_id=highest + 1)
+        start = sequence.next_id
+        IdSequence.objects.filter(name=name).update(
+            next_id=F('next_id') + count)
+    return range(start, start + count)
+
+
+def assign_ids(objs):
+    """Give unsaved sharded rows ids from the shared sequence."""
+    if not is_sharded():
+        return
+    missing = [obj for obj in objs if obj.pk is None]
+    if missing:
+        for obj, pk in zip(missing, allocate_ids(type(missing[0]),
+                                                 len(missing))):
+            obj.pk = pk
+
+
+class ShardRouter:
+    """
+    Sends sharded models to the shard of the instance or owner in the
+    hints, and the directory models to `default`. Anything it can't place
+    falls through to the next router (ReplicaRouter).
+    """
+
+    def _shard(self, model, hints):
+        label = model._meta.label_lower
+        if label in DIRECTORY_MODELS:
+            return DEFAULT_DB_ALIAS
+        if label not in SHARDED_MODELS or not is_sharded():
+            return None
+
+        instance = hints.get('instance')
+        if instance is None:
+            return None
+        if isinstance(instance, User):
+            # user.projects and friends
+            return shard_for_user(instance)
+        if instance._meta.label_lower in SHARDED_MODELS:
+            if instance._state.db:
+                return instance._state.db
+            # A new row: follow its owner or its project
+            owner_id = getattr(instance, 'owner_id', None)
+            if owner_id is not None:
+                return shard_for_user(owner_id)
+            if hasattr(instance, 'project_id'):
+                project_field = instance._meta.get_field('project')
+                if project_field.is_cached(instance):
+                    return instance.project._state.db
+        return None
+
+    def db_for_read(self, model, **hints):
+        return self._shard(model, hints)
+
+    def db_for_write(self, model, **hints):
+        return self._shard(model, hints)
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Users on `default` own rows on every shard
+        if is_sharded():
+            known = {DEFAULT_DB_ALIAS, *shard_aliases()}
+            if {obj1._state.db, obj2._state.db} <= known:
+                return True
+        return None
+
+
+# --- Rebalancing ---------------------------------------------------------
+
+def _owned_rows(alias, user_id):
+    """(model, queryset) of a user's rows on `alias`, parents first."""
+    from .models import (Project, ArchivedProject, ChangeCounter,
+                         ProjectTemplate, Tombstone)
+    from tasks.models import (Task, ArchivedTask, ArchivedTaskRecurrence,
+                              DigestLog, TaskDailyRollup, TaskDependency,
+                              TaskRecurrence, TaskTemplate)
+    return [
+        (Project, Project.all_objects.using(alias).filter(owner_id=user_id)),
+        (ChangeCounter,
+         ChangeCounter.objects.using(alias).filter(owner_id=user_id)),
+        (Tombstone, Tombstone.objects.using(alias).filter(owner_id=user_id)),
+        (TaskRecurrence, TaskRecurrence.objects.using(alias).filter(
+            project__owner_id=user_id)),
+        (Task, Task.objects.using(alias).filter(project__owner_id=user_id)),
+        (TaskDailyRollup,
+         TaskDailyRollup.objects.using(alias).filter(owner_id=user_id)),
+        (ArchivedProject,
+         ArchivedProject.objects.using(alias).filter(owner_id=user_id)),
+        (ArchivedTaskRecurrence, ArchivedTaskRecurrence.objects.using(
+            alias).filter(project__owner_id=user_id)),
+        # With the tasks a running archive has moved out of a live project
+        (ArchivedTask, ArchivedTask.objects.using(alias).filter(
+            Q(project__owner_id=user_id) | Q(
+                project_id__in=Project.all_objects.using(alias).filter(
+                    owner_id=user_id).values('id')))),
+        (ProjectTemplate,
+         ProjectTemplate.objects.using(alias).filter(owner_id=user_id)),
+        (TaskTemplate, TaskTemplate.objects.using(alias).filter(
+            template__owner_id=user_id)),
+        (TaskDependency, _owned_dependencies(alias, user_id)),
+        (DigestLog, DigestLog.objects.using(alias).filter(owner_id=user_id)),
+    ]
+
+
+def _owned_dependencies(alias, user_id):
+    # Edges of the user's live and archived projects (see TaskDependency)
+    from .models import ArchivedProject
+    from tasks.models import TaskDependency
+    return TaskDependency.objects.using(alias).filter(
+        Q(project__owner_id=user_id) | Q(
+            project_id__in=ArchivedProject.objects.using(alias).filter(
+                owner_id=user_id).values('id')))
+
+
+def _delete_owned(alias, user_id):
+    """Delete a user's rows on `alias`, children first, in batches."""
+    with transaction.atomic(using=alias):
+        for model, rows in reversed(_owned_rows(alias, user_id)):
+            # pk rather than id: ChangeCounter is keyed on its owner
+            ids = list(rows.values_list('pk', flat=True))
+            for start in range(0, len(ids), MOVE_BATCH_SIZE):
+                model._base_manager.using(alias).filter(
+                    pk__in=ids[start:start + MOVE_BATCH_SIZE]).delete()
+
+
+def delete_user_rows(sender, instance, using, **kwargs):
+    """
+    pre_delete handler for User: the usual cascade only reaches rows in
+    the database the user is deleted from, so clear the other shards.
+    """
+    # Dependency edges don't cascade from their project at all
+    _owned_dependencies(using, instance.pk).delete()
+    if is_sharded():
+        for alias in shard_aliases():
+            if alias != using:
+                _delete_owned(alias, instance.pk)
+
+
+def move_user(user, target, batch_size=MOVE_BATCH_SIZE):
+    """
+    Move every row owned by `user` to the `target` shard and point their
+    ShardAssignment at it. Returns {model name: rows copied}.
+
+    1. The assignment is flagged `moving`: the user's requests get a 503
+       (see ShardMovingMiddleware) while other users carry on.
+    2. Rows are copied with their ids in one transaction on the target,
+       after clearing leftovers of an interrupted earlier move.
+    3. The assignment switches to the target, then the source rows are
+       deleted.
+    """
+    from .archive import _copy_rows
+    from .models import ShardAssignment
+
+    if target not in shard_aliases():
+        raise ValueError(f"Unknown shard '{target}'.")
+    assignment = _assignment(user.pk)
+    source = assignment.shard
+    if source == target:
+        return {}
+
+    ShardAssignment.objects.filter(pk=user.pk).update(moving=True)
+    try:
+        _delete_owned(target, user.pk)
+        copied = {}
+        with transaction.atomic(using=target):
+            for model, rows in _owned_rows(source, user.pk):
+                # Everything else keeps its id because other rows and URLs
+                # refer to it
+                exclude = (['id'] if model._meta.label_lower in
+                           LOCAL_ID_MODELS else [])
+                copied[model.__name__] = _copy_rows(
+                    rows, model, batch_size, using=target, exclude=exclude)
+        ShardAssignment.objects.filter(pk=user.pk).update(
+            shard=target, moving=False)
+    except Exception:
+        ShardAssignment.objects.filter(pk=user.pk).update(moving=False)
+        raise
+
+    _delete_owned(source, user.pk)
+    return copied
@@ -0,0 +1,104 @@
+from django.http import StreamingHttpResponse
+from django.template.context import make_context
+from django.template.loader import get_template, render_to_string
+
+# Placeholder rendered where the streamed rows belong; the page is split
+# around it into a head and a tail
+ROWS_MARKER = "<!-- streamed-rows -->"
+
+# Rows rendered per yielded chunk (and fetched per database round trip)
+STREAM_CHUNK_SIZE = 200
+
+
+def _render_rows(request, row_template, rows, row_name, extra, chunk_size):
+    """
+    Render `row_template` once per object in `rows`, yielding the output
+    `chunk_size` rows at a time. The template and its request context are
+    built once and reused for every row.
+    """
+    template = get_template(row_template).template
+    context = make_context(extra, request)
+    with context.bind_template(template):
+        chunk = []
+        for obj in rows:
+            with context.push({row_name: obj}):
+                chunk.append(template.render(context))
+            if len(chunk) >= chunk_size:
+                yield "".join(chunk)
+                chunk = []
+        if chunk:
+            yield "".join(chunk)
+
+
+async def _arender_rows(request, row_template, rows, row_name, extra,
+                        chunk_size):
+    """_render_rows for an async iterator such as queryset.aiterator()."""
+    template = get_template(row_template).template
+    context = make_context(extra, request)
+    with context.bind_template(template):
+        chunk = []
+        async for obj in rows:
+            with context.push({row_name: obj}):
+                chunk.append(template.render(context))
+            if len(chunk) >= chunk_size:
+                yield "".join(chunk)
+                chunk = []
+        if chunk:
+            yield "".join(chunk)
+
+
+def _split_page(request, template_name, context):
+    # Render the page with the marker in place of the rows
+    page = render_to_string(template_name, {
+        **context,
+        "rows_marker": ROWS_MARKER,
+    }, request=request)
+    head, _, tail = page.partition(ROWS_MARKER)
+    return head, tail
+
+
+def stream_page(request, template_name, context, row_template, rows,
+                row_name, row_context=None, chunk_size=STREAM_CHUNK_SIZE):
+    """
+    Return a StreamingHttpResponse for `template_name` whose repeated rows
+    are streamed instead of being rendered up front.
+
+    The page template prints `rows_marker` where the rows go. Everything
+    before it (page head, project summary) is sent straight away, then the
+    rows are rendered from `rows` - normally a queryset's .iterator() - in
+    chunks, then the rest of the page. Memory stays flat however many rows
+    there are.
+
+    The head and tail are rendered before returning so that anything they
+    consume (e.g. flashed messages) is settled before the middleware saves
+    the session.
+    """
+    head, tail = _split_page(request, template_name, context)
+
+    def content():
+        yield head
+        yield from _render_rows(request, row_template, rows, row_name,
+                                row_context or {}, chunk_size)
+        yield tail
+
+    return StreamingHttpResponse(content(), content_type="text/html")
+
+
+def astream_page(request, template_name, context, row_template, rows,
+                 row_name, row_context=None, chunk_size=STREAM_CHUNK_SIZE):
+    """
+    stream_page for async views: `rows` is an async iterator, normally a
+    queryset's .aiterator(), and the response streams from it without
+    tying up a thread. The head and tail must not query the database.
+    """
+    head, tail = _split_page(request, template_name, context)
+
+    async def content():
+        yield head
+        async for chunk in _arender_rows(request, row_template, rows,
+                                         row_name, row_context or {},
+                                         chunk_size):
+            yield chunk
+        yield tail
+
+    return StreamingHttpResponse(content(), content_type="text/html")
@@ -1,7 +1,31 @@
-from django.test import TestCase
+import gzip
+from unittest import mock, skipUnless
+from django.conf import settings
+from django.http import HttpResponse
+from django.test import (RequestFactory, TestCase, TransactionTestCase,
+                         override_settings)
+from django.db import connection
+from django.db.models.deletion import Collector
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from django.contrib.auth.models import User
-from projects.models import Project
+from core.middleware import ShardMovingMiddleware
+from projects.events import (QUEUE_SIZE, RESYNC, LocalBroker, event_stream,
+                             get_broker, publish)
+from projects import archive
+from projects.archive import restore_project
+from projects.cloning import (CLONE_BATCH_SIZE, clone_project,
+                              save_as_template)
+from projects.lifecycle import close_project
+from projects.search import SearchResults, ensure_search_index
+from projects.models import (Project, ArchivedProject, ChangeCounter,
+                             ProjectTemplate, ShardAssignment)
+from projects.sharding import ShardMoving, _delete_owned, shard_for_user
+from tasks.models import (ArchivedTask, Task, TaskDailyRollup,
+                          TaskDependency, TaskRecurrence, TaskTemplate)
+from django.core.management import call_command
+from django.utils import timezone
+from io import StringIO
 from datetime import date, timedelta
 from django.utils.http import urlencode
 
@@ -176,6 +200,124 @@ class ProjectViewTests(TestCase):
         self.assertEqual(task1.status, 'outstanding')
         self.assertEqual(task2.status, 'outstanding')
 
+    def test_project_toggle_fragment_returns_card(self):
+        """The fragment endpoint returns only the re-rendered project card."""
+        self.project.tasks.create(name='Task 1', status='outstanding')
+        url = reverse('project_toggle_complete_fragment',
+                      args=[self.project.id])
+
+        self.assertEqual(self.client.get(url).status_code, 405)
+
+        data = self.client.post(url).json()
+        self.assertEqual(data['project_id'], self.project.id)
+        self.assertEqual(data['status'], 'closed')
+        self.assertIn(f'id="project-card-{self.project.id}"', data['html'])
+        self.assertIn('Re-open Project', data['html'])
+        self.assertEqual(len(data['messages']), 1)
+        self.project.refresh_from_db()
+        self.assertEqual(self.project.status, 'closed')
+
+        # Other users' projects are not found
+        response = self.client.post(
+            reverse('project_toggle_complete_fragment',
+                    args=[self.other_project.id]))
+        self.assertEqual(response.status_code, 404)
+
+    @override_settings(PROJECT_DETAIL_STREAM_THRESHOLD=2)
+    def test_project_detail_streams_large_projects(self):
+        """Above the threshold the task cards are streamed in chunks."""
+        for i in range(3):
+            self.project.tasks.create(name=f'Streamed {i}')
+
+        response = self.client.get(
+            reverse('project_detail', args=[self.project.id]))
+        self.assertTrue(response.streaming)
+        chunks = [chunk.decode() for chunk in response.streaming_content]
+
+        # The summary is sent before any task is rendered
+        self.assertIn('Total Tasks', chunks[0])
+        self.assertNotIn('task-card-', chunks[0])
+        page = ''.join(chunks)
+        for task in self.project.tasks.all():
+            self.assertIn(f'id="task-card-{task.id}"', page)
+        self.assertTrue(page.rstrip().endswith('</html>'))
+
+    @override_settings(PROJECT_DETAIL_STREAM_THRESHOLD=2)
+    def test_project_detail_stream_is_gzipped(self):
+        """Streamed pages are still compressed when the client accepts it."""
+        for i in range(3):
+            self.project.tasks.create(name=f'Streamed {i}')
+
+        response = self.client.get(
+            reverse('project_detail', args=[self.project.id]),
+            HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        page = gzip.decompress(b''.join(response.streaming_content))
+        self.assertIn(b'Streamed 2', page)
+
+    def test_project_detail_small_projects_render_normally(self):
+        """Below the threshold the page is rendered in one go."""
+        self.project.tasks.create(name='Only task')
+        response = self.client.get(
+            reverse('project_detail', args=[self.project.id]))
+        self.assertFalse(response.streaming)
+        self.assertContains(response, 'Only task')
+
+    def test_project_list_loads_excerpts_and_counts_in_one_query(self):
+        """project_list never fetches full descriptions or task rows."""
+        long_text = 'word ' * 100
+        for i in range(5):
+            project = Project.objects.create(
+                name=f'Listed {i}', description=long_text, owner=self.user,
+                start_date=date.today(), end_date=date.today())
+            project.tasks.create(name='Done', status='completed')
+            project.tasks.create(name='Open')
+
+        # session + user + one projects query, however many projects
+        with self.assertNumQueries(3) as queries:
+            response = self.client.get(reverse('project_list'))
+        sql = queries.captured_queries[-1]['sql']
+        # The description only appears inside the excerpt expression
+        self.assertEqual(sql.count('"projects_project"."description"'), 1)
+        self.assertNotIn('"tasks_task"."name"', sql)
+
+        project = next(p for p in response.context['projects']
+                       if p.name == 'Listed 0')
+        self.assertEqual(len(project.description_excerpt), 101)
+        self.assertEqual(project.total_tasks, 2)
+        self.assertEqual(project.completed_count, 1)
+        self.assertContains(response, 'data-read-more', count=5)
+
+    def test_project_description_endpoint(self):
+        """The full description is served lazily, to the owner only."""
+        self.project.description = 'Line one\nLine <two>'
+        self.project.save()
+        response = self.client.get(
+            reverse('project_description', args=[self.project.id]))
+        self.assertEqual(response.json(), {
+            'id': self.project.id,
+            'description': 'Line one\nLine <two>',
+            'html': 'Line one<br>Line &lt;two&gt;',
+        })
+
+        response = self.client.get(
+            reverse('project_description', args=[self.other_project.id]))
+        self.assertEqual(response.status_code, 404)
+
+    def test_project_detail_defers_description(self):
+        """Only the excerpt of a long description is loaded and rendered."""
+        self.project.description = 'a' * 150 + 'TAIL'
+        self.project.save()
+        self.project.tasks.create(name='Task', description='b' * 300)
+
+        response = self.client.get(
+            reverse('project_detail', args=[self.project.id]))
+        self.assertNotContains(response, 'TAIL')
+        self.assertNotContains(response, 'b' * 101)
+        self.assertContains(
+            response,
+            reverse('project_description', args=[self.project.id]))
+
     def test_protected_views_redirect_anonymous(self):
         """Anonymous users should be redirected
             to login for protected views."""
@@ -192,3 +334,998 @@ class ProjectViewTests(TestCase):
             response = self.client.get(url)
             self.assertEqual(response.status_code, 302)
             self.assertIn(reverse('login'), response.url)
+
+
+class SearchTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            'user', 'user@example.com', 'pass')
+        self.other_user = User.objects.create_user(
+            'other', 'other@example.com', 'pass2')
+        self.client.login(username='user', password='pass')
+
+        self.project = Project.objects.create(
+            name='Website redesign',
+            description='Refresh the marketing website',
+            owner=self.user,
+            start_date=date.today(),
+            end_date=date.today() + timedelta(days=7)
+        )
+        self.other_project = Project.objects.create(
+            name='Website migration',
+            description='Belongs to someone else',
+            owner=self.other_user,
+            start_date=date.today(),
+            end_date=date.today() + timedelta(days=7)
+        )
+
+    def search(self, **params):
+        return self.client.get(reverse('search'), params)
+
+    def test_search_finds_own_projects_only(self):
+        """Matches are scoped to the logged-in user's projects."""
+        response = self.search(q='website')
+        results = list(response.context['page'].object_list)
+        self.assertEqual(results, [self.project])
+        self.assertEqual(response.context['project_count'], 1)
+
+    def test_search_matches_word_prefix(self):
+        """The last search word is matched as a prefix."""
+        response = self.search(q='redes')
+        self.assertEqual(
+            list(response.context['page'].object_list), [self.project])
+
+    def test_search_ranks_name_matches_first(self):
+        """A match in the name outranks a match in the description."""
+        description_hit = Project.objects.create(
+            name='Quarterly plan',
+            description='Includes budget for the redesign',
+            owner=self.user,
+            start_date=date.today(),
+            end_date=date.today() + timedelta(days=7)
+        )
+        response = self.search(q='redesign')
+        self.assertEqual(
+            list(response.context['page'].object_list),
+            [self.project, description_hit])
+
+    def test_search_index_follows_edits_and_deletes(self):
+        """Renaming or deleting a project updates the index."""
+        self.project.name = 'Brochure'
+        self.project.description = 'Print run'
+        self.project.save()
+        self.assertEqual(self.search(q='website').context['project_count'], 0)
+        self.assertEqual(self.search(q='brochure').context['project_count'], 1)
+
+        self.project.delete()
+        self.assertEqual(self.search(q='brochure').context['project_count'], 0)
+
+    def test_search_tasks(self):
+        """Tasks are searchable and scoped through their project owner."""
+        task = self.project.tasks.create(
+            name='Draft homepage copy', description='Hero and features')
+        self.other_project.tasks.create(name='Draft homepage copy')
+
+        response = self.search(q='homepage', type='tasks')
+        self.assertEqual(list(response.context['page'].object_list), [task])
+        self.assertEqual(response.context['task_count'], 1)
+
+    def test_search_paginates_results(self):
+        """Results are split into pages."""
+        for i in range(25):
+            self.project.tasks.create(name=f'Invoice {i}')
+
+        first = self.search(q='invoice', type='tasks')
+        second = self.search(q='invoice', type='tasks', page=2)
+        self.assertEqual(len(first.context['page'].object_list), 20)
+        self.assertEqual(len(second.context['page'].object_list), 5)
+        self.assertEqual(first.context['task_count'], 25)
+
+    def test_search_index_matches_the_owners_rows_only(self):
+        """Other users' rows are left out by the index itself."""
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT rowid FROM projects_project_fts "
+                "WHERE projects_project_fts MATCH %s",
+                [f'owner : "o{self.user.pk}" AND '
+                 f'{{name description}} : ("website")'])
+            self.assertEqual(cursor.fetchall(), [(self.project.pk,)])
+
+    def test_search_counts_stop_at_the_limit(self):
+        """A common word isn't counted past COUNT_LIMIT matches."""
+        for i in range(5):
+            self.project.tasks.create(name=f'Invoice {i}')
+
+        with mock.patch.object(SearchResults, 'COUNT_LIMIT', 3):
+            response = self.search(q='invoice', type='tasks')
+        self.assertEqual(response.context['task_count'], 3)
+        self.assertContains(response, 'Tasks (3+)')
+        self.assertContains(response, 'Projects (0)')
+
+    def test_search_index_upgrade(self):
+        """An index without owners is replaced and rebuilt."""
+        with connection.cursor() as cursor:
+            for trigger in ['fts_ai', 'fts_ad', 'fts_au']:
+                cursor.execute(
+                    f"DROP TRIGGER projects_project_{trigger}")
+            cursor.execute("DROP TABLE projects_project_fts")
+            cursor.execute(
+                "CREATE VIRTUAL TABLE projects_project_fts USING fts5("
+                "name, description, content='projects_project', "
+                "content_rowid='id')")
+        ensure_search_index(connection)
+
+        response = self.search(q='website')
+        self.assertEqual(
+            list(response.context['page'].object_list), [self.project])
+        self.project.delete()
+        self.assertEqual(self.search(q='website').context['project_count'], 0)
+
+    def test_search_ignores_query_operators(self):
+        """FTS syntax characters in the query don't cause errors."""
+        response = self.search(q='"website" OR (NEAR*')
+        self.assertEqual(response.status_code, 200)
+
+    def test_empty_search(self):
+        """An empty query shows no results."""
+        response = self.search(q='')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['project_count'], 0)
+
+
+class ProjectArchiveTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            'user', 'user@example.com', 'pass')
+        self.client.login(username='user', password='pass')
+
+        self.project = Project.objects.create(
+            name='Old Project',
+            description='Closed a long time ago',
+            owner=self.user,
+            status='closed',
+            start_date=date.today() - timedelta(days=200),
+            end_date=date.today() - timedelta(days=150),
+            previous_task_statuses={},
+        )
+        self.task = self.project.tasks.create(
+            name='Old Task', status='completed')
+        self.project.previous_task_statuses = {
+            str(self.task.id): 'outstanding'}
+        self.project.closed_at = timezone.now() - timedelta(days=120)
+        self.project.save()
+
+    def archive(self, **options):
+        call_command('archive_projects', stdout=StringIO(), **options)
+
+    def test_closing_sets_closed_at(self):
+        """closed_at follows the status through save()."""
+        project = Project.objects.create(
+            name='P', description='d', owner=self.user, status='open',
+            start_date=date.today(), end_date=date.today())
+        self.assertIsNone(project.closed_at)
+        project.status = 'closed'
+        project.save()
+        self.assertIsNotNone(project.closed_at)
+        project.status = 'open'
+        project.save()
+        self.assertIsNone(project.closed_at)
+
+    def test_archive_moves_old_closed_projects_and_tasks(self):
+        """Old closed projects and their tasks leave the live tables."""
+        recent = Project.objects.create(
+            name='Recently closed', description='d', owner=self.user,
+            status='closed', start_date=date.today(),
+            end_date=date.today())
+
+        self.archive(days=90, batch_size=1)
+
+        self.assertFalse(Project.objects.filter(id=self.project.id).exists())
+        self.assertFalse(Task.objects.filter(id=self.task.id).exists())
+        archived = ArchivedProject.objects.get(id=self.project.id)
+        self.assertEqual(archived.name, 'Old Project')
+        self.assertEqual(list(archived.tasks.values_list('id', flat=True)),
+                         [self.task.id])
+        # Projects closed recently stay where they are
+        self.assertTrue(Project.objects.filter(id=recent.id).exists())
+
+    def test_archived_project_is_viewable_read_only(self):
+        """The old URL redirects to the read-only archive page."""
+        self.archive(days=90)
+        response = self.client.get(
+            reverse('project_detail', args=[self.project.id]))
+        self.assertRedirects(response, reverse(
+            'archived_project_detail', args=[self.project.id]))
+
+        response = self.client.get(
+            reverse('archived_project_detail', args=[self.project.id]))
+        self.assertContains(response, 'Old Task')
+        response = self.client.get(reverse('archived_project_list'))
+        self.assertContains(response, 'Old Project')
+
+    def test_reopen_restores_archived_project(self):
+        """project_toggle_complete restores and reopens an archived project."""
+        self.archive(days=90)
+        self.client.get(
+            reverse('project_toggle_complete', args=[self.project.id]))
+
+        project = Project.objects.get(id=self.project.id)
+        self.assertEqual(project.status, 'open')
+        self.assertIsNone(project.closed_at)
+        self.assertEqual(
+            Task.objects.get(id=self.task.id).status, 'outstanding')
+        self.assertFalse(
+            ArchivedProject.objects.filter(id=self.project.id).exists())
+
+    def test_large_projects_move_a_chunk_per_transaction(self):
+        self.project.tasks.bulk_create([
+            Task(project=self.project, name=f'Step {i}', status='completed')
+            for i in range(4)])
+        # Rows are removed by plain DELETEs, never loaded and collected
+        with mock.patch.object(archive, 'archive_batch',
+                               wraps=archive.archive_batch) as final, \
+                mock.patch.object(Collector, 'collect') as collect:
+            moved = list(archive.archive_projects(days=90, batch_size=2))
+        self.assertEqual(moved, [(1, 5)])
+        # Two chunks of tasks first, then the project and the last task
+        final.assert_called_once_with([self.project.id], 'default')
+        self.assertEqual(ArchivedTask.objects.filter(
+            project_id=self.project.id).count(), 5)
+        self.assertFalse(Task.objects.exists())
+        collect.assert_not_called()
+
+    def test_reopening_part_way_brings_moved_tasks_back(self):
+        self.project.tasks.create(name='Another', status='completed')
+        # As if the archive run stopped after its first chunk
+        with mock.patch.object(archive, 'archive_batch',
+                               side_effect=RuntimeError), \
+                self.assertRaises(RuntimeError):
+            archive.archive_large_project(self.project.id, batch_size=1)
+        self.assertEqual(self.project.tasks.count(), 0)
+
+        self.client.get(
+            reverse('project_toggle_complete', args=[self.project.id]))
+        self.assertEqual(self.project.tasks.count(), 2)
+        self.assertFalse(ArchivedTask.objects.exists())
+        self.assertEqual(Task.objects.get(id=self.task.id).status,
+                         'outstanding')
+
+    def test_reopening_through_a_task_brings_moved_tasks_back(self):
+        another = self.project.tasks.create(
+            name='Another', status='completed')
+        move_tasks = archive._move_tasks
+
+        def stop_after_first_chunk(task_ids, using):
+            if ArchivedTask.objects.exists():
+                raise RuntimeError
+            return move_tasks(task_ids, using)
+
+        with mock.patch.object(archive, '_move_tasks',
+                               side_effect=stop_after_first_chunk), \
+                self.assertRaises(RuntimeError):
+            archive.archive_large_project(self.project.id, batch_size=1)
+        self.assertEqual(list(self.project.tasks.all()), [another])
+
+        # Reopening a task reopens the project with a plain UPDATE
+        self.client.get(reverse('task_toggle_complete', args=[another.id]))
+        self.project.refresh_from_db()
+        self.assertEqual(self.project.status, 'open')
+        self.assertEqual(self.project.tasks.count(), 2)
+        self.assertFalse(ArchivedTask.objects.exists())
+
+    def test_recurring_rules_survive_archiving(self):
+        rule = TaskRecurrence.objects.create(
+            project=self.project, name='Standup', frequency='daily',
+            starts_on=date.today() - timedelta(days=150), duration_days=0,
+            materialized_until=date.today() - timedelta(days=149))
+        occurrence = self.project.tasks.create(
+            name='Standup', recurrence=rule, status='completed',
+            occurrence_date=rule.starts_on)
+
+        self.archive(days=90)
+        self.assertFalse(TaskRecurrence.objects.exists())
+        archived = ArchivedProject.objects.get(id=self.project.id)
+        self.assertEqual(archived.recurrences.get().id, rule.id)
+
+        restore_project(archived)
+        restored = TaskRecurrence.objects.get(id=rule.id)
+        self.assertEqual((restored.frequency, restored.materialized_until),
+                         ('daily', rule.materialized_until))
+        task = Task.objects.get(id=occurrence.id)
+        self.assertEqual((task.recurrence_id, task.occurrence_date),
+                         (rule.id, rule.starts_on))
+
+    def test_archived_projects_of_other_users_are_hidden(self):
+        """Archive views are scoped to the owner."""
+        self.archive(days=90)
+        User.objects.create_user('other', 'other@example.com', 'pass2')
+        self.client.login(username='other', password='pass2')
+        response = self.client.get(
+            reverse('archived_project_detail', args=[self.project.id]))
+        self.assertEqual(response.status_code, 404)
+        response = self.client.get(
+            reverse('project_toggle_complete', args=[self.project.id]))
+        self.assertEqual(response.status_code, 404)
+
+
+class ProjectPurgeTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            'user', 'user@example.com', 'pass')
+        self.client.login(username='user', password='pass')
+        self.project = Project.objects.create(
+            name='Big Project',
+            description='Lots of tasks',
+            owner=self.user,
+            start_date=date.today(),
+            end_date=date.today() + timedelta(days=7)
+        )
+        Task.objects.bulk_create(
+            Task(project=self.project, name=f'Task {i}') for i in range(25))
+        self.task = self.project.tasks.first()
+
+    def delete_project(self):
+        return self.client.post(
+            reverse('project_confirm_delete', args=[self.project.id]),
+            {'password': 'pass'})
+
+    def test_delete_hides_project_without_removing_tasks(self):
+        """Deleting only marks the project; views stop showing it."""
+        response = self.delete_project()
+        self.assertRedirects(response, reverse('project_list'))
+
+        self.assertTrue(
+            Project.all_objects.filter(id=self.project.id).exists())
+        self.assertEqual(Task.objects.filter(
+            project_id=self.project.id).count(), 25)
+
+        self.assertNotIn(
+            self.project, self.client.get(
+                reverse('project_list')).context['projects'])
+        self.assertEqual(self.client.get(reverse(
+            'project_detail', args=[self.project.id])).status_code, 404)
+        self.assertEqual(self.client.get(reverse(
+            'task_detail', args=[self.task.id])).status_code, 404)
+
+    def test_purge_removes_tasks_in_chunks_then_project(self):
+        """The purge command deletes tasks chunk by chunk."""
+        first, second = self.project.tasks.order_by('id')[:2]
+        TaskDependency.objects.create(
+            project=self.project, predecessor=first, successor=second)
+        self.delete_project()
+        out = StringIO()
+        call_command('purge_deleted_projects', chunk_size=10, stdout=out)
+
+        self.assertIn('10 tasks removed', out.getvalue())
+        self.assertIn('25 tasks removed', out.getvalue())
+        self.assertFalse(Task.objects.filter(
+            project_id=self.project.id).exists())
+        self.assertFalse(TaskDependency.objects.exists())
+        self.assertFalse(
+            Project.all_objects.filter(id=self.project.id).exists())
+
+    def test_interrupted_purge_resumes(self):
+        """Progress is stored per chunk and a rerun finishes the job."""
+        from projects.purge import purge_project
+        self.delete_project()
+
+        # Stop after the first chunk, as if the worker crashed
+        next(purge_project(self.project.id, chunk_size=10))
+        project = Project.all_objects.get(id=self.project.id)
+        self.assertEqual(project.purged_task_count, 10)
+
+        out = StringIO()
+        call_command('purge_deleted_projects', status=True, stdout=out)
+        self.assertIn('10 tasks removed, 15 remaining', out.getvalue())
+
+        call_command('purge_deleted_projects', stdout=StringIO())
+        self.assertFalse(
+            Project.all_objects.filter(id=self.project.id).exists())
+
+
+class ProjectRescheduleTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('owner', password='pass')
+        self.client.login(username='owner', password='pass')
+        today = date.today()
+        self.project = Project.objects.create(
+            name='Slipping', description='', owner=self.user,
+            start_date=today - timedelta(days=10),
+            end_date=today + timedelta(days=10))
+        self.late = self.project.tasks.create(
+            name='Late', start_date=today - timedelta(days=5),
+            end_date=today - timedelta(days=2))
+        self.due = self.project.tasks.create(
+            name='Due soon', end_date=today + timedelta(days=1))
+        self.undated = self.project.tasks.create(name='Undated')
+        self.done = self.project.tasks.create(
+            name='Done', end_date=today - timedelta(days=3))
+        self.done.complete()
+        self.project.tasks.refresh_statuses()
+        self.url = reverse('project_reschedule', args=[self.project.id])
+
+    def test_moves_project_and_task_dates(self):
+        today = date.today()
+        response = self.client.post(self.url, {'days': 7})
+        self.assertRedirects(
+            response, reverse('project_detail', args=[self.project.id]),
+            fetch_redirect_response=False)
+
+        self.project.refresh_from_db()
+        self.assertEqual(self.project.start_date, today - timedelta(days=3))
+        self.assertEqual(self.project.end_date, today + timedelta(days=17))
+        self.late.refresh_from_db()
+        self.assertEqual(self.late.start_date, today + timedelta(days=2))
+        self.assertEqual(self.late.end_date, today + timedelta(days=5))
+        self.undated.refresh_from_db()
+        self.assertIsNone(self.undated.end_date)
+
+    def test_statuses_follow_the_new_dates(self):
+        self.client.post(self.url, {'days': 7})
+        self.late.refresh_from_db()
+        self.assertEqual(self.late.status, 'outstanding')
+
+        self.client.post(self.url, {'days': -14})
+        self.late.refresh_from_db()
+        self.due.refresh_from_db()
+        self.done.refresh_from_db()
+        self.assertEqual(self.late.status, 'overdue')
+        self.assertEqual(self.due.status, 'overdue')
+        # Completed tasks stay completed
+        self.assertEqual(self.done.status, 'completed')
+        rollup = TaskDailyRollup.objects.get(project=self.project)
+        self.assertEqual((rollup.open_count, rollup.overdue_count), (1, 2))
+
+    def test_task_updates_do_not_grow_with_the_project(self):
+        for i in range(20):
+            self.project.tasks.create(name=f'Extra {i}',
+                                      end_date=date.today())
+        with CaptureQueriesContext(connection) as queries:
+            self.client.post(self.url, {'days': 3})
+        task_updates = [query['sql'] for query in queries
+                        if query['sql'].startswith('UPDATE "tasks_task"')]
+        # The move, then at most one status refresh per status
+        self.assertLessEqual(len(task_updates), 3)
+
+    def test_invalid_days_change_nothing(self):
+        for days in ('0', 'soon', '100000'):
+            self.client.post(self.url, {'days': days})
+        self.project.refresh_from_db()
+        self.assertEqual(self.project.start_date,
+                         date.today() - timedelta(days=10))
+        self.assertEqual(self.client.get(self.url).status_code, 405)
+
+    def test_dates_out_of_range_change_nothing(self):
+        far = self.project.tasks.create(
+            name='Far off', end_date=date.max - timedelta(days=3))
+        response = self.client.post(self.url, {'days': 7}, follow=True)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "can&#x27;t be moved that far")
+        far.refresh_from_db()
+        self.assertEqual(far.end_date, date.max - timedelta(days=3))
+        self.project.refresh_from_db()
+        self.assertEqual(self.project.start_date,
+                         date.today() - timedelta(days=10))
+
+        # Far enough back the other way
+        self.undated.start_date = date.min + timedelta(days=3)
+        self.undated.save()
+        self.client.post(self.url, {'days': -7})
+        self.project.refresh_from_db()
+        self.assertEqual(self.project.start_date,
+                         date.today() - timedelta(days=10))
+
+    def test_other_users_cannot_reschedule(self):
+        User.objects.create_user('other', password='pass')
+        self.client.logout()
+        self.client.login(username='other', password='pass')
+        self.assertEqual(
+            self.client.post(self.url, {'days': 7}).status_code, 404)
+
+
+class ProjectCloneTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('owner', password='pass')
+        self.client.login(username='owner', password='pass')
+        self.start = date(2024, 1, 1)
+        self.project = Project.objects.create(
+            name='Launch', description='Every launch', owner=self.user,
+            start_date=self.start, end_date=self.start + timedelta(days=30))
+        self.project.tasks.create(
+            name='Plan', description='Write the plan',
+            start_date=self.start, end_date=self.start + timedelta(days=5))
+        self.project.tasks.create(
+            name='Ship', start_date=self.start + timedelta(days=20),
+            end_date=self.start + timedelta(days=30))
+        self.project.tasks.create(name='Celebrate')
+        close_project(self.project)
+
+    def assert_laid_out_from(self, project, start):
+        self.assertEqual(project.status, 'open')
+        self.assertEqual(project.start_date, start)
+        self.assertEqual(project.end_date, start + timedelta(days=30))
+        tasks = {task.name: task for task in project.tasks.all()}
+        self.assertEqual(set(tasks), {'Plan', 'Ship', 'Celebrate'})
+        self.assertEqual(tasks['Plan'].description, 'Write the plan')
+        self.assertEqual(
+            (tasks['Plan'].start_date, tasks['Plan'].end_date),
+            (start, start + timedelta(days=5)))
+        self.assertEqual(tasks['Ship'].end_date, start + timedelta(days=30))
+        self.assertIsNone(tasks['Celebrate'].end_date)
+        # Statuses start afresh
+        self.assertEqual({task.status for task in tasks.values()},
+                         {'outstanding'})
+        self.assertEqual({task.completed_at for task in tasks.values()},
+                         {None})
+
+    def test_copy_rebases_dates_and_resets_statuses(self):
+        start = date.today() + timedelta(days=7)
+        response = self.client.post(
+            reverse('project_clone', args=[self.project.id]),
+            {'name': 'Launch again', 'start_date': start.isoformat()})
+        clone = Project.objects.get(name='Launch again')
+        self.assertRedirects(
+            response, reverse('project_detail', args=[clone.id]),
+            fetch_redirect_response=False)
+        self.assert_laid_out_from(clone, start)
+
+        # The original is untouched
+        self.project.refresh_from_db()
+        self.assertEqual(self.project.status, 'closed')
+        self.assertEqual(self.project.tasks.count(), 3)
+
+    def test_copy_form(self):
+        response = self.client.get(
+            reverse('project_clone', args=[self.project.id]))
+        self.assertContains(response, 'Copy of Launch')
+
+        response = self.client.post(
+            reverse('project_clone', args=[self.project.id]), {'name': ''})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Project.objects.count(), 1)
+
+    def test_start_dates_stay_in_range(self):
+        """Far-out start dates are form errors, not overflows."""
+        response = self.client.post(
+            reverse('project_clone', args=[self.project.id]),
+            {'name': 'Far out', 'start_date': '9999-12-31'})
+        self.assertContains(response, 'within ten years of today')
+
+        # A task far from its project's start can still overflow
+        self.project.tasks.create(
+            name='Much later', end_date=date(9999, 1, 1))
+        response = self.client.post(
+            reverse('project_clone', args=[self.project.id]),
+            {'name': 'Late', 'start_date': date.today().isoformat()})
+        self.assertContains(response, "can&#x27;t be moved that far")
+        self.assertEqual(Project.objects.count(), 1)
+
+        template = save_as_template(self.project, 'Late template')
+        response = self.client.post(
+            reverse('project_from_template', args=[template.id]),
+            {'name': 'Late', 'start_date': date.today().isoformat()},
+            follow=True)
+        self.assertContains(response, "can&#x27;t be moved that far")
+        self.assertEqual(Project.objects.count(), 1)
+
+    def test_template_round_trip(self):
+        self.client.post(
+            reverse('project_save_template', args=[self.project.id]),
+            {'name': 'Launch template'})
+        template = ProjectTemplate.objects.get()
+        self.assertEqual(template.duration_days, 30)
+        self.assertEqual(template.tasks.count(), 3)
+
+        response = self.client.get(reverse('project_template_list'))
+        self.assertContains(response, 'Launch template')
+        self.assertContains(response, '3 task(s)')
+
+        # Removing the source project doesn't affect the template
+        self.project.tasks.all().delete()
+        start = date.today() + timedelta(days=1)
+        response = self.client.post(
+            reverse('project_from_template', args=[template.id]),
+            {'name': 'From template', 'start_date': start.isoformat()})
+        project = Project.objects.get(name='From template')
+        self.assertRedirects(
+            response, reverse('project_detail', args=[project.id]),
+            fetch_redirect_response=False)
+        self.assert_laid_out_from(project, start)
+
+        self.client.post(
+            reverse('project_template_delete', args=[template.id]))
+        self.assertFalse(ProjectTemplate.objects.exists())
+        self.assertFalse(TaskTemplate.objects.exists())
+
+    def test_copies_are_past_due_when_started_in_the_past(self):
+        clone = clone_project(self.project, 'Old',
+                              date.today() - timedelta(days=60))
+        self.assertEqual(
+            set(clone.tasks.values_list('name', 'status')),
+            {('Plan', 'overdue'), ('Ship', 'overdue'),
+             ('Celebrate', 'outstanding')})
+        rollup = TaskDailyRollup.objects.get(project=clone)
+        self.assertEqual((rollup.open_count, rollup.overdue_count), (1, 2))
+
+    def test_copies_reach_the_change_feed(self):
+        cursor = self.client.get(reverse('sync_changes')).json()['cursor']
+        clone = clone_project(self.project, 'Synced', date.today())
+        page = self.client.get(reverse('sync_changes'),
+                               {'cursor': cursor}).json()
+        self.assertEqual([p['id'] for p in page['projects']], [clone.id])
+        self.assertEqual(len(page['tasks']), 3)
+
+    def test_large_projects_are_copied_in_batches(self):
+        Task.objects.bulk_create([
+            Task(project=self.project, name=f'Step {i}')
+            for i in range(2 * CLONE_BATCH_SIZE)])
+        with CaptureQueriesContext(connection) as queries:
+            clone = clone_project(self.project, 'Big', date.today())
+        self.assertEqual(clone.tasks.count(), 2 * CLONE_BATCH_SIZE + 3)
+        # One keyset page of the source per batch (and the empty last one)
+        reads = [query for query in queries
+                 if query['sql'].startswith('SELECT "tasks_task"."id"')]
+        self.assertEqual(len(reads), 4)
+        # Many rows per INSERT (SQLite caps the parameters per statement)
+        inserts = [query for query in queries
+                   if query['sql'].startswith('INSERT INTO "tasks_task"')]
+        self.assertLess(len(inserts), clone.tasks.count() // 50)
+
+    def test_scoped_to_owner(self):
+        self.client.post(
+            reverse('project_save_template', args=[self.project.id]),
+            {'name': 'Mine'})
+        template = ProjectTemplate.objects.get()
+        User.objects.create_user('other', password='pass')
+        self.client.logout()
+        self.client.login(username='other', password='pass')
+        self.assertEqual(self.client.get(
+            reverse('project_clone', args=[self.project.id])).status_code,
+            404)
+        self.assertEqual(self.client.post(
+            reverse('project_from_template', args=[template.id]),
+            {'name': 'Stolen', 'start_date': '2024-01-01'}).status_code, 404)
+        self.assertNotContains(
+            self.client.get(reverse('project_template_list')), 'Mine')
+
+
+class ChangeFeedTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('owner', password='pass')
+        self.client.login(username='owner', password='pass')
+        self.project = Project.objects.create(
+            name='Synced', description='', owner=self.user,
+            start_date=date.today(), end_date=date.today())
+        self.task = self.project.tasks.create(name='First')
+        self.second = self.project.tasks.create(name='Second')
+
+        # Someone else's changes never show up
+        other = User.objects.create_user('other', password='pass')
+        Project.objects.create(
+            name='Elsewhere', description='', owner=other,
+            start_date=date.today(), end_date=date.today()
+        ).tasks.create(name='Hidden')
+
+    def sync(self, cursor=None, **params):
+        if cursor:
+            params['cursor'] = cursor
+        response = self.client.get(reverse('sync_changes'), params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_first_sync_returns_everything(self):
+        page = self.sync()
+        self.assertEqual([p['name'] for p in page['projects']], ['Synced'])
+        self.assertEqual([t['name'] for t in page['tasks']],
+                         ['First', 'Second'])
+        self.assertEqual(page['deleted'], [])
+        self.assertFalse(page['has_more'])
+
+        # Nothing changed since
+        again = self.sync(page['cursor'])
+        self.assertEqual(again['projects'] + again['tasks'], [])
+        self.assertEqual(again['cursor'], page['cursor'])
+
+    def test_only_changes_after_the_cursor(self):
+        cursor = self.sync()['cursor']
+        self.task.complete()
+        self.project.name = 'Renamed'
+        self.project.save()
+
+        page = self.sync(cursor)
+        self.assertEqual([t['id'] for t in page['tasks']], [self.task.id])
+        self.assertEqual(page['tasks'][0]['status'], 'completed')
+        self.assertEqual([p['name'] for p in page['projects']], ['Renamed'])
+        self.assertGreater(page['projects'][0]['change_seq'],
+                           page['tasks'][0]['change_seq'])
+
+    def test_bulk_changes_reach_the_feed(self):
+        cursor = self.sync()['cursor']
+        close_project(self.project)
+        page = self.sync(cursor)
+        self.assertEqual({t['id'] for t in page['tasks']},
+                         {self.task.id, self.second.id})
+        self.assertEqual({t['status'] for t in page['tasks']},
+                         {'completed'})
+
+    def test_deletions_leave_tombstones(self):
+        cursor = self.sync()['cursor']
+        self.client.post(reverse('task_delete', args=[self.task.id]),
+                         {'password': 'pass'})
+        page = self.sync(cursor)
+        self.assertEqual(
+            [(d['kind'], d['object_id'], d['project_id'])
+             for d in page['deleted']],
+            [('task', self.task.id, self.project.id)])
+
+        self.client.post(
+            reverse('project_confirm_delete', args=[self.project.id]),
+            {'password': 'pass'})
+        page = self.sync(page['cursor'])
+        self.assertEqual(page['projects'], [])
+        self.assertEqual(
+            [(d['kind'], d['object_id']) for d in page['deleted']],
+            [('project', self.project.id)])
+
+    def test_pages_cover_every_change_once(self):
+        close_project(self.project)
+        self.project.tasks.create(name='Third')
+        Task.objects.get(name='Second').delete()
+
+        seen, cursor, pages = [], None, 0
+        while True:
+            page = self.sync(cursor, limit=2)
+            pages += 1
+            seen += [('project', p['id']) for p in page['projects']]
+            seen += [('task', t['id']) for t in page['tasks']]
+            seen += [('deleted', d['object_id']) for d in page['deleted']]
+            cursor = page['cursor']
+            if not page['has_more']:
+                break
+        self.assertEqual(len(seen), len(set(seen)))
+        self.assertEqual(len(seen), 4)
+        self.assertIn(('deleted', self.second.id), seen)
+        self.assertEqual(pages, 2)
+
+    def test_archived_projects_leave_and_come_back(self):
+        self.project.status = 'closed'
+        self.project.save()
+        Project.objects.filter(id=self.project.id).update(
+            closed_at=timezone.now() - timedelta(days=365))
+        cursor = self.sync()['cursor']
+
+        call_command('archive_projects', stdout=StringIO())
+        page = self.sync(cursor)
+        self.assertEqual([(d['kind'], d['object_id'])
+                          for d in page['deleted']],
+                         [('project', self.project.id)])
+
+        restore_project(ArchivedProject.objects.get(id=self.project.id))
+        page = self.sync(page['cursor'])
+        self.assertEqual([p['id'] for p in page['projects']],
+                         [self.project.id])
+        self.assertEqual(len(page['tasks']), 2)
+
+    def test_sync_cost_does_not_grow_with_history(self):
+        cursor = self.sync()['cursor']
+        # session, user, then one query per kind of change
+        with self.assertNumQueries(5):
+            self.sync(cursor)
+
+    def test_invalid_cursor(self):
+        for cursor in ('yesterday', '99999999999999999999999.0.0',
+                       '1.7.1', '1.0.-5'):
+            response = self.client.get(reverse('sync_changes'),
+                                       {'cursor': cursor})
+            self.assertEqual(response.status_code, 400, cursor)
+
+
+class ProjectEventTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('owner', password='pass')
+        self.project = Project.objects.create(
+            name='Live', description='', owner=self.user,
+            start_date=date.today(), end_date=date.today())
+
+    async def test_broker_fans_out_to_project_streams(self):
+        broker = LocalBroker()
+        first = broker.subscribe(1)
+        second = broker.subscribe(1)
+        elsewhere = broker.subscribe(2)
+
+        broker.publish(1, {'type': 'task.created'})
+        self.assertEqual(await first.get(), {'type': 'task.created'})
+        self.assertEqual(await second.get(), {'type': 'task.created'})
+        self.assertTrue(elsewhere.queue.empty())
+
+        for subscription in (first, second):
+            broker.unsubscribe(subscription)
+        self.assertFalse(broker.has_listeners(1))
+        self.assertTrue(broker.has_listeners(2))
+
+    async def test_slow_stream_is_told_to_resync(self):
+        broker = LocalBroker()
+        subscription = broker.subscribe(1)
+        for i in range(QUEUE_SIZE + 1):
+            broker.publish(1, {'type': 'task.updated', 'task_id': i})
+        # call_soon_threadsafe delivers on the next turn of the loop
+        self.assertEqual(await subscription.get(), RESYNC)
+        self.assertTrue(subscription.queue.empty())
+
+    async def test_stream_unsubscribes_when_closed(self):
+        stream = event_stream(self.project.id)
+        self.assertTrue((await anext(stream)).startswith('retry: '))
+        self.assertTrue(get_broker().has_listeners(self.project.id))
+
+        get_broker().publish(self.project.id, {'type': 'project.updated'})
+        self.assertEqual(
+            await anext(stream),
+            'event: project.updated\ndata: {"type": "project.updated"}\n\n')
+
+        await stream.aclose()
+        self.assertFalse(get_broker().has_listeners(self.project.id))
+
+    def test_events_wait_for_commit(self):
+        with mock.patch.object(LocalBroker, 'has_listeners',
+                               return_value=True), \
+                mock.patch.object(LocalBroker, 'publish') as send:
+            with self.captureOnCommitCallbacks() as callbacks:
+                publish(self.project, 'project.updated')
+            send.assert_not_called()
+            for callback in callbacks:
+                callback()
+        send.assert_called_once_with(self.project.id, {
+            'type': 'project.updated', 'project_id': self.project.id})
+
+    def test_project_writes_publish(self):
+        self.client.login(username='owner', password='pass')
+        with mock.patch.object(LocalBroker, 'has_listeners',
+                               return_value=True), \
+                mock.patch.object(LocalBroker, 'publish') as send:
+            with self.captureOnCommitCallbacks(execute=True):
+                close_project(self.project)
+            with self.captureOnCommitCallbacks(execute=True):
+                self.client.post(
+                    reverse('project_confirm_delete',
+                            args=[self.project.id]),
+                    {'password': 'pass'})
+        self.assertEqual(
+            [call.args[1]['type'] for call in send.call_args_list],
+            ['project.closed', 'project.deleted'])
+        self.assertEqual(send.call_args.args[1]['redirect_url'],
+                         reverse('project_list'))
+
+
+@override_settings(PROJECT_SHARDS=['default'])
+class SingleShardTests(TestCase):
+    def test_single_shard_needs_no_directory(self):
+        """Unsharded setups never look up or create shard assignments."""
+        user = User.objects.create_user('solo', password='pass')
+        with self.assertNumQueries(0):
+            self.assertEqual(shard_for_user(user), 'default')
+        self.assertFalse(ShardAssignment.objects.exists())
+
+    def test_delete_owned_clears_every_model(self):
+        """ChangeCounter, keyed on its owner, is deleted with the rest."""
+        user = User.objects.create_user('leaving', password='pass')
+        project = Project.objects.create(
+            name='Leaving', description='', owner=user,
+            start_date=date.today(), end_date=date.today())
+        Task.objects.create(project=project, name='Task')
+        self.assertTrue(ChangeCounter.objects.filter(owner=user).exists())
+
+        _delete_owned('default', user.pk)
+        self.assertFalse(Project.all_objects.filter(owner=user).exists())
+        self.assertFalse(Task.objects.filter(project_id=project.id).exists())
+        self.assertFalse(ChangeCounter.objects.filter(owner=user).exists())
+
+    def test_moving_user_gets_503(self):
+        def view(request):
+            raise ShardMoving(1)
+
+        middleware = ShardMovingMiddleware(lambda request: HttpResponse())
+        request = RequestFactory().get('/')
+        try:
+            view(request)
+        except ShardMoving as exc:
+            response = middleware.process_exception(request, exc)
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'],
+                         str(settings.SHARD_MOVE_RETRY_AFTER))
+
+
+@skipUnless('shard1' in settings.DATABASES,
+            'run with project_management_systems.settings_sharded')
+class SqliteShardTests(TransactionTestCase):
+    """Routing against real SQLite shards (see settings_sharded)."""
+    # The runner sets up every alias named here, even for skipped tests
+    databases = {'default'} | ({'shard1', 'shard2'} & set(settings.DATABASES))
+
+    def setUp(self):
+        self.user = User.objects.create_user('sharded', password='pass')
+        ShardAssignment.objects.create(user=self.user, shard='shard1')
+        self.client.login(username='sharded', password='pass')
+
+    def create_project(self, owner, name='Sharded'):
+        project = Project.objects.create(
+            name=name, description='On a shard', owner=owner,
+            start_date=date.today(), end_date=date.today())
+        Task.objects.create(project=project, name='First task')
+        return project
+
+    def test_rows_are_written_to_owner_shard(self):
+        project = self.create_project(self.user)
+        other = User.objects.create_user('elsewhere', password='pass')
+        ShardAssignment.objects.create(user=other, shard='shard2')
+        other_project = self.create_project(other, 'Elsewhere')
+
+        self.assertTrue(
+            Project.objects.using('shard1').filter(id=project.id).exists())
+        self.assertFalse(
+            Project.objects.using('default').filter(id=project.id).exists())
+        self.assertEqual(Task.objects.using('shard1').count(), 1)
+        # Ids come from one sequence, so they never collide across shards
+        self.assertNotEqual(project.id, other_project.id)
+        self.assertNotEqual(Task.objects.using('shard1').get().id,
+                            Task.objects.using('shard2').get().id)
+
+        response = self.client.get(
+            reverse('project_detail', args=[project.id]))
+        self.assertContains(response, 'First task')
+        # Other users' projects are not found on this user's shard
+        response = self.client.get(
+            reverse('project_detail', args=[other_project.id]))
+        self.assertEqual(response.status_code, 404)
+
+    def test_views_create_and_toggle_on_shard(self):
+        project = self.create_project(self.user)
+        self.client.post(reverse('task_create', args=[project.id]), {
+            'name': 'Second task', 'description': '',
+            'start_date': '', 'end_date': '', 'status': 'outstanding',
+        })
+        self.client.get(reverse('project_toggle_complete', args=[project.id]))
+
+        tasks = Task.objects.using('shard1').filter(project_id=project.id)
+        self.assertEqual(tasks.count(), 2)
+        self.assertFalse(tasks.exclude(status='completed').exists())
+        self.assertTrue(TaskDailyRollup.objects.using('shard1').filter(
+            project_id=project.id, completed=2).exists())
+
+    def test_rebalance_moves_user_rows(self):
+        project = self.create_project(self.user)
+        archived = ArchivedProject.objects.using('shard1').create(
+            id=project.id + 1000, name='Old', description='',
+            owner=self.user, start_date=date.today(),
+            end_date=date.today())
+        Project.objects.filter(id=project.id).using('shard1').update(
+            status='closed')
+
+        out = StringIO()
+        call_command('rebalance_shard', 'sharded', '--to', 'shard2',
+                     stdout=out)
+        self.assertIn('Copied 1 Task rows', out.getvalue())
+
+        self.assertEqual(
+            ShardAssignment.objects.get(user=self.user).shard, 'shard2')
+        self.assertFalse(ShardAssignment.objects.get(user=self.user).moving)
+        self.assertFalse(Project.all_objects.using('shard1').exists())
+        self.assertFalse(Task.objects.using('shard1').exists())
+        self.assertTrue(ArchivedProject.objects.using('shard2').filter(
+            id=archived.id).exists())
+
+        # The same URLs keep working from the new shard
+        response = self.client.get(
+            reverse('project_detail', args=[project.id]))
+        self.assertContains(response, 'First task')
+
+    def test_moving_user_is_asked_to_retry(self):
+        ShardAssignment.objects.filter(user=self.user).update(moving=True)
+        response = self.client.get(reverse('project_list'))
+        self.assertEqual(response.status_code, 503)
+        self.assertIn('Retry-After', response)
+
+    def test_deleting_user_clears_their_shard(self):
+        self.create_project(self.user)
+        self.user.delete()
+        self.assertFalse(Project.all_objects.using('shard1').exists())
+        self.assertFalse(Task.objects.using('shard1').exists())
@@ -1,5 +1,9 @@
+from django.conf import settings
 from django.urls import path
-from . import views
+from . import views, async_views
+
+# Read-only pages come from their async versions under ASGI (ASYNC_VIEWS)
+read_views = async_views if settings.ASYNC_VIEWS else views
 
 # Define the URL patterns for the 'projects' app
 urlpatterns = [
@@ -7,21 +11,78 @@ urlpatterns = [
     path('create/', views.project_create, name='project_create'),
 
     # URL for listing all projects (e.g., /projects/)
-    path('', views.project_list, name='project_list'),
+    path('', read_views.project_list, name='project_list'),
+
+    # URL for searching projects and tasks (e.g., /projects/search/?q=report)
+    path('search/', views.search, name='search'),
+
+    # Changes since a cursor, for sync clients (JSON)
+    path('sync/', views.sync_changes, name='sync_changes'),
 
     # URL for viewing details of a
     # single project by its ID (e.g., /projects/5/)
-    path('<int:project_id>/', views.project_detail, name='project_detail'),
+    path('<int:project_id>/', read_views.project_detail,
+         name='project_detail'),
+
+    # Tasks as a board of status columns, reordered by drag and drop
+    path('<int:project_id>/board/', views.project_board,
+         name='project_board'),
+
+    # Tasks as a Gantt chart with the critical path
+    path('<int:project_id>/schedule/', views.project_schedule,
+         name='project_schedule'),
+
+    # Full description, loaded on demand by "read more" (JSON)
+    path('<int:project_id>/description/', views.project_description,
+         name='project_description'),
 
     # URL for editing a project (e.g., /projects/5/edit/)
     path('<int:project_id>/edit/', views.project_edit, name='project_edit'),
 
+    # Move the project and its tasks by N days (POST)
+    path('<int:project_id>/reschedule/', views.project_reschedule,
+         name='project_reschedule'),
+
+    # Copy a project with all of its tasks (e.g., /projects/5/copy/)
+    path('<int:project_id>/copy/', views.project_clone,
+         name='project_clone'),
+
+    # Saved project templates: save one, list them, start a project from
+    # one, delete one
+    path('<int:project_id>/save_template/', views.project_save_template,
+         name='project_save_template'),
+    path('templates/', views.project_template_list,
+         name='project_template_list'),
+    path('templates/<int:template_id>/use/', views.project_from_template,
+         name='project_from_template'),
+    path('templates/<int:template_id>/delete/',
+         views.project_template_delete, name='project_template_delete'),
+
     # URL for confirming and handling
     # project deletion (e.g., /projects/5/delete/)
     path('<int:project_id>/delete/', views.project_confirm_delete,
          name='project_confirm_delete'),
 
+    # URLs for read-only archived projects (e.g., /projects/archived/5/)
+    path('archived/', views.archived_project_list,
+         name='archived_project_list'),
+    path('archived/<int:project_id>/', views.archived_project_detail,
+         name='archived_project_detail'),
+
     # URL to toggle a project's completion status (mark as complete or reopen)
     path('<int:project_id>/toggle_complete/',
          views.project_toggle_complete, name='project_toggle_complete'),
+
+    # Same toggle for scripts: returns just the updated project card as JSON
+    path('<int:project_id>/toggle_complete/fragment/',
+         views.project_toggle_complete_fragment,
+         name='project_toggle_complete_fragment'),
 ]
+
+if settings.ASYNC_VIEWS:
+    # Live updates for an open project page (Server-Sent Events). Each
+    # stream would hold a whole worker under WSGI, so pages served there
+    # go without
+    urlpatterns.append(
+        path('<int:project_id>/events/', async_views.project_events,
+             name='project_events'))
@@ -9,8 +9,56 @@ from django.contrib import messages
 from django.urls import reverse  # used for safe URL building and redirects.
 # used for safe URL building and redirects.
 from django.utils.http import urlencode
-from .models import Project
-from .forms import ProjectForm
+from django.conf import settings
+# used to split search results into pages.
+from django.core.paginator import Paginator
+from django.http import JsonResponse
+from django.template.loader import render_to_string
+from django.views.decorators.http import require_POST
+from django.views.decorators.gzip import gzip_page
+from django.template.defaultfilters import linebreaksbr
+from django.db.models import Count
+from django.utils import timezone
+from .models import (Project, ArchivedProject, ProjectTemplate,
+                     description_excerpt)
+from .forms import (ProjectForm, RescheduleForm, CopyProjectForm,
+                    ProjectTemplateForm)
+from .search import SearchResults
+from .archive import restore_project
+from .cloning import clone_project, save_as_template, create_from_template
+from .changes import (DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, InvalidCursor,
+                      changes_since)
+from .events import publish
+from .purge import mark_deleted
+from .lifecycle import close_project, reopen_project, reschedule_project
+from .streaming import stream_page, STREAM_CHUNK_SIZE
+from tasks.models import Task
+from tasks.scheduling import duration, ensure_schedule, invalidate_schedule
+from jobs.registry import enqueue, pending_jobs
+
+# Number of search results shown per page
+SEARCH_PAGE_SIZE = 20
+
+# Characters of the project description shown before "Expand"
+DETAIL_EXCERPT_LENGTH = 150
+
+# Columns of the project board, and the cards loaded per column
+BOARD_COLUMNS = [
+    ("outstanding", "Outstanding"),
+    ("overdue", "Overdue"),
+    ("completed", "Completed"),
+]
+BOARD_COLUMN_LIMIT = 200
+
+# Tasks per page of the schedule (critical path) view
+SCHEDULE_PAGE_SIZE = 100
+
+# Shown when copied task dates would fall outside the calendar
+DATES_OUT_OF_RANGE = ("The task dates can't be moved that far; choose "
+                      "another start date.")
+# ... and when rescheduled dates would
+RESCHEDULE_OUT_OF_RANGE = ("The project or task dates can't be moved that "
+                           "far; choose fewer days.")
 
 
 @login_required
@@ -42,18 +90,14 @@ def project_list(request):
     error_project_id = request.GET.get("error_project_id")
     error_message = request.GET.get("error_message")
 
-    # Get all projects belonging to the user
-    projects = Project.objects.filter(
-        owner=request.user).prefetch_related("tasks")
+    # Get all projects belonging to the user, loading only what the cards
+    # show; the task counters are annotated in the same query
+    projects = Project.objects.for_user(request.user).for_list()
 
     # Filter by project status if specified
     if status_filter in ["open", "closed"]:
         projects = projects.filter(status=status_filter)
 
-    # Update task count attributes for display
-    for project in projects:
-        project.update_task_counts()
-
     context = {
         "projects": projects,
         "status_filter": status_filter,
@@ -65,48 +109,155 @@ def project_list(request):
 
 @login_required
 @never_cache
+@gzip_page
 def project_detail(request, project_id):
-    project = get_object_or_404(Project, id=project_id, owner=request.user)
+    # The full description is fetched by the "Expand" toggle on demand
+    project = Project.objects.for_user(request.user).filter(
+        id=project_id).defer('description').annotate(
+        description_excerpt=description_excerpt(DETAIL_EXCERPT_LENGTH)).first()
+    if project is None:
+        # Archived projects keep their id; show the read-only copy
+        archived = get_object_or_404(
+            ArchivedProject.objects.for_user(request.user), id=project_id)
+        return redirect("archived_project_detail", project_id=archived.id)
     status_filter = request.GET.get('status', 'all')
     error_task_id = request.GET.get('error_task_id')
 
+    # Bring overdue/outstanding up to date in bulk, then count once
+    project.tasks.refresh_statuses()
     project.update_task_counts()
 
-    # Filter tasks by status if needed
+    # Filter tasks by status if needed (task cards load only their columns)
+    tasks = project.tasks.for_cards()
     if status_filter == 'completed':
-        tasks = project.tasks.filter(status='completed')
+        tasks = tasks.filter(status='completed')
     elif status_filter == 'outstanding':
-        tasks = project.tasks.filter(status='outstanding')
+        tasks = tasks.filter(status='outstanding')
     elif status_filter == 'overdue':
-        tasks = project.tasks.filter(status='overdue')
+        tasks = tasks.filter(status='overdue')
     else:
-        tasks = project.tasks.all().order_by('start_date')
-
-    # Update each task's status if needed
-    for task in tasks:
-        task.check_status()
-
-    # Extra task stats for UI display
-    completed_count = tasks.filter(status='completed').count()
-    outstanding_count = tasks.filter(status='outstanding').count()
-    overdue_count = tasks.filter(status='overdue').count()
+        tasks = tasks.order_by('start_date')
+
+    # Extra task stats for UI display (counts within the current filter)
+    statuses = ('completed', 'outstanding', 'overdue')
+    counts = {
+        status: (getattr(project, f'{status}_count')
+                 if status_filter not in statuses or status == status_filter
+                 else 0)
+        for status in statuses
+    }
+    shown = sum(counts.values())
 
     context = {
         'project': project,
-        'tasks': tasks,
+        'has_tasks': shown > 0,
         'status_filter': status_filter,
-        'completed_count': completed_count,
-        'outstanding_count': outstanding_count,
-        'overdue_count': overdue_count,
+        'completed_count': counts['completed'],
+        'outstanding_count': counts['outstanding'],
+        'overdue_count': counts['overdue'],
         'error_task_id': error_task_id,
     }
+
+    # Very large projects are streamed: the summary goes out straight away
+    # and the task cards follow in chunks from a server-side iterator
+    threshold = settings.PROJECT_DETAIL_STREAM_THRESHOLD
+    if threshold and shown > threshold:
+        return stream_page(
+            request, 'projects/project_detail.html', context,
+            'tasks/partials/task_card.html',
+            tasks.iterator(chunk_size=STREAM_CHUNK_SIZE), 'task',
+            row_context={'error_task_id': error_task_id})
+
+    context['tasks'] = tasks
     return render(request, 'projects/project_detail.html', context)
 
 
+@login_required
+@never_cache
+def project_board(request, project_id):
+    """
+    The project's tasks as a board with one column per status, each in
+    its saved drag-and-drop order: one range scan of the board index per
+    column.
+    """
+    project = get_object_or_404(
+        Project.objects.for_user(request.user).defer("description"),
+        id=project_id)
+    project.tasks.refresh_statuses()
+    project.update_task_counts()
+
+    columns = [{
+        "status": status,
+        "label": label,
+        "count": getattr(project, f"{status}_count"),
+        "tasks": project.tasks.for_cards().filter(status=status).order_by(
+            "rank", "id")[:BOARD_COLUMN_LIMIT],
+    } for status, label in BOARD_COLUMNS]
+    return render(request, "projects/project_board.html", {
+        "project": project,
+        "columns": columns,
+        "column_limit": BOARD_COLUMN_LIMIT,
+    })
+
+
+@login_required
+@never_cache
+def project_schedule(request, project_id):
+    """
+    The project's tasks in earliest start order as a Gantt chart, with
+    their latest starts and slack; tasks without slack are the critical
+    path. The figures are kept up to date as tasks and dependencies
+    change, and only worked out for the whole project when missing.
+    """
+    project = get_object_or_404(
+        Project.objects.for_user(request.user).defer("description"),
+        id=project_id)
+    ensure_schedule(project)
+
+    tasks = project.tasks.only(
+        "name", "status", "start_date", "end_date", "earliest_start",
+        "latest_start", "slack").order_by("earliest_start", "id")
+    page = Paginator(tasks, SCHEDULE_PAGE_SIZE).get_page(
+        request.GET.get("page"))
+
+    # Bars are laid out as percentages of the project's length
+    span = max((project.end_date - project.start_date).days + 1, 1)
+    for task in page:
+        days = duration(task.start_date, task.end_date)
+        offset = (task.earliest_start - project.start_date).days
+        task.bar_offset = min(max(offset * 100 / span, 0), 100)
+        task.bar_width = max(min(days * 100 / span, 100 - task.bar_offset),
+                             0.5)
+    return render(request, "projects/project_schedule.html", {
+        "project": project,
+        "page": page,
+        "critical_count": project.tasks.filter(slack__lte=0).count(),
+    })
+
+
+@login_required
+@never_cache
+def project_description(request, project_id):
+    """
+    Full project description for the "read more" / "Expand" toggles;
+    list and detail pages only load an excerpt.
+    """
+    description = get_object_or_404(
+        Project.objects.for_user(request.user).values_list(
+            "description", flat=True),
+        id=project_id)
+    return JsonResponse({
+        "id": project_id,
+        "description": description,
+        "html": linebreaksbr(description),
+    })
+
+
 @login_required
 @never_cache
 def project_edit(request, project_id):
-    project = get_object_or_404(Project, id=project_id, owner=request.user)
+    project = get_object_or_404(
+        Project.objects.for_user(request.user), id=project_id)
 
     # Support redirecting back to where user came from
     redirect_to = request.GET.get('next', reverse(
@@ -116,6 +267,11 @@ def project_edit(request, project_id):
         form = ProjectForm(request.POST, instance=project)
         if form.is_valid():
             project = form.save()
+            if {"start_date", "end_date"} & set(form.changed_data):
+                # Every task's figures start or end from the project's
+                # dates: work them out afresh when next needed
+                invalidate_schedule(project)
+            publish(project, "project.updated")
             messages.success(
                 request, f"Project '{project.name}' updated successfully!")
             return redirect(redirect_to)
@@ -126,10 +282,149 @@ def project_edit(request, project_id):
                   {'form': form, 'project': project, 'next': redirect_to})
 
 
+@login_required
+@never_cache
+@require_POST
+def project_reschedule(request, project_id):
+    """
+    Move the project and all of its tasks by a number of days, instead of
+    editing every task's dates one by one.
+    """
+    project = get_object_or_404(
+        Project.objects.for_user(request.user), id=project_id)
+    form = RescheduleForm(request.POST)
+    if not form.is_valid():
+        for errors in form.errors.values():
+            for error in errors:
+                messages.error(request, error)
+        return redirect("project_detail", project_id=project.id)
+
+    days = form.cleaned_data["days"]
+    try:
+        moved = reschedule_project(project, days)
+    except OverflowError:
+        # A date would move past year 9999 (or before year 1)
+        messages.error(request, RESCHEDULE_OUT_OF_RANGE)
+        return redirect("project_detail", project_id=project.id)
+    direction = "later" if days > 0 else "earlier"
+    messages.success(
+        request,
+        f"Project '{project.name}' and {moved} task(s) moved "
+        f"{abs(days)} day(s) {direction}.")
+    return redirect("project_detail", project_id=project.id)
+
+
+@login_required
+@never_cache
+def project_clone(request, project_id):
+    """
+    Copy a project and all of its tasks, with the dates moved to a new
+    start date and every task starting afresh.
+    """
+    project = get_object_or_404(
+        Project.objects.for_user(request.user), id=project_id)
+
+    if request.method == "POST":
+        form = CopyProjectForm(request.POST)
+        if form.is_valid():
+            try:
+                clone = clone_project(project, form.cleaned_data["name"],
+                                      form.cleaned_data["start_date"])
+            except OverflowError:
+                # A task far from the project's start moved past year 9999
+                form.add_error("start_date", DATES_OUT_OF_RANGE)
+            else:
+                messages.success(
+                    request, f"Project '{project.name}' copied to "
+                             f"'{clone.name}'.")
+                return redirect("project_detail", project_id=clone.id)
+    else:
+        form = CopyProjectForm(initial={
+            "name": f"Copy of {project.name}"[:200],
+            "start_date": timezone.now().date(),
+        })
+
+    return render(request, "projects/project_clone.html",
+                  {"form": form, "project": project})
+
+
+@login_required
+@never_cache
+@require_POST
+def project_save_template(request, project_id):
+    # Save the project's structure (description, length, tasks) for reuse
+    project = get_object_or_404(
+        Project.objects.for_user(request.user), id=project_id)
+    form = ProjectTemplateForm(request.POST)
+    if not form.is_valid():
+        messages.error(request, "Please give the template a name.")
+        return redirect("project_detail", project_id=project.id)
+
+    template = save_as_template(project, form.cleaned_data["name"])
+    messages.success(
+        request, f"Project '{project.name}' saved as template "
+                 f"'{template.name}'.")
+    return redirect("project_template_list")
+
+
+@login_required
+@never_cache
+def project_template_list(request):
+    # Newest templates first, each with its number of tasks
+    templates = ProjectTemplate.objects.for_user(request.user).annotate(
+        task_count=Count("tasks")).order_by("-created_at", "-id")
+    return render(request, "projects/project_template_list.html", {
+        "templates": templates,
+        "form": CopyProjectForm(
+            initial={"start_date": timezone.now().date()}),
+    })
+
+
+@login_required
+@never_cache
+@require_POST
+def project_from_template(request, template_id):
+    template = get_object_or_404(
+        ProjectTemplate.objects.for_user(request.user), id=template_id)
+    form = CopyProjectForm(request.POST)
+    if not form.is_valid():
+        if form.data.get("start_date") and form.has_error("start_date"):
+            messages.error(request, form.errors["start_date"][0])
+        else:
+            messages.error(
+                request,
+                "Please enter a name and a start date for the project.")
+        return redirect("project_template_list")
+
+    try:
+        project = create_from_template(
+            template, form.cleaned_data["name"],
+            form.cleaned_data["start_date"])
+    except OverflowError:
+        messages.error(request, DATES_OUT_OF_RANGE)
+        return redirect("project_template_list")
+    messages.success(
+        request, f"Project '{project.name}' created from template "
+                 f"'{template.name}'.")
+    return redirect("project_detail", project_id=project.id)
+
+
+@login_required
+@never_cache
+@require_POST
+def project_template_delete(request, template_id):
+    template = get_object_or_404(
+        ProjectTemplate.objects.for_user(request.user), id=template_id)
+    template.delete()
+    messages.success(request, f"Template '{template.name}' deleted.")
+    return redirect("project_template_list")
+
+
 @login_required
 @never_cache
 def project_confirm_delete(request, project_id):
-    project = get_object_or_404(Project, id=project_id, owner=request.user)
+    project = get_object_or_404(
+        Project.objects.for_user(request.user), id=project_id)
 
     if request.method == "POST":
         password = request.POST.get("password", "")
@@ -142,7 +437,12 @@ def project_confirm_delete(request, project_id):
             })
             return redirect(f"{reverse('project_list')}?{query_params}")
 
-        project.delete()
+        # Hide the project now; its tasks are purged in the background
+        mark_deleted(project)
+        publish(project, "project.deleted",
+                redirect_url=reverse("project_list"))
+        enqueue("projects.purge", owner=request.user, project_id=project.id,
+                owner_id=request.user.id)
         messages.success(
             request, f"Project '{project.name}' deleted successfully!")
         return redirect("project_list")
@@ -150,36 +450,157 @@ def project_confirm_delete(request, project_id):
     return redirect("project_list")
 
 
+def _get_toggle_project(request, project_id):
+    project = Project.objects.for_user(request.user).filter(
+        id=project_id).first()
+    if project is None:
+        # Reopening an archived project brings it back to the live tables
+        archived = get_object_or_404(
+            ArchivedProject.objects.for_user(request.user), id=project_id)
+        project = restore_project(archived)
+    return project
+
+
+def _toggle_project(request, project):
+    """
+    Close or reopen a project, handing large projects to the background
+    worker. Returns the (level, text) messages describing what happened.
+    """
+    # Large projects are closed/reopened by the background worker
+    task_count = project.tasks.count()
+    if task_count > settings.JOBS_INLINE_TASK_LIMIT:
+        job_name = ("projects.close" if project.status == "open"
+                    else "projects.reopen")
+        if pending_jobs(project_id=project.id).exists():
+            return [(messages.INFO,
+                     f'Project "{project.name}" is already being updated.')]
+        job = enqueue(job_name, owner=request.user, project_id=project.id,
+                      owner_id=request.user.id)
+        action = "closed" if project.status == "open" else "reopened"
+        return [(messages.INFO,
+                 f'Project "{project.name}" ({task_count} tasks) is being '
+                 f'{action} in the background (job {job.id}).')]
+
+    if project.status == "open":
+        close_project(project)
+        return [(messages.SUCCESS,
+                 f'Project "{project.name}" and all tasks marked as '
+                 f'completed.')]
+
+    # Reopen project and restore original task statuses
+    reopen_project(project)
+    return [(messages.SUCCESS,
+             f'Project "{project.name}" and all tasks reopened.')]
+
+
 @login_required
 @never_cache
 def project_toggle_complete(request, project_id):
-    project = get_object_or_404(Project, id=project_id, owner=request.user)
+    project = _get_toggle_project(request, project_id)
 
-    if project.status == "open":
-        # Store current task statuses before marking all complete
-        task_statuses = {
-            str(task.id): task.status for task in project.tasks.all()}
-        project.previous_task_statuses = task_statuses
-        project.status = "closed"
-        project.save()
+    for level, text in _toggle_project(request, project):
+        messages.add_message(request, level, text)
 
-        # Mark all tasks as completed
-        project.tasks.update(status="completed")
+    return redirect("project_list")
 
-        messages.success(
-            request,
-            f'Project "{project.name}" and all tasks marked as completed.'
-        )
+
+@login_required
+@never_cache
+@require_POST
+def project_toggle_complete_fragment(request, project_id):
+    """
+    Toggle a project and return only its re-rendered card, instead of
+    redirecting to a full project_list render.
+    """
+    project = _get_toggle_project(request, project_id)
+    notes = _toggle_project(request, project)
+
+    # Re-read the card's columns the same way project_list does
+    project = Project.objects.for_user(request.user).for_list().get(
+        id=project.id)
+    html = render_to_string("projects/partials/project_card.html", {
+        "project": project,
+    }, request=request)
+    return JsonResponse({
+        "project_id": project.id,
+        "status": project.status,
+        "html": html,
+        "messages": [text for level, text in notes],
+    })
+
+
+@login_required
+@never_cache
+def archived_project_list(request):
+    # Archived projects are read-only; the list shows the newest first
+    projects = ArchivedProject.objects.for_user(
+        request.user).order_by("-archived_at")
+    return render(request, "projects/archived_project_list.html",
+                  {"projects": projects})
+
+
+@login_required
+@never_cache
+def archived_project_detail(request, project_id):
+    project = get_object_or_404(
+        ArchivedProject.objects.for_user(request.user), id=project_id)
+    tasks = project.tasks.all().order_by("start_date")
+    return render(request, "projects/archived_project_detail.html",
+                  {"project": project, "tasks": tasks})
+
+
+@login_required
+@never_cache
+def search(request):
+    query = request.GET.get("q", "").strip()
+    # Which result list to page through: projects or tasks
+    result_type = request.GET.get("type", "projects")
+    if result_type not in ["projects", "tasks"]:
+        result_type = "projects"
+
+    project_results = SearchResults(Project, request.user, query)
+    task_results = SearchResults(Task, request.user, query)
+
+    results = project_results if result_type == "projects" else task_results
+    paginator = Paginator(results, SEARCH_PAGE_SIZE)
+    page = paginator.get_page(request.GET.get("page"))
+
+    # Counts for both tabs, but only the selected page is loaded
+    if result_type == "projects":
+        project_count = paginator.count
+        task_count = task_results.count()
     else:
-        # Reopen project and restore original task statuses
-        project.status = "open"
-        project.save()
-        prev_statuses = project.previous_task_statuses or {}
-        for task in project.tasks.all():
-            task.status = prev_statuses.get(str(task.id), "outstanding")
-            task.save()
+        project_count = project_results.count()
+        task_count = paginator.count
 
-        messages.success(
-            request, f'Project "{project.name}" and all tasks reopened.')
+    context = {
+        "query": query,
+        "result_type": result_type,
+        "page": page,
+        "project_count": project_count,
+        "task_count": task_count,
+        # Counts stop at the limit, which the tabs show as "1000+"
+        "count_limit": SearchResults.COUNT_LIMIT,
+    }
+    return render(request, "projects/search_results.html", context)
 
-    return redirect("project_list")
+
+@login_required
+@never_cache
+def sync_changes(request):
+    """
+    Change feed for desktop and mobile clients (JSON): projects and tasks
+    created or changed, and those deleted, since ?cursor=. Without a cursor
+    it starts from the beginning; keep calling with the returned cursor
+    while has_more is true.
+    """
+    try:
+        limit = int(request.GET.get('limit', DEFAULT_PAGE_SIZE))
+    except ValueError:
+        limit = DEFAULT_PAGE_SIZE
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    try:
+        page = changes_since(request.user, request.GET.get('cursor'), limit)
+    except InvalidCursor:
+        return JsonResponse({'error': 'Invalid cursor.'}, status=400)
+    return JsonResponse(page)
@@ -0,0 +1,92 @@
+// Drag and drop for the project board (projects/project_board.html).
+// A dropped card is placed between its new neighbours straight away and
+// the move is POSTed with their ids; the server gives the card a rank
+// between theirs, updating only that task. If the board was out of date,
+// or the task lands in another column than the one it was dropped on
+// (open tasks are outstanding or overdue by their end date), the page
+// reloads.
+(function () {
+    const board = document.querySelector("[data-board]");
+    if (!board || !window.fetch) {
+        return;
+    }
+    let dragged = null;
+
+    function csrfToken() {
+        const match = document.cookie.match(/(?:^|;\s*)csrftoken=([^;]+)/);
+        if (match) {
+            return decodeURIComponent(match[1]);
+        }
+        const input = document.querySelector("input[name=csrfmiddlewaretoken]");
+        return input ? input.value : "";
+    }
+
+    // The card the dragged one goes before, from the pointer position
+    function cardBelow(column, y) {
+        const cards = column.querySelectorAll("[data-task-id]:not(.dragging)");
+        for (const card of cards) {
+            const box = card.getBoundingClientRect();
+            if (y < box.top + box.height / 2) {
+                return card;
+            }
+        }
+        return null;
+    }
+
+    board.addEventListener("dragstart", function (event) {
+        dragged = event.target.closest("[data-task-id]");
+        if (dragged) {
+            dragged.classList.add("dragging");
+            event.dataTransfer.effectAllowed = "move";
+        }
+    });
+    board.addEventListener("dragend", function () {
+        if (dragged) {
+            dragged.classList.remove("dragging");
+        }
+    });
+    board.addEventListener("dragover", function (event) {
+        if (dragged && event.target.closest("[data-column]")) {
+            event.preventDefault();
+        }
+    });
+    board.addEventListener("drop", function (event) {
+        const column = event.target.closest("[data-column]");
+        if (!dragged || !column) {
+            return;
+        }
+        event.preventDefault();
+        const next = cardBelow(column, event.clientY);
+        column.insertBefore(dragged, next);
+
+        const previous = dragged.previousElementSibling;
+        const body = new URLSearchParams({
+            column: column.dataset.column,
+            before: previous ? previous.dataset.taskId : "",
+            after: next ? next.dataset.taskId : "",
+        });
+        fetch(dragged.dataset.moveUrl, {
+            method: "POST",
+            credentials: "same-origin",
+            headers: { "X-CSRFToken": csrfToken() },
+            body: body,
+        })
+            .then(function (response) {
+                if (!response.ok) {
+                    throw new Error(response.status);
+                }
+                return response.json();
+            })
+            .then(function (data) {
+                if (data.status !== column.dataset.column) {
+                    window.location.reload();
+                    return;
+                }
+                Object.keys(data.counts).forEach(function (name) {
+                    document.querySelectorAll('[data-counter="' + name + '"]')
+                        .forEach(function (el) { el.textContent = data.counts[name]; });
+                });
+            })
+            .catch(function () { window.location.reload(); });
+    });
+})();
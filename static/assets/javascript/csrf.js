@@ -0,0 +1,27 @@
+// Public pages (homepage, login, register) are served from a shared page
+// cache, so their forms are rendered without a CSRF token. Fill the empty
+// token inputs from this visitor's CSRF cookie, or ask the server for a
+// token (which also sets the cookie) when there is none yet.
+(function () {
+    const script = document.currentScript;
+
+    function fill(token) {
+        document.querySelectorAll("input[data-csrf-fill]").forEach(function (input) {
+            input.value = token;
+        });
+    }
+
+    document.addEventListener("DOMContentLoaded", function () {
+        if (!document.querySelector("input[data-csrf-fill]")) {
+            return;
+        }
+        const match = document.cookie.match(/(?:^|;\s*)csrftoken=([^;]+)/);
+        if (match) {
+            fill(decodeURIComponent(match[1]));
+            return;
+        }
+        fetch(script.dataset.csrfUrl, { credentials: "same-origin" })
+            .then(function (response) { return response.json(); })
+            .then(function (data) { fill(data.token); });
+    });
+})();
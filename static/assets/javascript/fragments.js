@@ -0,0 +1,177 @@
+// Progressive enhancement for the project and task cards.
+// - Links carrying a data-fragment-url are POSTed to their fragment endpoint
+//   and only the affected card (plus the project counters) is swapped in.
+//   A 409 means another request changed the item first: the current card
+//   is swapped in and the reason shown.
+// - "Read more" links fetch the full description in place of the excerpt.
+// - A page with a data-events-url listens to the project's event stream
+//   and fetches the cards other tabs and people change.
+// Without JavaScript the plain hrefs still do a full page round trip.
+(function () {
+    // Read the CSRF token from the cookie, or from any rendered form
+    function csrfToken() {
+        const match = document.cookie.match(/(?:^|;\s*)csrftoken=([^;]+)/);
+        if (match) {
+            return decodeURIComponent(match[1]);
+        }
+        const input = document.querySelector("input[name=csrfmiddlewaretoken]");
+        return input ? input.value : "";
+    }
+
+    // Badge markup matching project_detail.html
+    function statusBadge(status) {
+        if (status === "open") {
+            return '<span class="badge bg-success mb-3">Open</span>';
+        }
+        return '<span class="badge bg-secondary mb-3">Closed</span>';
+    }
+
+    function applyFragment(data) {
+        const cardId = data.task_id !== undefined
+            ? "task-card-" + data.task_id
+            : "project-card-" + data.project_id;
+        const card = document.getElementById(cardId);
+        if (card) {
+            // Drop the card if it no longer matches the active status filter
+            const row = card.closest("[data-status-filter]");
+            const filter = row ? row.dataset.statusFilter : "all";
+            if (filter && filter !== "all" && filter !== data.status) {
+                card.remove();
+            } else {
+                card.outerHTML = data.html;
+            }
+        } else if (data.html && data.task_id !== undefined) {
+            // A task created elsewhere: add it if the filter shows it
+            const row = document.querySelector("[data-status-filter]");
+            if (!row) {
+                // The page has no task list yet
+                window.location.reload();
+                return;
+            }
+            const filter = row.dataset.statusFilter;
+            if (filter === "all" || filter === data.status) {
+                row.insertAdjacentHTML("beforeend", data.html);
+            }
+        }
+
+        // Refresh the project counters shown on the detail page
+        if (data.counts) {
+            Object.keys(data.counts).forEach(function (name) {
+                document.querySelectorAll('[data-counter="' + name + '"]')
+                    .forEach(function (el) { el.textContent = data.counts[name]; });
+            });
+        }
+        if (data.project_status) {
+            document.querySelectorAll("[data-project-status]").forEach(function (el) {
+                el.dataset.projectStatus = data.project_status;
+                el.innerHTML = statusBadge(data.project_status);
+            });
+        }
+    }
+
+    // Swap a card's description excerpt for the full text
+    document.addEventListener("click", function (event) {
+        const link = event.target.closest("a[data-read-more]");
+        const target = link && link.closest("[data-description-url]");
+        if (!target || event.defaultPrevented || !window.fetch) {
+            return;
+        }
+        event.preventDefault();
+
+        fetch(target.dataset.descriptionUrl, { credentials: "same-origin" })
+            .then(function (response) {
+                if (!response.ok) {
+                    throw new Error(response.status);
+                }
+                return response.json();
+            })
+            .then(function (data) { target.innerHTML = data.html; })
+            .catch(function () { window.location.href = link.href; });
+    });
+
+    document.addEventListener("click", function (event) {
+        const link = event.target.closest("a[data-fragment-url]");
+        // The inline confirm() handlers cancel the event when declined
+        if (!link || event.defaultPrevented || !window.fetch) {
+            return;
+        }
+        event.preventDefault();
+
+        fetch(link.dataset.fragmentUrl, {
+            method: "POST",
+            headers: {
+                "X-CSRFToken": csrfToken(),
+                "X-Requested-With": "XMLHttpRequest",
+            },
+            credentials: "same-origin",
+        })
+            .then(function (response) {
+                if (!response.ok && response.status !== 409) {
+                    throw new Error(response.status);
+                }
+                return response.json().then(function (data) {
+                    applyFragment(data);
+                    if (response.status === 409) {
+                        window.alert(data.messages.join("\n"));
+                    }
+                });
+            })
+            .catch(function () {
+                // The toggle may already have happened, so reload
+                // rather than replaying the link
+                window.location.reload();
+            });
+    });
+
+    // Live updates from the project's event stream (ASGI deployments)
+    const live = document.querySelector("[data-events-url]");
+    if (live && window.EventSource && window.fetch) {
+        const events = new EventSource(live.dataset.eventsUrl);
+        let dropped = false;
+
+        // Events sent while the stream was down are lost: start afresh
+        events.addEventListener("error", function () { dropped = true; });
+        events.addEventListener("open", function () {
+            if (dropped) {
+                window.location.reload();
+            }
+        });
+        events.addEventListener("resync", function () {
+            window.location.reload();
+        });
+
+        ["task.created", "task.updated", "task.toggled"].forEach(function (type) {
+            events.addEventListener(type, function (event) {
+                const data = JSON.parse(event.data);
+                fetch(data.card_url, { credentials: "same-origin" })
+                    .then(function (response) {
+                        if (!response.ok) {
+                            throw new Error(response.status);
+                        }
+                        return response.json();
+                    })
+                    .then(applyFragment)
+                    .catch(function () { window.location.reload(); });
+            });
+        });
+        events.addEventListener("task.deleted", function (event) {
+            const data = JSON.parse(event.data);
+            const card = document.getElementById("task-card-" + data.task_id);
+            if (card) {
+                card.remove();
+            }
+            applyFragment({ counts: data.counts });
+        });
+
+        // Project-wide changes (edits, close/reopen of every task, bulk
+        // actions on many tasks)
+        ["project.updated", "project.closed", "project.reopened", "task.bulk"].forEach(function (type) {
+            events.addEventListener(type, function () {
+                window.location.reload();
+            });
+        });
+        events.addEventListener("project.deleted", function (event) {
+            window.location.href = JSON.parse(event.data).redirect_url;
+        });
+    }
+})();
@@ -0,0 +1,50 @@
+"""
+Async versions of the read-only task pages, served instead of the sync
+views when settings.ASYNC_VIEWS is on (see projects/async_views.py).
+"""
+from asgiref.sync import sync_to_async
+from django.http import Http404
+from django.shortcuts import render
+
+from core.decorators import async_login_required, async_never_cache
+from projects.sharding import ashard_for_user
+from .models import Task, TaskRecurrence
+from .views import (_agenda_context, _agenda_recurrences, _agenda_tasks,
+                    _agenda_window, _predecessors, _successors)
+
+
+@async_login_required
+@async_never_cache
+async def task_detail(request, task_id):
+    await ashard_for_user(request.user)
+    try:
+        # The project comes in the same query (for_user joins it)
+        task = await Task.objects.for_user(request.user).aget(id=task_id)
+    except Task.DoesNotExist:
+        raise Http404("No Task matches the given query.")
+
+    await sync_to_async(task.check_status)()  # Refresh status before showing
+
+    return render(request, 'tasks/task_detail.html', {
+        'task': task,
+        'error_task_id': request.GET.get('error_task_id', ''),
+        'predecessors': [other async for other in _predecessors(task)],
+        'successors': [other async for other in _successors(task)],
+        'recurrence': await TaskRecurrence.objects.using(
+            task._state.db).filter(id=task.recurrence_id).afirst()
+        if task.recurrence_id else None,
+    })
+
+
+@async_login_required
+@async_never_cache
+async def agenda(request):
+    today, start, end, days = _agenda_window(request)
+    await ashard_for_user(request.user)
+    tasks = _agenda_tasks(request.user, start, end)
+    tasks = [task async for task in tasks]
+    recurrences = [recurrence async for recurrence in _agenda_recurrences(
+        request.user, start, end)]
+    return render(request, 'tasks/agenda.html',
+                  _agenda_context(tasks, today, start, end, days,
+                                  recurrences))
@@ -0,0 +1,153 @@
+"""
+The daily deadline digest: one email per user listing their open tasks
+due within settings.DIGEST_DUE_DAYS and those that went overdue
+yesterday, across all of their projects.
+
+send_digests() works through each shard's project owners in keyset
+batches of DIGEST_BATCH_SIZE owner ids, read in order from the project
+owner index, so no more than one batch of users (and their due tasks) is
+ever held in memory. Each batch costs a handful of queries: the owners
+already sent today's digest, one range scan of their projects' tasks by
+end date (task_project_end_date_idx), and their email addresses.
+
+Every message of a run goes through one open email connection. A
+DigestLog row per user and day records what was sent: a rerun on the
+same day skips those users, so after a failure it carries on with the
+rest. Each batch is logged once it is sent; a failure in between means
+that batch is sent again by the rerun.
+"""
+from datetime import timedelta
+from itertools import groupby
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.mail import EmailMessage, get_connection
+from django.template.loader import render_to_string
+from django.urls import reverse
+from django.utils import timezone
+
+from projects.models import Project
+from projects.sharding import shard_aliases
+from .models import DigestLog, Task
+
+# Owners handled per batch
+DIGEST_BATCH_SIZE = 500
+
+# Tasks listed per email; the rest are only counted
+DIGEST_MAX_TASKS = 50
+
+
+def digest_window(today):
+    """(first, last) end dates listed: from yesterday (newly overdue)."""
+    return (today - timedelta(days=1),
+            today + timedelta(days=settings.DIGEST_DUE_DAYS))
+
+
+def owner_batches(using, batch_size=DIGEST_BATCH_SIZE):
+    """Ids of the owners of live projects on `using`, a batch at a time."""
+    last_id = 0
+    while True:
+        owner_ids = list(
+            Project.objects.using(using).filter(owner_id__gt=last_id)
+            .order_by('owner_id').values_list('owner_id', flat=True)
+            .distinct()[:batch_size])
+        if not owner_ids:
+            return
+        last_id = owner_ids[-1]
+        yield owner_ids
+
+
+def _due_tasks(using, owner_ids, first, last):
+    # Open tasks of the owners' live projects due in the window, grouped
+    # by owner; each project's tasks are one range scan of its end dates
+    return (Task.objects.using(using)
+            .filter(project__owner_id__in=owner_ids,
+                    project__deleted_at__isnull=True,
+                    end_date__range=(first, last))
+            .exclude(status='completed')
+            .order_by('project__owner_id', 'end_date', 'project_id', 'id')
+            .values_list('project__owner_id', 'id', 'name', 'end_date',
+                         'project__name', named=True)
+            .iterator(chunk_size=2000))
+
+
+def _message(user, tasks, today):
+    """The digest email for `user` listing `tasks` (named value rows)."""
+    overdue = [task for task in tasks if task.end_date < today]
+    due = [task for task in tasks if task.end_date >= today]
+    context = {
+        'user': user,
+        'today': today,
+        'overdue': overdue[:DIGEST_MAX_TASKS],
+        'due': due[:max(DIGEST_MAX_TASKS - len(overdue), 0)],
+        'more': max(len(tasks) - DIGEST_MAX_TASKS, 0),
+        'site_url': settings.SITE_URL.rstrip('/'),
+        'agenda_path': reverse('agenda'),
+    }
+    if overdue:
+        subject = (f"{len(overdue)} task(s) went overdue, "
+                   f"{len(due)} due soon")
+    else:
+        subject = f"{len(due)} task(s) due soon"
+    return EmailMessage(
+        subject=subject,
+        body=render_to_string('tasks/email/deadline_digest.txt', context),
+        to=[user.email])
+
+
+def send_digest_batch(using, owner_ids, today, connection):
+    """
+    Send today's digest to the owners `owner_ids` on `using` who have
+    tasks in the window and haven't had it yet, and log it. Returns the
+    number of emails sent.
+    """
+    sent_already = set(DigestLog.objects.using(using).filter(
+        owner_id__in=owner_ids, day=today).values_list(
+        'owner_id', flat=True))
+    owner_ids = [owner_id for owner_id in owner_ids
+                 if owner_id not in sent_already]
+    if not owner_ids:
+        return 0
+
+    tasks = {
+        owner_id: list(rows)
+        for owner_id, rows in groupby(
+            _due_tasks(using, owner_ids, *digest_window(today)),
+            key=lambda row: row.project__owner_id)}
+    if not tasks:
+        return 0
+    users = (User.objects.filter(id__in=tasks, is_active=True)
+             .exclude(email='').only('id', 'email', 'username',
+                                     'first_name'))
+    messages = {user.id: _message(user, tasks[user.id], today)
+                for user in users}
+    if not messages:
+        return 0
+
+    connection.send_messages(list(messages.values()))
+    DigestLog.objects.using(using).bulk_create(
+        [DigestLog(owner_id=owner_id, day=today,
+                   task_count=len(tasks[owner_id]))
+         for owner_id in messages],
+        ignore_conflicts=True)
+    return len(messages)
+
+
+def send_digests(today=None, batch_size=DIGEST_BATCH_SIZE):
+    """
+    Send today's digest to every user with open tasks due soon or newly
+    overdue, shard by shard, over one email connection, and drop log
+    entries older than settings.DIGEST_LOG_KEEP_DAYS. Returns the number
+    of emails sent.
+    """
+    today = today or timezone.now().date()
+    sent = 0
+    with get_connection() as connection:
+        for using in shard_aliases():
+            for owner_ids in owner_batches(using, batch_size):
+                sent += send_digest_batch(
+                    using, owner_ids, today, connection)
+    cutoff = today - timedelta(days=settings.DIGEST_LOG_KEEP_DAYS)
+    for using in shard_aliases():
+        DigestLog.objects.using(using).filter(day__lt=cutoff).delete()
+    return sent
@@ -1,9 +1,23 @@
 from django import forms
 from django.utils import timezone
-from .models import Task
+from .models import Task, TaskRecurrence
 
 
 class TaskForm(forms.ModelForm):
+    # Optional recurrence: the task becomes the first occurrence
+    repeat = forms.ChoiceField(
+        choices=[('', 'Does not repeat')] + TaskRecurrence.FREQUENCY_CHOICES,
+        required=False,
+        widget=forms.Select(attrs={'class': 'form-control'}))
+    repeat_every = forms.IntegerField(
+        min_value=1, max_value=365, initial=1, required=False,
+        help_text="Days, weeks or months between occurrences.",
+        widget=forms.NumberInput(attrs={'class': 'form-control'}))
+    repeat_until = forms.DateField(
+        required=False, help_text="Leave empty to repeat indefinitely.",
+        widget=forms.DateInput(attrs={'type': 'date',
+                                      'class': 'form-control'}))
+
     class Meta:
         model = Task
         fields = ['name', 'description', 'start_date', 'end_date', 'status']
@@ -48,6 +62,48 @@ class TaskForm(forms.ModelForm):
 
         return end_date
 
+    def clean(self):
+        """
+        A repeating task needs a start date for its occurrences to follow,
+        and must not last longer than TaskRecurrence.MAX_DURATION_DAYS.
+        """
+        cleaned_data = super().clean()
+        start_date = cleaned_data.get('start_date')
+        end_date = cleaned_data.get('end_date')
+        if cleaned_data.get('repeat'):
+            if not start_date:
+                self.add_error(
+                    'start_date', "A repeating task needs a start date.")
+            elif end_date and ((end_date - start_date).days
+                               > TaskRecurrence.MAX_DURATION_DAYS):
+                self.add_error(
+                    'end_date', "A repeating task can last a year at most.")
+            until = cleaned_data.get('repeat_until')
+            if start_date and until and until < start_date:
+                self.add_error(
+                    'repeat_until',
+                    "Repeat until cannot be before the start date.")
+        return cleaned_data
+
+    def recurrence(self, task):
+        """
+        The unsaved TaskRecurrence repeating `task` as chosen in the form,
+        or None for a one-off task.
+        """
+        frequency = self.cleaned_data.get('repeat')
+        if not frequency:
+            return None
+        return TaskRecurrence(
+            project=task.project, name=task.name,
+            description=task.description, frequency=frequency,
+            interval=self.cleaned_data.get('repeat_every') or 1,
+            starts_on=task.start_date,
+            ends_on=self.cleaned_data.get('repeat_until'),
+            duration_days=((task.end_date - task.start_date).days
+                           if task.end_date else None),
+            # The task itself is the first occurrence
+            materialized_until=task.start_date)
+
     def __init__(self, *args, **kwargs):
         """
         Override form initialization to set default start_date and end_date
@@ -105,3 +161,9 @@ class TaskEditForm(forms.ModelForm):
                     "End date cannot be in the past for active tasks.")
 
         return end_date
+
+
+class DependencyForm(forms.Form):
+    """The task (by id) that a task should wait for."""
+    # Ids beyond a 64-bit integer can't be looked up
+    predecessor = forms.IntegerField(min_value=1, max_value=2 ** 63 - 1)
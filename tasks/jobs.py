@@ -0,0 +1,80 @@
+from django.utils import timezone
+
+from jobs.registry import job
+from projects.sharding import shard_aliases
+from .models import Task
+from .digest import send_digests
+from .ranking import projects_to_rebalance, rebalance_ranks
+from .recurrence import horizon, materialize_due
+
+
+@job('tasks.sweep_overdue')
+def sweep_overdue():
+    """
+    Bring stored statuses up to date in two UPDATEs: outstanding tasks past
+    their end date become overdue, and overdue tasks whose end date moved
+    into the future (or was cleared) become outstanding again.
+    """
+    today = timezone.now().date()
+    overdue = outstanding = 0
+    for using in shard_aliases():
+        # Tasks of projects waiting to be purged are left as they are
+        tasks = Task.objects.using(using).filter(
+            project__deleted_at__isnull=True)
+        # One UPDATE per owner with changes, each a change for sync clients
+        overdue += tasks.filter(
+            status='outstanding', end_date__lt=today).update_changed(
+            status='overdue')
+        outstanding += tasks.filter(
+            status='overdue').exclude(end_date__lt=today).update_changed(
+            status='outstanding')
+    return {'overdue': overdue, 'outstanding': outstanding}
+
+
+@job('tasks.snapshot_rollups')
+def snapshot_rollups():
+    # Daily open/overdue snapshot for the analytics charts
+    from django.core.management import call_command
+    call_command('backfill_rollups', snapshot_only=True)
+
+
+@job('tasks.rebalance_ranks')
+def rebalance_board_ranks():
+    """
+    Spread out the board ranks of projects whose ranks have grown long
+    from repeated moves to the same spot (see tasks/ranking.py). Meant to
+    run from a scheduler, e.g. nightly:
+    manage.py enqueue_job tasks.rebalance_ranks
+    """
+    projects = tasks = 0
+    for using in shard_aliases():
+        for project_id in projects_to_rebalance(using):
+            tasks += rebalance_ranks(project_id, using)
+            projects += 1
+    return {'projects': projects, 'tasks': tasks}
+
+
+@job('tasks.materialize_recurrences')
+def materialize_recurrences():
+    """
+    Create the tasks of recurring rules up to the rolling horizon, in
+    bulk (see tasks/recurrence.py). Meant to run daily from a scheduler:
+    manage.py enqueue_job tasks.materialize_recurrences
+    """
+    until = horizon()
+    rules = tasks = 0
+    for using in shard_aliases():
+        materialized = materialize_due(using, until)
+        rules += materialized[0]
+        tasks += materialized[1]
+    return {'rules': rules, 'tasks': tasks, 'until': until.isoformat()}
+
+
+@job('tasks.send_digests')
+def send_deadline_digests():
+    """
+    Email each user their open tasks due soon or newly overdue (see
+    tasks/digest.py). Meant to run once a day from a scheduler:
+    manage.py enqueue_job tasks.send_digests
+    """
+    return {'sent': send_digests()}
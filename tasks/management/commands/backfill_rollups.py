@@ -0,0 +1,121 @@
+import heapq
+from itertools import groupby
+from operator import itemgetter
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce, TruncDate
+from django.utils import timezone
+
+from projects.models import ArchivedProject, Project
+from projects.sharding import shard_aliases
+from tasks.models import ArchivedTask, Task, TaskDailyRollup
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild the daily task rollups: completed-per-day counts from "
+        "the completed_at of live and archived tasks plus today's "
+        "open/overdue snapshot for every "
+        "project. Use --snapshot-only from a daily scheduler to record the "
+        "open/overdue snapshot without touching completion history."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--snapshot-only', action='store_true',
+            help="Only record today's open/overdue snapshot.")
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Rows written per INSERT (default: 1000).')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        # Rollups sit on the same shard as the projects they describe
+        for using in shard_aliases():
+            if not options['snapshot_only']:
+                self.backfill_completions(batch_size, using)
+            self.snapshot(timezone.now().date(), batch_size, using)
+
+    def completions_per_day(self, tasks, owner):
+        """Completions in `tasks` per project and day, in that order."""
+        return (tasks.filter(completed_at__isnull=False)
+                .annotate(day=TruncDate('completed_at'))
+                .values('project_id', 'day')
+                .annotate(owner_id=owner, completed=Count('id'))
+                .order_by('project_id', 'day'))
+
+    def backfill_completions(self, batch_size, using):
+        """
+        Recount completions per project and day from completed_at. Tasks
+        moved to the archive tables still count, so archived projects keep
+        their history, as do live projects an unfinished archive run has
+        taken tasks from.
+        """
+        def owner_of(model):
+            return Subquery(model._base_manager.using(using).filter(
+                id=OuterRef('project_id')).values('owner_id')[:1])
+
+        live = self.completions_per_day(
+            Task.objects.using(using), F('project__owner_id'))
+        archived = self.completions_per_day(
+            ArchivedTask.objects.using(using),
+            Coalesce(owner_of(ArchivedProject), owner_of(Project)))
+
+        # Both are in (project, day) order: merge them, adding up the
+        # counts of a project-day found in both
+        key = itemgetter('project_id', 'day')
+        merged = groupby(heapq.merge(live.iterator(), archived.iterator(),
+                                     key=key), key=key)
+
+        def rows():
+            for (project_id, day), group in merged:
+                group = list(group)
+                yield TaskDailyRollup(
+                    project_id=project_id, owner_id=group[0]['owner_id'],
+                    day=day, completed=sum(row['completed'] for row in group))
+
+        with transaction.atomic(using=using):
+            # Completion counts are fully recomputed; snapshots are kept
+            TaskDailyRollup.objects.using(using).update(completed=0)
+            written = self.upsert(rows(), ['completed'], batch_size, using)
+        self.stdout.write(f"Backfilled {written} project-day completion rows.")
+
+    def snapshot(self, day, batch_size, using):
+        """Record the open/overdue counts of every project for `day`."""
+        counts = (Project.objects.using(using)
+                  .annotate(**TaskDailyRollup.snapshot_counts(
+                      day, prefix='tasks__'))
+                  .values('id', 'owner_id', 'open_count', 'overdue_count'))
+
+        rows = (TaskDailyRollup(project_id=row['id'],
+                                owner_id=row['owner_id'],
+                                day=day,
+                                open_count=row['open_count'],
+                                overdue_count=row['overdue_count'])
+                for row in counts.iterator())
+        written = self.upsert(
+            rows, ['open_count', 'overdue_count'], batch_size, using)
+        self.stdout.write(self.style.SUCCESS(
+            f"Recorded {day} snapshot for {written} projects."))
+
+    def upsert(self, rows, update_fields, batch_size, using):
+        written = 0
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= batch_size:
+                written += self._flush(batch, update_fields, using)
+                batch = []
+        if batch:
+            written += self._flush(batch, update_fields, using)
+        return written
+
+    def _flush(self, batch, update_fields, using):
+        TaskDailyRollup.objects.using(using).bulk_create(
+            batch,
+            update_conflicts=True,
+            unique_fields=['project', 'day'],
+            update_fields=update_fields)
+        return len(batch)
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.25 on 2026-10-19 13:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tasks', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(fields=['project', 'end_date'], name='task_project_end_date_idx'),
+        ),
+    ]
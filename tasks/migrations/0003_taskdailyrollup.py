@@ -0,0 +1,36 @@
+# Generated by Django 4.2.25 on 2026-10-19 13:17
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('projects', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('tasks', '0002_task_project_end_date_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TaskDailyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('completed', models.IntegerField(default=0)),
+                ('open_count', models.IntegerField(blank=True, null=True)),
+                ('overdue_count', models.IntegerField(blank=True, null=True)),
+                ('owner', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='task_rollups', to=settings.AUTH_USER_MODEL)),
+                ('project', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_rollups', to='projects.project')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['owner', 'day'], name='rollup_owner_day_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='taskdailyrollup',
+            constraint=models.UniqueConstraint(fields=('project', 'day'), name='rollup_project_day_unique'),
+        ),
+    ]
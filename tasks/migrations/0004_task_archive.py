@@ -0,0 +1,34 @@
+# Generated by Django 4.2.25 on 2026-10-19 13:19
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('projects', '0002_project_archive'),
+        ('tasks', '0003_taskdailyrollup'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='taskdailyrollup',
+            name='project',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='daily_rollups', to='projects.project'),
+        ),
+        migrations.CreateModel(
+            name='ArchivedTask',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('name', models.CharField(max_length=200)),
+                ('description', models.TextField(blank=True)),
+                ('start_date', models.DateField(blank=True, null=True)),
+                ('end_date', models.DateField(blank=True, null=True)),
+                ('status', models.CharField(choices=[('completed', 'Completed'), ('outstanding', 'Outstanding'), ('overdue', 'Overdue')], default='outstanding', max_length=11)),
+                ('previous_status', models.CharField(blank=True, choices=[('completed', 'Completed'), ('outstanding', 'Outstanding'), ('overdue', 'Overdue')], max_length=11, null=True)),
+                ('completed_at', models.DateTimeField(blank=True, null=True)),
+                ('project', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='tasks', to='projects.archivedproject')),
+            ],
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 4.2.25 on 2026-10-19 14:44
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('projects', '0006_project_templates'),
+        ('tasks', '0006_task_change_feed'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TaskTemplate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=200)),
+                ('description', models.TextField(blank=True)),
+                ('start_offset', models.IntegerField(blank=True, null=True)),
+                ('end_offset', models.IntegerField(blank=True, null=True)),
+                ('template', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='tasks', to='projects.projecttemplate')),
+            ],
+        ),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 4.2.25 on 2026-10-19 14:49
+
+from django.db import migrations, models
+
+from tasks.ranking import spread_ranks
+
+
+def rank_existing_tasks(apps, schema_editor):
+    # Existing tasks keep the order project pages showed them in
+    Task = apps.get_model('tasks', 'Task')
+    db = schema_editor.connection.alias
+    project_ids = Task.objects.using(db).values_list(
+        'project_id', flat=True).distinct()
+    for project_id in project_ids:
+        tasks = list(Task.objects.using(db).filter(
+            project_id=project_id).order_by('start_date', 'id').only('id'))
+        for task, rank in zip(tasks, spread_ranks(len(tasks))):
+            task.rank = rank
+        Task.objects.using(db).bulk_update(tasks, ['rank'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tasks', '0007_task_templates'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='archivedtask',
+            name='rank',
+            field=models.CharField(blank=True, default='', max_length=255),
+        ),
+        migrations.AddField(
+            model_name='task',
+            name='rank',
+            field=models.CharField(blank=True, default='', max_length=255),
+        ),
+        migrations.AddField(
+            model_name='tasktemplate',
+            name='rank',
+            field=models.CharField(blank=True, default='', max_length=255),
+        ),
+        migrations.RunPython(rank_existing_tasks, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(fields=['project', 'status', 'rank', 'id'], name='task_project_board_idx'),
+        ),
+    ]
@@ -0,0 +1,74 @@
+# Generated by Django 4.2.25 on 2026-10-19 15:00
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('projects', '0006_project_templates'),
+        ('tasks', '0008_task_board_ranks'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TaskDependency',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='archivedtask',
+            name='earliest_start',
+            field=models.DateField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='archivedtask',
+            name='latest_start',
+            field=models.DateField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='archivedtask',
+            name='slack',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='task',
+            name='earliest_start',
+            field=models.DateField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='task',
+            name='latest_start',
+            field=models.DateField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='task',
+            name='slack',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(fields=['project', 'earliest_start', 'id'], name='task_project_schedule_idx'),
+        ),
+        migrations.AddField(
+            model_name='taskdependency',
+            name='predecessor',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='successor_links', to='tasks.task'),
+        ),
+        migrations.AddField(
+            model_name='taskdependency',
+            name='project',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='task_dependencies', to='projects.project'),
+        ),
+        migrations.AddField(
+            model_name='taskdependency',
+            name='successor',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='predecessor_links', to='tasks.task'),
+        ),
+        migrations.AddConstraint(
+            model_name='taskdependency',
+            constraint=models.UniqueConstraint(fields=('predecessor', 'successor'), name='dependency_edge_unique'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 4.2.25 on 2026-10-19 15:11
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('tasks', '0010_task_recurrences'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DigestLog',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('task_count', models.PositiveIntegerField(default=0)),
+                ('sent_at', models.DateTimeField(auto_now_add=True)),
+                ('owner', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='digest_logs', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['day'], name='digest_day_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='digestlog',
+            constraint=models.UniqueConstraint(fields=('owner', 'day'), name='digest_owner_day_unique'),
+        ),
+    ]
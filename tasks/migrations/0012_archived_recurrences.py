@@ -0,0 +1,46 @@
+# Generated by Django 4.2.25 on 2026-10-19 15:33
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('projects', '0006_project_templates'),
+        ('tasks', '0011_digest_log'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='archivedtask',
+            name='occurrence_date',
+            field=models.DateField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='archivedtask',
+            name='project',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='tasks', to='projects.archivedproject'),
+        ),
+        migrations.CreateModel(
+            name='ArchivedTaskRecurrence',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('name', models.CharField(max_length=200)),
+                ('description', models.TextField(blank=True)),
+                ('frequency', models.CharField(choices=[('daily', 'Daily'), ('weekly', 'Weekly'), ('monthly', 'Monthly')], max_length=7)),
+                ('interval', models.PositiveSmallIntegerField(default=1)),
+                ('starts_on', models.DateField()),
+                ('ends_on', models.DateField(blank=True, null=True)),
+                ('duration_days', models.PositiveSmallIntegerField(blank=True, null=True)),
+                ('materialized_until', models.DateField(blank=True, null=True)),
+                ('created_at', models.DateTimeField()),
+                ('project', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='recurrences', to='projects.archivedproject')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='archivedtask',
+            name='recurrence',
+            field=models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='tasks', to='tasks.archivedtaskrecurrence'),
+        ),
+    ]
@@ -1,8 +1,155 @@
-from django.db import models
-from projects.models import Project
+from collections import Counter
+from datetime import datetime, timedelta
+from django.db import models, router, transaction, IntegrityError
+from django.db.models import Case, Count, F, Max, Q, Value, When
+from django.contrib.auth.models import User
+from projects.changes import next_change, next_change_seq, record_deletions
+from projects.models import (Project, ArchivedProject, ProjectTemplate,
+                             description_excerpt)
+from projects.sharding import (assign_ids, is_sharded, on_user_shard,
+                               write_db)
+from .ranking import rank_between
+from .recurrence import occurrence_dates
 from django.utils import timezone
 
 
+class TaskQuerySet(models.QuerySet):
+
+    def refresh_statuses(self, today=None):
+        """
+        Bulk equivalent of Task.check_status() for every task in this
+        queryset: open tasks past their end_date become 'overdue', the
+        rest 'outstanding'. Two UPDATEs instead of one save() per task.
+        Returns the number of rows changed.
+        """
+        if today is None:
+            today = timezone.now().date()
+        open_tasks = self.exclude(status='completed')
+        changed = open_tasks.filter(end_date__lt=today).exclude(
+            status='overdue').update_changed(status='overdue')
+        changed += open_tasks.filter(
+            Q(end_date__isnull=True) | Q(end_date__gte=today)).exclude(
+            status='outstanding').update_changed(status='outstanding')
+        return changed
+
+    def update_changed(self, owner_id=None, **fields):
+        """
+        update() that also stamps the rows as changed for sync clients
+        (see projects.changes): one change per owner, whose id can be
+        passed when it is already known. Returns the rows updated.
+        """
+        self._for_write = True
+        using = self.db
+        if owner_id is None:
+            owner_ids = self.order_by().values_list(
+                'project__owner_id', flat=True).distinct()
+        else:
+            owner_ids = [owner_id]
+        updated = 0
+        for owner_id in owner_ids:
+            with transaction.atomic(using=using, savepoint=False):
+                updated += self.filter(project__owner_id=owner_id).update(
+                    **fields, **next_change(owner_id, using))
+        return updated
+
+    def complete_all(self, project):
+        """
+        Bulk equivalent of Task.complete() for the tasks of `project` in
+        this queryset: one UPDATE completing every one not yet completed,
+        remembering its status in previous_status. Returns the rows
+        updated.
+        """
+        completed_at = timezone.now()
+        # previous_status comes first: it must read the status being
+        # replaced on every backend
+        updated = self.exclude(status='completed').update_changed(
+            project.owner_id, previous_status=F('status'),
+            status='completed', completed_at=completed_at)
+        TaskDailyRollup.record_completions(project, updated, completed_at)
+        return updated
+
+    def reopen_all(self, project, today=None):
+        """
+        Bulk equivalent of Task.reopen() for the tasks of `project` in
+        this queryset: one UPDATE re-opening every completed one as
+        'overdue' or 'outstanding' by its end_date, with the completions
+        taken back out of their days' rollups. Returns the rows updated.
+        Call inside a transaction so the rollups match the rows updated.
+        """
+        if today is None:
+            today = timezone.now().date()
+        completed = self.filter(status='completed')
+        reopened_per_day = Counter(
+            TaskDailyRollup.day_of(completed_at)
+            for completed_at in completed.values_list(
+                'completed_at', flat=True)
+            if completed_at)
+        updated = completed.update_changed(
+            project.owner_id,
+            status=Case(When(end_date__lt=today, then=Value('overdue')),
+                        default=Value('outstanding')),
+            previous_status=None, completed_at=None)
+        for day, count in reopened_per_day.items():
+            TaskDailyRollup.record_completions(project, -count, day)
+        return updated
+
+    def delete_changed(self, owner_id):
+        """
+        delete() that leaves tombstones for sync clients, like
+        Task.delete(), in one DELETE for the whole queryset. Returns the
+        ids deleted.
+        """
+        self._for_write = True
+        using = self.db
+        with transaction.atomic(using=using, savepoint=False):
+            rows = list(self.values_list('id', 'project_id'))
+            task_ids = [task_id for task_id, project_id in rows]
+            if rows:
+                record_deletions(owner_id, using, 'task', rows)
+                TaskDependency.objects.using(using).touching(
+                    task_ids).delete()
+                self.model.objects.using(using).filter(
+                    id__in=task_ids).delete()
+        return task_ids
+
+    def for_cards(self):
+        """
+        Only the columns a task card shows, with the description cut to
+        an excerpt in the database (see description_excerpt).
+        """
+        return self.only(
+            'name', 'status', 'start_date', 'end_date').annotate(
+            description_excerpt=description_excerpt())
+
+    def create(self, **kwargs):
+        if self._db is None and is_sharded():
+            # Let ShardRouter place the row by its owner or project rather
+            # than saving to the manager's (hint-less) default database
+            obj = self.model(**kwargs)
+            obj.save(force_insert=True)
+            return obj
+        return super().create(**kwargs)
+
+    def bulk_create(self, objs, *args, **kwargs):
+        # Sharded rows take their ids from the shared sequence
+        objs = list(objs)
+        assign_ids(objs)
+        return super().bulk_create(objs, *args, **kwargs)
+
+
+class TaskManager(models.Manager.from_queryset(TaskQuerySet)):
+
+    def for_user(self, user):
+        """
+        Tasks of `user`'s projects, leaving out projects being deleted,
+        read from the shard holding them. The project is joined in the same
+        query: every task view and template goes on to use task.project.
+        """
+        return on_user_shard(self.get_queryset(), user).filter(
+            project__owner=user, project__deleted_at__isnull=True
+        ).select_related('project')
+
+
 class Task(models.Model):
     # Define choices for task status
     STATUS_CHOICES = [
@@ -37,26 +184,182 @@ class Task(models.Model):
     # Timestamp for when task was completed, optional
     completed_at = models.DateTimeField(null=True, blank=True)
 
+    # Position on the board within the task's status column (see
+    # tasks/ranking.py); new tasks go to the end of their column
+    rank = models.CharField(max_length=255, blank=True, default='')
+
+    # Last change, for sync clients (see projects/changes.py)
+    updated_at = models.DateTimeField(auto_now=True)
+    change_seq = models.BigIntegerField(default=0)
+
+    # Set on the occurrences of a recurring task (see tasks/recurrence.py)
+    recurrence = models.ForeignKey(
+        'TaskRecurrence', related_name='occurrences', null=True, blank=True,
+        on_delete=models.SET_NULL)
+    occurrence_date = models.DateField(null=True, blank=True)
+
+    # Critical-path figures worked out from the task's dependencies (see
+    # tasks/scheduling.py); empty until the project's schedule is computed
+    earliest_start = models.DateField(null=True, blank=True)
+    latest_start = models.DateField(null=True, blank=True)
+    slack = models.IntegerField(null=True, blank=True)
+
+    objects = TaskManager()
+
+    class Meta:
+        indexes = [
+            # Serves date-window lookups such as the agenda view:
+            # the owner's projects are found through the project owner index,
+            # then each project's tasks are range-scanned by end_date.
+            models.Index(fields=['project', 'end_date'],
+                         name='task_project_end_date_idx'),
+            # Serves the change feed: each of the owner's projects is
+            # range-scanned for changes after the cursor
+            models.Index(fields=['project', 'change_seq', 'id'],
+                         name='task_project_change_idx'),
+            # Serves the board: each status column is one range scan in
+            # rank order, and a new task's rank comes from its end
+            models.Index(fields=['project', 'status', 'rank', 'id'],
+                         name='task_project_board_idx'),
+            # Serves the schedule page, in earliest start order
+            models.Index(fields=['project', 'earliest_start', 'id'],
+                         name='task_project_schedule_idx'),
+        ]
+        constraints = [
+            # Each occurrence of a recurring task is materialised once
+            models.UniqueConstraint(
+                fields=['recurrence', 'occurrence_date'],
+                name='task_occurrence_unique'),
+        ]
+
     def __str__(self):
         # String representation of the task for admin or debugging
         return f"Task: {self.name}"
 
+    def save(self, *args, **kwargs):
+        if self.pk is None and is_sharded():
+            # Ids are unique across shards so rows can move between them
+            assign_ids([self])
+            kwargs['force_insert'] = True
+        if kwargs.get('update_fields') is not None:
+            kwargs['update_fields'] = {
+                *kwargs['update_fields'], 'change_seq', 'updated_at'}
+        using = kwargs.get('using') or router.db_for_write(
+            type(self), instance=self)
+        with transaction.atomic(using=using, savepoint=False):
+            if not self.rank and self._state.adding:
+                self.rank = self.next_rank(using)
+            self.change_seq = next_change_seq(self.project.owner_id, using)
+            super().save(*args, **kwargs)
+
+    def next_rank(self, using):
+        """A rank after the last task of this task's board column."""
+        last = Task.objects.using(using).filter(
+            project_id=self.project_id, status=self.status).aggregate(
+            last=Max('rank'))['last']
+        return rank_between(last, None)
+
+    def delete(self, *args, **kwargs):
+        # Sync clients learn of the deletion from a tombstone
+        using = kwargs.get('using') or router.db_for_write(
+            type(self), instance=self)
+        with transaction.atomic(using=using, savepoint=False):
+            record_deletions(self.project.owner_id, using, 'task', [self])
+            # Dependencies don't cascade (see TaskDependency)
+            TaskDependency.objects.using(using).touching([self.pk]).delete()
+            return super().delete(*args, **kwargs)
+
     def check_status(self):
         """
         Updates task status based on current date and completion:
         - If already 'completed', do nothing.
         - If past end_date and not completed, set status to 'overdue'.
         - Otherwise, set status to 'outstanding'.
-        Then saves the model.
+        Then saves the model if the status changed.
         """
         if self.status == 'completed':
             return
 
-        if self.end_date and self.end_date < timezone.now().date():
-            self.status = 'overdue'
-        else:
-            self.status = 'outstanding'
-        self.save()
+        status = self.open_status()
+        if status != self.status:
+            # Only a real change is saved (and shown to sync clients)
+            self.status = status
+            self.save()
+
+    def open_status(self, today=None):
+        """'overdue' if the task is past its end_date, else 'outstanding'."""
+        if today is None:
+            today = timezone.now().date()
+        if self.end_date and self.end_date < today:
+            return 'overdue'
+        return 'outstanding'
+
+    def transition(self, from_status, **changes):
+        """
+        Write `changes` with a single
+        UPDATE ... WHERE id = <id> AND status = <from_status>, touching
+        only the given columns. Returns the number of rows updated: 0 means
+        another request changed the task's status first, in which case
+        this instance is left unchanged.
+        """
+        updated = Task.objects.using(write_db(self)).filter(
+            pk=self.pk, status=from_status).update_changed(
+            self.project.owner_id, **changes)
+        if updated:
+            for name, value in changes.items():
+                setattr(self, name, value)
+        return updated
+
+    def complete(self, **changes):
+        """
+        Mark the task completed, remembering its current status, and count
+        the completion in today's rollup. Other `changes` (such as a new
+        rank) are written by the same UPDATE. Returns the rows updated (see
+        transition); 0 if it was already completed.
+        """
+        if self.status == 'completed':
+            return 0
+        completed_at = timezone.now()
+        updated = self.transition(
+            self.status, status='completed', previous_status=self.status,
+            completed_at=completed_at, **changes)
+        if updated:
+            TaskDailyRollup.record_completions(self.project, 1, completed_at)
+        return updated
+
+    def reopen(self, **changes):
+        """
+        Re-open a completed task as 'outstanding' or 'overdue' (by its
+        end_date) and take the completion back out of its day's rollup.
+        Other `changes` are written by the same UPDATE. Returns the rows
+        updated (see transition); 0 if it wasn't completed.
+        """
+        if self.status != 'completed':
+            return 0
+        completed_at = self.completed_at
+        updated = self.transition(
+            'completed', status=self.open_status(), previous_status=None,
+            completed_at=None, **changes)
+        if updated and completed_at:
+            TaskDailyRollup.record_completions(self.project, -1, completed_at)
+        return updated
+
+    def move(self, column, before=None, after=None):
+        """
+        Put the task on the board between the cards ranked `before` and
+        `after` (None at either end) of `column`: one UPDATE of this row,
+        which also completes or re-opens the task when it moves between
+        the completed and open columns. Overdue and outstanding both
+        mean open; the end_date decides which. Returns the rows updated
+        (see transition). Raises ValueError when there is no rank
+        between the two (see rank_between).
+        """
+        rank = rank_between(before, after)
+        if column == 'completed' and self.status != 'completed':
+            return self.complete(rank=rank)
+        if column != 'completed' and self.status == 'completed':
+            return self.reopen(rank=rank)
+        return self.transition(self.status, rank=rank)
 
     def toggle_complete(self):
         """
@@ -64,15 +367,338 @@ class Task(models.Model):
         - If currently 'completed', revert to 'outstanding'
         or 'overdue' based on end_date.
         - If not completed, mark as 'completed' and set completed_at to now.
-        Saves the updated state.
+        Each is one conditional UPDATE; returns the rows updated, 0 when
+        another request changed the task first.
         """
         if self.status == 'completed':
-            if self.end_date and self.end_date < timezone.now().date():
-                self.status = 'overdue'
-            else:
-                self.status = 'outstanding'
-            self.completed_at = None
+            updated = self.reopen()
         else:
-            self.status = 'completed'
-            self.completed_at = timezone.now()
-        self.save()
+            updated = self.complete()
+        if updated:
+            TaskDailyRollup.refresh_snapshot(self.project)
+        return updated
+
+
+class TaskRecurrence(models.Model):
+    """
+    A rule repeating a task daily, weekly or monthly. Only the occurrences
+    up to materialized_until are Task rows; later ones are worked out
+    when needed (see tasks/recurrence.py).
+    """
+    FREQUENCY_CHOICES = [
+        ('daily', 'Daily'),
+        ('weekly', 'Weekly'),
+        ('monthly', 'Monthly'),
+    ]
+    # Units for describe(), by frequency
+    PERIODS = {'daily': 'day', 'weekly': 'week', 'monthly': 'month'}
+
+    # Longest task (in days) a rule may repeat, bounding agenda lookups
+    MAX_DURATION_DAYS = 366
+
+    project = models.ForeignKey(
+        Project, related_name='recurrences', on_delete=models.CASCADE)
+
+    # Copied to every occurrence
+    name = models.CharField(max_length=200)
+    description = models.TextField(blank=True)
+
+    frequency = models.CharField(max_length=7, choices=FREQUENCY_CHOICES)
+    interval = models.PositiveSmallIntegerField(default=1)
+
+    # First occurrence, and the last day one may fall on (if any)
+    starts_on = models.DateField()
+    ends_on = models.DateField(null=True, blank=True)
+
+    # Days from an occurrence's start to its end date; no end date if empty
+    duration_days = models.PositiveSmallIntegerField(null=True, blank=True)
+
+    # Occurrences up to this day exist as tasks
+    materialized_until = models.DateField(null=True, blank=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Recurrence: {self.name} ({self.frequency})"
+
+    def save(self, *args, **kwargs):
+        if self.pk is None and is_sharded():
+            # Ids are unique across shards so rows can move between them
+            assign_ids([self])
+            kwargs['force_insert'] = True
+        super().save(*args, **kwargs)
+
+    def describe(self):
+        """E.g. 'Repeats every 2 weeks until Mar 01, 2027'."""
+        period = self.PERIODS[self.frequency]
+        if self.interval == 1:
+            text = f"Repeats every {period}"
+        else:
+            text = f"Repeats every {self.interval} {period}s"
+        if self.ends_on:
+            text += f" until {self.ends_on:%b %d, %Y}"
+        return text
+
+    def dates_between(self, start, end):
+        """Start dates of the occurrences from `start` to `end`."""
+        return occurrence_dates(self.frequency, self.interval,
+                                self.starts_on, self.ends_on, start, end)
+
+    def end_for(self, day):
+        """End date of the occurrence starting on `day`."""
+        if self.duration_days is None:
+            return None
+        return day + timedelta(days=self.duration_days)
+
+    def pending_from(self, today):
+        """First day whose occurrence may not be a task yet."""
+        if self.materialized_until is None:
+            return max(self.starts_on, today)
+        return max(self.materialized_until + timedelta(days=1), today)
+
+
+class TaskDependencyQuerySet(models.QuerySet):
+
+    def touching(self, task_ids):
+        """Edges into or out of any of the tasks `task_ids`."""
+        return self.filter(
+            Q(predecessor_id__in=task_ids) | Q(successor_id__in=task_ids))
+
+
+class TaskDependency(models.Model):
+    """
+    A finish-to-start dependency: `successor` can't start before
+    `predecessor` is finished. Both tasks belong to `project`, which is
+    kept on the edge so a project's whole graph is one range scan. Edges
+    are added through tasks.scheduling.add_dependency, which refuses
+    cycles.
+    """
+    # No database constraints or cascades, as for rollups: edges stay
+    # put while their project sits in the archive tables, so restoring it
+    # brings its dependencies back. Deleting tasks deletes their edges
+    # explicitly (Task.delete, TaskQuerySet.delete_changed), and purging
+    # a project its whole graph. Each column keeps its foreign-key index:
+    # a project's graph, and the edges into or out of a task, are all
+    # single index lookups.
+    project = models.ForeignKey(
+        Project, related_name='task_dependencies',
+        on_delete=models.DO_NOTHING, db_constraint=False)
+    predecessor = models.ForeignKey(
+        Task, related_name='successor_links', on_delete=models.DO_NOTHING,
+        db_constraint=False)
+    successor = models.ForeignKey(
+        Task, related_name='predecessor_links', on_delete=models.DO_NOTHING,
+        db_constraint=False)
+
+    objects = TaskDependencyQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['predecessor', 'successor'],
+                                    name='dependency_edge_unique'),
+        ]
+
+    def __str__(self):
+        return (f"Dependency: task {self.predecessor_id} before "
+                f"task {self.successor_id}")
+
+
+class TaskDailyRollup(models.Model):
+    """
+    Pre-aggregated per-project, per-day task figures used by the analytics
+    chart endpoints, so charts never scan the task table.
+
+    - completed: tasks completed that day (net of re-opened ones),
+      maintained incrementally by the status-changing paths.
+    - open_count / overdue_count: snapshot of the project's open and
+      overdue tasks as of that day, refreshed on status changes and by the
+      daily `backfill_rollups --snapshot-only` run.
+    """
+    # No database constraint or cascade: rollups outlive their project
+    # while it sits in the archive tables
+    project = models.ForeignKey(
+        Project, related_name='daily_rollups', on_delete=models.DO_NOTHING,
+        db_constraint=False)
+
+    # Denormalised owner so per-user charts don't need to join projects
+    # (no database constraint: rollups sit on their owner's shard)
+    owner = models.ForeignKey(
+        User, related_name='task_rollups', on_delete=models.CASCADE,
+        db_constraint=False)
+
+    day = models.DateField()
+    completed = models.IntegerField(default=0)
+    open_count = models.IntegerField(null=True, blank=True)
+    overdue_count = models.IntegerField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['project', 'day'],
+                                    name='rollup_project_day_unique'),
+        ]
+        indexes = [
+            models.Index(fields=['owner', 'day'],
+                         name='rollup_owner_day_idx'),
+        ]
+
+    def __str__(self):
+        return f"Rollup: project {self.project_id} on {self.day}"
+
+    @staticmethod
+    def day_of(value):
+        # Accept a date, a datetime or nothing (today)
+        if value is None:
+            return timezone.now().date()
+        if isinstance(value, datetime):
+            if timezone.is_aware(value):
+                value = timezone.localtime(value)
+            return value.date()
+        return value
+
+    @classmethod
+    def record_completions(cls, project, delta, day=None):
+        """
+        Add `delta` (negative when re-opening) to the completed
+        count of `project` on `day` with a single UPDATE, creating
+        the row on first use.
+        """
+        if not delta:
+            return
+        day = cls.day_of(day)
+        # Rollups sit on the same shard as their project
+        using = router.db_for_write(cls, instance=project)
+        rows = cls.objects.using(using).filter(project=project, day=day)
+        if rows.update(completed=F('completed') + delta):
+            return
+        try:
+            with transaction.atomic(using=using):
+                cls.objects.using(using).create(
+                    project=project, owner_id=project.owner_id, day=day,
+                    completed=delta)
+        except IntegrityError:
+            # Another request created the row first
+            rows.update(completed=F('completed') + delta)
+
+    @staticmethod
+    def snapshot_counts(day, prefix=''):
+        """
+        Aggregates giving the open and overdue task counts on `day`.
+        Pass prefix='tasks__' to aggregate from the Project side.
+        """
+        not_completed = ~Q(**{f'{prefix}status': 'completed'})
+        no_end_date = Q(**{f'{prefix}end_date__isnull': True})
+        return {
+            'open_count': Count(f'{prefix}id', filter=not_completed & (
+                no_end_date | Q(**{f'{prefix}end_date__gte': day}))),
+            'overdue_count': Count(f'{prefix}id', filter=not_completed & Q(
+                **{f'{prefix}end_date__lt': day})),
+        }
+
+    @classmethod
+    def refresh_snapshot(cls, project, day=None):
+        """Recount one project's open/overdue tasks for `day`."""
+        day = cls.day_of(day)
+        counts = project.tasks.aggregate(**cls.snapshot_counts(day))
+        cls.objects.using(
+            router.db_for_write(cls, instance=project)).bulk_create(
+            [cls(project=project, owner_id=project.owner_id, day=day,
+                 **counts)],
+            update_conflicts=True,
+            unique_fields=['project', 'day'],
+            update_fields=['open_count', 'overdue_count'])
+
+
+class ArchivedTaskRecurrence(models.Model):
+    """Archived copy of a TaskRecurrence, restored with its project."""
+    id = models.BigIntegerField(primary_key=True)
+    project = models.ForeignKey(
+        ArchivedProject, related_name='recurrences',
+        on_delete=models.CASCADE)
+    name = models.CharField(max_length=200)
+    description = models.TextField(blank=True)
+    frequency = models.CharField(
+        max_length=7, choices=TaskRecurrence.FREQUENCY_CHOICES)
+    interval = models.PositiveSmallIntegerField(default=1)
+    starts_on = models.DateField()
+    ends_on = models.DateField(null=True, blank=True)
+    duration_days = models.PositiveSmallIntegerField(null=True, blank=True)
+    materialized_until = models.DateField(null=True, blank=True)
+    created_at = models.DateTimeField()
+
+    def __str__(self):
+        return f"Recurrence: {self.name} (archived)"
+
+
+class ArchivedTask(models.Model):
+    """Archived copy of a Task, stored alongside its ArchivedProject."""
+    id = models.BigIntegerField(primary_key=True)
+    # No database constraint: a large project's tasks are moved in chunks
+    # before its ArchivedProject row exists (see projects/archive.py)
+    project = models.ForeignKey(
+        ArchivedProject, related_name='tasks', on_delete=models.CASCADE,
+        db_constraint=False)
+    name = models.CharField(max_length=200)
+    description = models.TextField(blank=True)
+    start_date = models.DateField(null=True, blank=True)
+    end_date = models.DateField(null=True, blank=True)
+    status = models.CharField(
+        max_length=11, choices=Task.STATUS_CHOICES, default='outstanding')
+    previous_status = models.CharField(
+        max_length=11, choices=Task.STATUS_CHOICES, null=True, blank=True)
+    completed_at = models.DateTimeField(null=True, blank=True)
+    rank = models.CharField(max_length=255, blank=True, default='')
+    earliest_start = models.DateField(null=True, blank=True)
+    latest_start = models.DateField(null=True, blank=True)
+    slack = models.IntegerField(null=True, blank=True)
+    recurrence = models.ForeignKey(
+        ArchivedTaskRecurrence, related_name='tasks', null=True, blank=True,
+        on_delete=models.DO_NOTHING, db_constraint=False)
+    occurrence_date = models.DateField(null=True, blank=True)
+
+    def __str__(self):
+        return f"Task: {self.name} (archived)"
+
+
+class TaskTemplate(models.Model):
+    """
+    A task of a ProjectTemplate. Dates are kept as days from the project
+    start, so they can be laid out from any new start date.
+    """
+    template = models.ForeignKey(
+        ProjectTemplate, related_name='tasks', on_delete=models.CASCADE)
+    name = models.CharField(max_length=200)
+    description = models.TextField(blank=True)
+    start_offset = models.IntegerField(null=True, blank=True)
+    end_offset = models.IntegerField(null=True, blank=True)
+    # Board order, copied from the saved project
+    rank = models.CharField(max_length=255, blank=True, default='')
+
+    def __str__(self):
+        return f"Task: {self.name} (template)"
+
+
+class DigestLog(models.Model):
+    """
+    A deadline digest sent to `owner` for `day`, so a rerun of the day's
+    digest job skips them (see tasks/digest.py). Kept on the owner's
+    shard, next to the tasks it lists.
+    """
+    owner = models.ForeignKey(
+        User, related_name='digest_logs', on_delete=models.CASCADE,
+        db_constraint=False)
+    day = models.DateField()
+    task_count = models.PositiveIntegerField(default=0)
+    sent_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['owner', 'day'],
+                                    name='digest_owner_day_unique'),
+        ]
+        indexes = [
+            # Serves pruning old entries
+            models.Index(fields=['day'], name='digest_day_idx'),
+        ]
+
+    def __str__(self):
+        return f"Digest: user {self.owner_id} on {self.day}"
@@ -0,0 +1,122 @@
+"""
+Fractional-index ranks ordering the task cards on the board.
+
+A rank is a string of base-36 digits read as a fraction (0.xyz), so ranks
+sort as strings in the database: by plain character order on SQLite and
+under any collation on PostgreSQL, since only 0-9 and a-z are used. There
+is always room between two ranks, so moving a card gives it a rank
+between its new neighbours and updates that one row; nothing else in the
+column is renumbered.
+
+Ranks never end in '0' (a rank ending in '0' would leave no room before
+the same rank without it). Repeated moves to the same spot make ranks a
+digit longer each time, so rebalance_ranks() spreads a project's ranks
+out again once they pass REBALANCE_LENGTH (the tasks.rebalance_ranks job).
+"""
+import math
+
+from django.db import transaction
+from django.db.models import Q
+from django.db.models.functions import Length
+
+DIGITS = '0123456789abcdefghijklmnopqrstuvwxyz'
+BASE = len(DIGITS)
+
+# Ranks longer than this get their project rebalanced
+REBALANCE_LENGTH = 12
+
+# Tasks re-ranked per UPDATE when rebalancing
+REBALANCE_BATCH_SIZE = 500
+
+
+def rank_between(before=None, after=None):
+    """
+    A rank sorting after `before` and before `after`; either may be None
+    (or empty, for `before`) for the start or end of the column. Raises
+    ValueError when `before` doesn't sort before `after`, e.g. for two
+    equal ranks; rebalancing the project makes room again.
+    """
+    before = before or ''
+    if after is not None and not before < after:
+        raise ValueError(f"No rank between {before!r} and {after!r}.")
+    if (before + '1')[-1] == '0' or (after or '1')[-1] == '0':
+        raise ValueError("Ranks cannot end in '0'.")
+    return _midpoint(before, after)
+
+
+def _midpoint(a, b):
+    # a < b, read as fractions; a may be '' (0) and b None (1)
+    if b is not None:
+        # Keep the digits both share (a padded with zeros)
+        n = 0
+        while n < len(b) and (a[n] if n < len(a) else '0') == b[n]:
+            n += 1
+        if n:
+            return b[:n] + _midpoint(a[n:], b[n:])
+    digit_a = DIGITS.index(a[0]) if a else 0
+    digit_b = DIGITS.index(b[0]) if b is not None else BASE
+    if digit_b - digit_a > 1:
+        # Room for a digit in between
+        return DIGITS[(digit_a + digit_b) // 2]
+    if b is not None and len(b) > 1:
+        # b's first digit alone sorts between a and b
+        return b[0]
+    # Adjacent digits: keep a's and find room in the next position
+    return DIGITS[digit_a] + _midpoint(a[1:], None)
+
+
+def spread_ranks(count):
+    """`count` ascending ranks spread evenly, as short as they can be."""
+    width = max(1, math.ceil(math.log(count + 1, BASE)))
+    if BASE ** width <= count:
+        width += 1
+    ranks = []
+    for i in range(1, count + 1):
+        value = i * BASE ** width // (count + 1)
+        digits = ''
+        for _ in range(width):
+            value, digit = divmod(value, BASE)
+            digits = DIGITS[digit] + digits
+        ranks.append(digits.rstrip('0'))
+    return ranks
+
+
+def projects_to_rebalance(using):
+    """
+    Ids of the projects on `using` with a rank past REBALANCE_LENGTH, or
+    with unranked tasks (such as rows bulk-inserted without a rank).
+    """
+    from .models import Task
+
+    return list(Task.objects.using(using).annotate(
+        rank_length=Length('rank')).filter(
+        Q(rank_length__gt=REBALANCE_LENGTH) | Q(rank='')).order_by(
+        'project_id').values_list('project_id', flat=True).distinct())
+
+
+def rebalance_ranks(project_id, using):
+    """
+    Give a project's tasks evenly spread, short ranks in their current
+    order (unranked tasks first). Returns the number of tasks re-ranked.
+    """
+    from projects.changes import next_change
+    from projects.models import Project
+    from .models import Task
+
+    with transaction.atomic(using=using):
+        owner_id = Project.all_objects.using(using).filter(
+            id=project_id).values_list('owner_id', flat=True).first()
+        if owner_id is None:
+            return 0
+        tasks = list(Task.objects.using(using).filter(
+            project_id=project_id).order_by('rank', 'id').only('id', 'rank'))
+        # The new ranks reach sync clients as one change
+        stamp = next_change(owner_id, using)
+        for task, rank in zip(tasks, spread_ranks(len(tasks))):
+            task.rank = rank
+            task.change_seq = stamp['change_seq']
+            task.updated_at = stamp['updated_at']
+        Task.objects.using(using).bulk_update(
+            tasks, ['rank', 'change_seq', 'updated_at'],
+            batch_size=REBALANCE_BATCH_SIZE)
+    return len(tasks)
@@ -0,0 +1,218 @@
+"""
+Recurring tasks, materialised lazily.
+
+A TaskRecurrence is a rule (daily, weekly or monthly, every `interval`
+periods). Its occurrences only become Task rows within a rolling
+horizon of settings.RECURRENCE_HORIZON_DAYS: materialize_due() (the
+tasks.materialize_recurrences job, run daily from a scheduler) creates
+them in bulk, one INSERT per batch of rules, and moves each rule's
+materialized_until forward. Occurrences further out are worked out on
+the fly by pending_occurrences() for the agenda, so the task table only
+holds near-term work.
+
+Occurrences are never created before the day they are materialised:
+a rule starting in the past begins with today's occurrence. The unique
+(recurrence, occurrence_date) constraint makes an overlapping or
+repeated run create nothing twice.
+"""
+import calendar
+from dataclasses import dataclass
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Max, Q
+from django.utils import timezone
+
+from .ranking import spread_ranks
+
+# Rules materialised per batch (one INSERT of their tasks)
+MATERIALIZE_BATCH_SIZE = 500
+
+
+def horizon(today=None):
+    """The last day whose occurrences are kept as Task rows."""
+    today = today or timezone.now().date()
+    return today + timedelta(days=settings.RECURRENCE_HORIZON_DAYS)
+
+
+def occurrence_dates(frequency, interval, starts_on, ends_on, start, end):
+    """
+    The dates from `start` to `end` (inclusive) on which a rule falls,
+    in order. Monthly rules keep the day of the month of `starts_on`,
+    moved back to the month's last day where it has fewer days.
+    """
+    if ends_on is not None:
+        end = min(end, ends_on)
+    start = max(start, starts_on)
+    if start > end:
+        return
+    if frequency == 'monthly':
+        first = starts_on.year * 12 + starts_on.month - 1
+        # The occurrence in start's month may fall before start: skip it
+        n = (start.year * 12 + start.month - 1 - first) // interval
+        while True:
+            year, month = divmod(first + n * interval, 12)
+            day = min(starts_on.day, calendar.monthrange(year, month + 1)[1])
+            current = date(year, month + 1, day)
+            if current > end:
+                return
+            if current >= start:
+                yield current
+            n += 1
+    step = interval * (7 if frequency == 'weekly' else 1)
+    # First occurrence on or after start
+    n = -(-(start - starts_on).days // step)
+    current = starts_on + timedelta(days=n * step)
+    while current <= end:
+        yield current
+        current += timedelta(days=step)
+
+
+@dataclass
+class Occurrence:
+    """
+    An occurrence not materialised yet, shaped enough like a Task for
+    the agenda to list it (it has no id and no row).
+    """
+    recurrence: object
+    start_date: date
+
+    id = None
+    status = 'outstanding'
+
+    @property
+    def name(self):
+        return self.recurrence.name
+
+    @property
+    def project(self):
+        return self.recurrence.project
+
+    @property
+    def project_id(self):
+        return self.recurrence.project_id
+
+    @property
+    def recurrence_id(self):
+        return self.recurrence.id
+
+    @property
+    def end_date(self):
+        return self.recurrence.end_for(self.start_date)
+
+
+def pending_occurrences(recurrences, start, end, today=None):
+    """
+    Occurrences of `recurrences` due (by end date) from `start` to `end`
+    that have no Task row yet, ordered like the agenda's tasks.
+    """
+    today = today or timezone.now().date()
+    occurrences = []
+    for recurrence in recurrences:
+        if recurrence.duration_days is None:
+            # Without an end date nothing is ever due
+            continue
+        length = timedelta(days=recurrence.duration_days)
+        occurrences.extend(
+            Occurrence(recurrence, day) for day in recurrence.dates_between(
+                max(start - length, recurrence.pending_from(today)),
+                end - length))
+    occurrences.sort(key=lambda occurrence: (
+        occurrence.end_date, occurrence.project_id, occurrence.recurrence_id))
+    return occurrences
+
+
+def materialize(recurrences, until, today=None):
+    """
+    Create the Task rows of `recurrences` (rules on one database, with
+    their projects loaded) for their occurrences up to `until`, in bulk,
+    and move their materialized_until to `until`. The new tasks go to the
+    end of their projects' outstanding columns and are stamped for sync
+    clients, one change per owner. Returns the number of tasks inserted.
+    """
+    from projects.changes import next_change_seq
+    from projects.sharding import write_db
+    from .models import Task, TaskDailyRollup, TaskRecurrence
+
+    recurrences = list(recurrences)
+    if not recurrences:
+        return 0
+    today = today or timezone.now().date()
+    using = write_db(recurrences[0])
+    projects = {recurrence.project_id: recurrence.project
+                for recurrence in recurrences}
+
+    with transaction.atomic(using=using):
+        new = {project_id: [] for project_id in projects}
+        for recurrence in recurrences:
+            for day in recurrence.dates_between(
+                    recurrence.pending_from(today), until):
+                new[recurrence.project_id].append((recurrence, day))
+
+        # Each project's new cards follow the last one in their column
+        last_ranks = dict(Task.objects.using(using).filter(
+            project_id__in=[project_id for project_id, occurrences
+                            in new.items() if occurrences],
+            status='outstanding').values('project_id').annotate(
+            last=Max('rank')).values_list('project_id', 'last'))
+        stamps = {}
+        tasks = []
+        for project_id, occurrences in new.items():
+            if not occurrences:
+                continue
+            owner_id = projects[project_id].owner_id
+            if owner_id not in stamps:
+                stamps[owner_id] = next_change_seq(owner_id, using)
+            occurrences.sort(key=lambda occurrence: occurrence[1])
+            last = last_ranks.get(project_id) or ''
+            for (recurrence, day), rank in zip(
+                    occurrences, spread_ranks(len(occurrences))):
+                tasks.append(Task(
+                    project_id=project_id, recurrence_id=recurrence.id,
+                    occurrence_date=day, name=recurrence.name,
+                    description=recurrence.description, start_date=day,
+                    end_date=recurrence.end_for(day), status='outstanding',
+                    rank=last + rank, change_seq=stamps[owner_id]))
+        # An occurrence created by an overlapping run is skipped
+        Task.objects.using(using).bulk_create(
+            tasks, batch_size=MATERIALIZE_BATCH_SIZE, ignore_conflicts=True)
+
+        TaskRecurrence.objects.using(using).filter(
+            id__in=[recurrence.id for recurrence in recurrences]).filter(
+            Q(materialized_until__isnull=True)
+            | Q(materialized_until__lt=until)).update(
+            materialized_until=until)
+        for recurrence in recurrences:
+            recurrence.materialized_until = max(
+                recurrence.materialized_until or until, until)
+        for project_id, occurrences in new.items():
+            if occurrences:
+                TaskDailyRollup.refresh_snapshot(projects[project_id])
+    return len(tasks)
+
+
+def materialize_due(using, until=None, batch_size=MATERIALIZE_BATCH_SIZE):
+    """
+    Materialise every rule on `using` of an open project that hasn't
+    reached `until` (by default the horizon), `batch_size` rules at a
+    time in id order. Returns (rules, tasks) materialised.
+    """
+    from .models import TaskRecurrence
+
+    until = until or horizon()
+    due = TaskRecurrence.objects.using(using).filter(
+        project__status='open', project__deleted_at__isnull=True).filter(
+        Q(materialized_until__isnull=True)
+        | Q(materialized_until__lt=until)).exclude(
+        # Ended rules whose last occurrence is already a task
+        ends_on__lte=F('materialized_until')).select_related('project')
+    rules = tasks = 0
+    last_id = 0
+    while True:
+        batch = list(due.filter(id__gt=last_id).order_by('id')[:batch_size])
+        if not batch:
+            return rules, tasks
+        last_id = batch[-1].id
+        tasks += materialize(batch, until)
+        rules += len(batch)
@@ -0,0 +1,296 @@
+"""
+Finish-to-start dependencies and the critical path.
+
+A task can start no earlier than its own start date (the project's, if
+it has none) nor before the day after each of its predecessors can
+finish: its earliest start, worked out in topological order. Working
+back from the project's end date, its latest start is the last day it
+can start for every successor to still make theirs. Slack is the days
+between the two; tasks without slack (or with less than none, when the
+end date can't be met) make up the critical path.
+
+compute_schedule() works through a whole project. update_schedule()
+redoes only what a change can reach: the earliest starts of the changed
+tasks and their descendants, and the latest starts of the changed tasks
+and their ancestors, reading the stored figures of the tasks bordering
+that subgraph. Only the edges are loaded for the whole project (two ids
+per row); task rows are read for the subgraph and written only where a
+figure changed.
+
+The figures are derived data: they are written with bulk_update, so
+they are not stamped for the change feed.
+"""
+from collections import defaultdict, deque
+from datetime import timedelta
+
+from django.db import IntegrityError, transaction
+
+from projects.models import Project
+from projects.sharding import write_db
+from .models import Task, TaskDependency
+
+# Task rows read or written per statement
+SCHEDULE_BATCH_SIZE = 500
+
+SCHEDULE_FIELDS = ('earliest_start', 'latest_start', 'slack')
+
+ONE_DAY = timedelta(days=1)
+
+
+class DependencyError(ValueError):
+    """The dependency can't be added (a cycle, or tasks of two projects)."""
+
+
+def duration(start_date, end_date):
+    """Days a task takes, counting both ends; one day without both dates."""
+    if start_date and end_date:
+        return max((end_date - start_date).days, 0) + 1
+    return 1
+
+
+def _graph(project):
+    """(successors, predecessors) of every task of `project`, by id."""
+    successors = defaultdict(set)
+    predecessors = defaultdict(set)
+    for predecessor_id, successor_id in TaskDependency.objects.using(
+            write_db(project)).filter(project_id=project.id).values_list(
+            'predecessor_id', 'successor_id'):
+        successors[predecessor_id].add(successor_id)
+        predecessors[successor_id].add(predecessor_id)
+    return successors, predecessors
+
+
+def _reachable(start, edges):
+    """`start` and every task reached from it by following `edges`."""
+    seen = set(start)
+    stack = list(start)
+    while stack:
+        for task_id in edges.get(stack.pop(), ()):
+            if task_id not in seen:
+                seen.add(task_id)
+                stack.append(task_id)
+    return seen
+
+
+def topological_order(task_ids, successors):
+    """
+    `task_ids` ordered so each comes after its predecessors among them
+    (Kahn's algorithm). Raises DependencyError on a cycle.
+    """
+    indegree = dict.fromkeys(task_ids, 0)
+    for task_id in indegree:
+        for successor_id in successors.get(task_id, ()):
+            if successor_id in indegree:
+                indegree[successor_id] += 1
+    ready = deque(sorted(
+        task_id for task_id, count in indegree.items() if not count))
+    order = []
+    while ready:
+        task_id = ready.popleft()
+        order.append(task_id)
+        for successor_id in successors.get(task_id, ()):
+            if successor_id in indegree:
+                indegree[successor_id] -= 1
+                if not indegree[successor_id]:
+                    ready.append(successor_id)
+    if len(order) != len(indegree):
+        raise DependencyError("The task dependencies form a cycle.")
+    return order
+
+
+def _rows(project, task_ids=None):
+    """Schedule inputs and figures of the project's tasks, by id."""
+    tasks = Task.objects.using(write_db(project)).filter(
+        project_id=project.id)
+    fields = ('id', 'start_date', 'end_date', *SCHEDULE_FIELDS)
+    if task_ids is None:
+        return {row['id']: row for row in tasks.values(*fields)}
+    task_ids = sorted(task_ids)
+    rows = {}
+    for start in range(0, len(task_ids), SCHEDULE_BATCH_SIZE):
+        for row in tasks.filter(id__in=task_ids[
+                start:start + SCHEDULE_BATCH_SIZE]).values(*fields):
+            rows[row['id']] = row
+    return rows
+
+
+def _schedule(project, rows, forward, backward, successors, predecessors):
+    """
+    Recompute the earliest starts of `forward` and the latest starts of
+    `backward` in `rows`, then the slack of both, and save the rows that
+    changed. `forward` must hold the descendants of its tasks, and
+    `backward` the ancestors of its tasks. Returns the rows saved.
+    """
+    before = {task_id: tuple(rows[task_id][name] for name in SCHEDULE_FIELDS)
+              for task_id in forward | backward}
+
+    for task_id in topological_order(forward, successors):
+        row = rows[task_id]
+        start = row['start_date'] or project.start_date
+        for predecessor_id in predecessors.get(task_id, ()) & rows.keys():
+            predecessor = rows[predecessor_id]
+            # The day after the predecessor's earliest finish
+            start = max(start, predecessor['earliest_start']
+                        + timedelta(days=duration(
+                            predecessor['start_date'],
+                            predecessor['end_date'])))
+        row['earliest_start'] = start
+
+    for task_id in reversed(topological_order(backward, successors)):
+        row = rows[task_id]
+        finish = project.end_date
+        for successor_id in successors.get(task_id, ()) & rows.keys():
+            finish = min(finish, rows[successor_id]['latest_start'] - ONE_DAY)
+        days = duration(row['start_date'], row['end_date'])
+        row['latest_start'] = finish - timedelta(days=days - 1)
+
+    changed = []
+    for task_id, figures in before.items():
+        row = rows[task_id]
+        row['slack'] = (row['latest_start'] - row['earliest_start']).days
+        if tuple(row[name] for name in SCHEDULE_FIELDS) != figures:
+            changed.append(Task(
+                id=task_id, **{name: row[name] for name in SCHEDULE_FIELDS}))
+    Task.objects.using(write_db(project)).bulk_update(
+        changed, SCHEDULE_FIELDS, batch_size=SCHEDULE_BATCH_SIZE)
+    return len(changed)
+
+
+def _lock(project):
+    # One schedule change per project at a time (a no-op on SQLite, where
+    # writes are serialised anyway)
+    Project.objects.using(write_db(project)).select_for_update().filter(
+        pk=project.pk).exists()
+
+
+def compute_schedule(project):
+    """
+    Work out every task's earliest and latest start and slack in
+    `project`. Returns the number of tasks whose figures changed.
+    """
+    with transaction.atomic(using=write_db(project)):
+        _lock(project)
+        successors, predecessors = _graph(project)
+        rows = _rows(project)
+        return _schedule(project, rows, set(rows), set(rows),
+                         successors, predecessors)
+
+
+def update_schedule(project, forward=(), backward=()):
+    """
+    Bring the schedule up to date after a change to some of `project`'s
+    tasks or edges: earliest starts are recomputed from the tasks in
+    `forward` (whose start or predecessors changed) down through their
+    descendants, latest starts from the tasks in `backward` (whose
+    length or successors changed) up through their ancestors. Ids of
+    deleted tasks are skipped. Falls back to compute_schedule() when a
+    bordering task has no figures yet. Returns the tasks changed.
+    """
+    with transaction.atomic(using=write_db(project)):
+        _lock(project)
+        successors, predecessors = _graph(project)
+        forward = _reachable(forward, successors)
+        backward = _reachable(backward, predecessors)
+        bordering = (
+            {i for task_id in forward for i in predecessors.get(task_id, ())}
+            | {i for task_id in backward for i in successors.get(task_id, ())})
+        rows = _rows(project, forward | backward | bordering)
+        forward &= rows.keys()
+        backward &= rows.keys()
+        if not forward and not backward:
+            return 0
+        # Every task read but not fully recomputed lends its stored
+        # figures; without them there is nothing to build on
+        if any(None in (row['earliest_start'], row['latest_start'])
+               for task_id, row in rows.items()
+               if task_id not in forward & backward):
+            return compute_schedule(project)
+        return _schedule(project, rows, forward, backward,
+                         successors, predecessors)
+
+
+def ensure_schedule(project):
+    """Compute the project's schedule if any task has no figures yet."""
+    if project.tasks.filter(earliest_start__isnull=True).exists():
+        compute_schedule(project)
+
+
+def invalidate_schedule(project):
+    """
+    Clear the project's figures, e.g. after its dates change; they are
+    worked out again the next time the schedule is needed.
+    """
+    Task.objects.using(write_db(project)).filter(
+        project_id=project.id).update(
+        **dict.fromkeys(SCHEDULE_FIELDS, None))
+
+
+def dependency_neighbours(project, task_ids):
+    """
+    (successor ids, predecessor ids) of the tasks `task_ids`, leaving out
+    those tasks themselves: the tasks to pass to update_schedule() once
+    they are deleted.
+    """
+    successor_ids = set()
+    predecessor_ids = set()
+    for predecessor_id, successor_id in TaskDependency.objects.using(
+            write_db(project)).touching(task_ids).values_list(
+            'predecessor_id', 'successor_id'):
+        successor_ids.add(successor_id)
+        predecessor_ids.add(predecessor_id)
+    task_ids = set(task_ids)
+    return successor_ids - task_ids, predecessor_ids - task_ids
+
+
+def add_dependency(predecessor, successor):
+    """
+    Make `successor` wait for `predecessor` to finish, and update the
+    schedule from the pair. Raises DependencyError for tasks of different
+    projects, a task depending on itself, or an edge closing a cycle
+    (the predecessor already waits for the successor, directly or not).
+    Returns the TaskDependency.
+    """
+    if predecessor.project_id != successor.project_id:
+        raise DependencyError("Both tasks must belong to the same project.")
+    if predecessor.pk == successor.pk:
+        raise DependencyError("A task can't depend on itself.")
+    project = successor.project
+    using = write_db(project)
+    with transaction.atomic(using=using):
+        # Under the project lock, so two edges added at once can't
+        # close a cycle between them
+        _lock(project)
+        successors, _ = _graph(project)
+        if successor.pk in successors.get(predecessor.pk, ()):
+            raise DependencyError(
+                f"'{successor.name}' already depends on '{predecessor.name}'.")
+        if predecessor.pk in _reachable([successor.pk], successors):
+            raise DependencyError(
+                f"'{predecessor.name}' already depends on "
+                f"'{successor.name}', so this would make a cycle.")
+        try:
+            with transaction.atomic(using=using):
+                dependency = TaskDependency.objects.using(using).create(
+                    project_id=project.id, predecessor_id=predecessor.pk,
+                    successor_id=successor.pk)
+        except IntegrityError:
+            raise DependencyError(
+                f"'{successor.name}' already depends on '{predecessor.name}'.")
+        update_schedule(project, forward=[successor.pk],
+                        backward=[predecessor.pk])
+    return dependency
+
+
+def remove_dependency(predecessor, successor):
+    """
+    Drop the dependency of `successor` on `predecessor`, if any, and
+    update the schedule. Returns whether there was one.
+    """
+    project = successor.project
+    with transaction.atomic(using=write_db(project)):
+        deleted, _ = TaskDependency.objects.using(write_db(project)).filter(
+            predecessor_id=predecessor.pk, successor_id=successor.pk).delete()
+        if deleted:
+            update_schedule(project, forward=[successor.pk],
+                            backward=[predecessor.pk])
+    return bool(deleted)
@@ -1,9 +1,31 @@
-from django.test import TestCase
+import threading
+import time
+from unittest import mock
+from django.core import mail
+from django.db import OperationalError, connection, transaction
+from django.test import (SimpleTestCase, TestCase, TransactionTestCase,
+                         override_settings)
+from django.test.utils import CaptureQueriesContext
 from django.utils import timezone
 from datetime import timedelta, date
 from django.contrib.auth.models import User
+from django.urls import reverse
+from projects import archive
+from projects.events import LocalBroker
 from projects.models import Project
-from tasks.models import Task
+from tasks.jobs import rebalance_board_ranks
+from tasks import digest
+from tasks.digest import send_digests
+from tasks.jobs import materialize_recurrences
+from tasks.models import (DigestLog, Task, TaskDailyRollup, TaskDependency,
+                          TaskRecurrence)
+from tasks.recurrence import materialize_due, occurrence_dates
+from tasks.ranking import REBALANCE_LENGTH, rank_between, spread_ranks
+from tasks import scheduling
+from tasks.scheduling import (DependencyError, add_dependency,
+                              compute_schedule, topological_order)
+from django.core.management import call_command
+from io import StringIO
 
 
 class TaskModelTests(TestCase):
@@ -134,3 +156,1237 @@ class TaskModelTests(TestCase):
         task.toggle_complete()
         self.assertEqual(task.status, 'outstanding')
         self.assertIsNone(task.completed_at)
+
+    def test_refresh_statuses_updates_in_bulk(self):
+        """refresh_statuses() matches check_status() for every open task."""
+        late = self.create_task(
+            name='Late', end_date=date.today() - timedelta(days=1))
+        on_time = self.create_task(
+            name='On time', status='overdue',
+            end_date=date.today() + timedelta(days=1))
+        done = self.create_task(
+            name='Done', status='completed',
+            end_date=date.today() - timedelta(days=1))
+
+        # Per status: the owners with rows to change, then for each the
+        # next change number (2) and one UPDATE
+        with self.assertNumQueries(8):
+            changed = self.project.tasks.refresh_statuses()
+        self.assertEqual(changed, 2)
+
+        for task, status in ((late, 'overdue'), (on_time, 'outstanding'),
+                             (done, 'completed')):
+            task.refresh_from_db()
+            self.assertEqual(task.status, status)
+
+
+class AgendaViewTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='tester', password='pass')
+        self.other_user = User.objects.create_user(
+            username='other', password='pass')
+        self.client.login(username='tester', password='pass')
+        self.today = timezone.now().date()
+
+    def create_project(self, owner=None, name='Project'):
+        return Project.objects.create(
+            name=name,
+            description='Agenda project',
+            owner=owner or self.user,
+            start_date=self.today,
+            end_date=self.today + timedelta(days=30)
+        )
+
+    def test_agenda_lists_due_tasks_grouped_by_day(self):
+        """Open tasks in the window are grouped under their due date."""
+        first = self.create_project(name='First')
+        second = self.create_project(name='Second')
+        due_today = first.tasks.create(name='Today', end_date=self.today)
+        due_later = second.tasks.create(
+            name='Later', end_date=self.today + timedelta(days=2))
+        also_later = first.tasks.create(
+            name='Also later', end_date=self.today + timedelta(days=2))
+
+        response = self.client.get(reverse('agenda'))
+        agenda_days = response.context['agenda_days']
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([entry['day'] for entry in agenda_days],
+                         [self.today, self.today + timedelta(days=2)])
+        self.assertEqual(agenda_days[0]['tasks'], [due_today])
+        self.assertEqual(agenda_days[1]['tasks'], [also_later, due_later])
+
+    def test_agenda_excludes_completed_out_of_window_and_other_users(self):
+        """Only the user's open tasks inside the window are shown."""
+        project = self.create_project()
+        other = self.create_project(owner=self.other_user)
+        project.tasks.create(
+            name='Done', end_date=self.today, status='completed')
+        project.tasks.create(
+            name='Far away', end_date=self.today + timedelta(days=20))
+        other.tasks.create(name='Not mine', end_date=self.today)
+
+        response = self.client.get(reverse('agenda'))
+        self.assertEqual(response.context['agenda_days'], [])
+
+    def test_agenda_custom_window(self):
+        """The start and days parameters move the window."""
+        project = self.create_project()
+        task = project.tasks.create(
+            name='Next week', end_date=self.today + timedelta(days=10))
+
+        response = self.client.get(reverse('agenda'), {
+            'start': (self.today + timedelta(days=8)).isoformat(),
+            'days': 5,
+        })
+        self.assertEqual(
+            response.context['agenda_days'][0]['tasks'], [task])
+
+    def test_agenda_survives_out_of_range_windows(self):
+        """Impossible or far-out starts don't raise."""
+        response = self.client.get(reverse('agenda'), {'start': '2024-02-30'})
+        self.assertEqual(response.context['start'], self.today)
+        for start in ('9999-12-30', '0001-01-01'):
+            response = self.client.get(reverse('agenda'), {
+                'start': start, 'days': 31})
+            self.assertEqual(response.status_code, 200)
+
+    def test_agenda_query_count_is_independent_of_project_count(self):
+        """The agenda is one task query no matter how many projects."""
+        for i in range(10):
+            project = self.create_project(name=f'Project {i}')
+            project.tasks.create(name='Due', end_date=self.today)
+
+        # session + user + the agenda query + the recurring task rules
+        with self.assertNumQueries(4):
+            self.client.get(reverse('agenda'))
+
+    def test_agenda_does_not_write_statuses(self):
+        """Past-due tasks are shown as overdue without saving them."""
+        project = self.create_project()
+        task = project.tasks.create(
+            name='Late', end_date=self.today - timedelta(days=1))
+
+        response = self.client.get(reverse('agenda'), {
+            'start': (self.today - timedelta(days=3)).isoformat()})
+        task.refresh_from_db()
+        self.assertEqual(task.status, 'outstanding')
+        self.assertContains(response, 'Overdue')
+
+
+class TaskDailyRollupTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='tester', password='pass')
+        self.client.login(username='tester', password='pass')
+        self.today = timezone.now().date()
+        self.project = Project.objects.create(
+            name='Rollup Project',
+            description='For rollup tests',
+            owner=self.user,
+            start_date=self.today,
+            end_date=self.today + timedelta(days=10)
+        )
+
+    def rollup(self, day=None):
+        return TaskDailyRollup.objects.get(
+            project=self.project, day=day or self.today)
+
+    def test_task_toggle_complete_updates_rollup(self):
+        """Completing then re-opening a task nets out in the rollup."""
+        task = self.project.tasks.create(
+            name='Task', end_date=self.today - timedelta(days=1))
+
+        self.client.get(reverse('task_toggle_complete', args=[task.id]))
+        rollup = self.rollup()
+        self.assertEqual(rollup.completed, 1)
+        self.assertEqual(rollup.overdue_count, 0)
+
+        self.client.get(reverse('task_toggle_complete', args=[task.id]))
+        rollup = self.rollup()
+        self.assertEqual(rollup.completed, 0)
+        self.assertEqual(rollup.overdue_count, 1)
+
+    def test_model_toggle_complete_updates_rollup(self):
+        """Task.toggle_complete keeps the rollup in step as well."""
+        task = self.project.tasks.create(name='Task')
+        task.toggle_complete()
+        self.assertEqual(self.rollup().completed, 1)
+        self.assertEqual(self.rollup().open_count, 0)
+
+    def test_project_toggle_complete_updates_rollup(self):
+        """Closing a project counts each newly completed task once."""
+        self.project.tasks.create(name='Open 1')
+        self.project.tasks.create(name='Open 2')
+        self.project.tasks.create(name='Done', status='completed')
+
+        self.client.get(
+            reverse('project_toggle_complete', args=[self.project.id]))
+        self.assertEqual(self.rollup().completed, 2)
+        self.assertEqual(self.rollup().open_count, 0)
+
+        self.client.get(
+            reverse('project_toggle_complete', args=[self.project.id]))
+        self.assertEqual(self.rollup().completed, 0)
+        self.assertEqual(self.rollup().open_count, 2)
+
+    def test_backfill_rollups_command(self):
+        """The backfill recounts completions per day from completed_at."""
+        yesterday = timezone.now() - timedelta(days=1)
+        self.project.tasks.create(
+            name='Done', status='completed', completed_at=yesterday)
+        self.project.tasks.create(
+            name='Late', end_date=self.today - timedelta(days=2))
+        self.project.tasks.create(name='Open')
+
+        call_command('backfill_rollups', stdout=StringIO())
+
+        self.assertEqual(
+            self.rollup(self.today - timedelta(days=1)).completed, 1)
+        snapshot = self.rollup()
+        self.assertEqual(snapshot.open_count, 1)
+        self.assertEqual(snapshot.overdue_count, 1)
+
+    def test_backfill_keeps_archived_history(self):
+        """Tasks moved to the archive tables are still counted."""
+        yesterday = timezone.now() - timedelta(days=1)
+        archived = Project.objects.create(
+            name='Archived', description='', owner=self.user,
+            start_date=self.today, end_date=self.today)
+        archived.tasks.create(
+            name='Done', status='completed', completed_at=yesterday)
+        # Half way through archiving: one task moved, one left
+        self.project.tasks.create(
+            name='Moved', status='completed', completed_at=yesterday)
+        self.project.tasks.create(
+            name='Left', status='completed', completed_at=yesterday)
+        archive._move_tasks(
+            [self.project.tasks.get(name='Moved').id], 'default')
+        archived.status = 'closed'
+        archived.save()
+        archive.archive_batch([archived.id])
+
+        call_command('backfill_rollups', stdout=StringIO())
+
+        day = self.today - timedelta(days=1)
+        self.assertEqual(self.rollup(day).completed, 2)
+        rollup = TaskDailyRollup.objects.get(project_id=archived.id, day=day)
+        self.assertEqual((rollup.owner_id, rollup.completed),
+                         (self.user.id, 1))
+
+    def test_chart_endpoints_read_rollups(self):
+        """Chart endpoints return one entry per day from the rollups."""
+        TaskDailyRollup.objects.create(
+            project=self.project, owner=self.user, day=self.today,
+            completed=3, open_count=4, overdue_count=1)
+
+        # session + user + rollup query
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse('analytics_data'),
+                                       {'days': 7})
+        days = response.json()['days']
+        self.assertEqual(len(days), 7)
+        self.assertEqual(days[-1], {'day': self.today.isoformat(),
+                                    'completed': 3, 'open': 4,
+                                    'overdue': 1})
+        self.assertEqual(days[0]['completed'], 0)
+
+        response = self.client.get(
+            reverse('project_analytics_data', args=[self.project.id]))
+        self.assertEqual(response.json()['days'][-1]['completed'], 3)
+
+
+class TaskToggleFragmentTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='tester', password='pass')
+        self.other_user = User.objects.create_user(
+            username='other', password='pass')
+        self.client.login(username='tester', password='pass')
+        self.project = Project.objects.create(
+            name='Fragment Project',
+            description='Partial responses',
+            owner=self.user,
+            start_date=date.today(),
+            end_date=date.today() + timedelta(days=5)
+        )
+        self.task = self.project.tasks.create(
+            name='Write docs', end_date=date.today() + timedelta(days=2))
+        self.project.tasks.create(name='Review')
+
+    def url(self, task):
+        return reverse('task_toggle_complete_fragment', args=[task.id])
+
+    def test_fragment_returns_card_and_counts(self):
+        """The response carries the new card and the project counters."""
+        response = self.client.post(self.url(self.task))
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+
+        self.assertEqual(data['task_id'], self.task.id)
+        self.assertEqual(data['status'], 'completed')
+        self.assertIn(f'id="task-card-{self.task.id}"', data['html'])
+        self.assertIn('Re-open', data['html'])
+        self.assertEqual(data['counts'], {
+            'total_tasks': 2, 'completed_count': 1,
+            'outstanding_count': 1, 'overdue_count': 0})
+        self.assertEqual(data['project_status'], 'open')
+        self.assertEqual(data['messages'],
+                         ["Task 'Write docs' marked as complete."])
+
+        self.task.refresh_from_db()
+        self.assertEqual(self.task.status, 'completed')
+
+    def test_fragment_reopens_closed_project(self):
+        """Re-opening a task in a closed project reports the new status."""
+        self.task.toggle_complete()
+        self.project.status = 'closed'
+        self.project.save()
+
+        data = self.client.post(self.url(self.task)).json()
+        self.assertEqual(data['status'], 'outstanding')
+        self.assertEqual(data['project_status'], 'open')
+        self.assertEqual(len(data['messages']), 2)
+
+    def test_fragment_requires_post(self):
+        """GET would make the toggle replayable by prefetchers."""
+        response = self.client.get(self.url(self.task))
+        self.assertEqual(response.status_code, 405)
+        self.task.refresh_from_db()
+        self.assertEqual(self.task.status, 'outstanding')
+
+    def test_fragment_is_scoped_to_owner(self):
+        """Another user's task is a 404."""
+        self.client.logout()
+        self.client.login(username='other', password='pass')
+        response = self.client.post(self.url(self.task))
+        self.assertEqual(response.status_code, 404)
+
+    def test_task_description_endpoint(self):
+        """Task cards show an excerpt; the full text is served on demand."""
+        self.task.description = 'x' * 200
+        self.task.save()
+        data = self.client.post(self.url(self.task)).json()
+        self.assertIn('data-read-more', data['html'])
+        self.assertNotIn('x' * 101, data['html'])
+
+        url = reverse('task_description', args=[self.task.id])
+        self.assertEqual(self.client.get(url).json()['description'],
+                         'x' * 200)
+
+        self.client.logout()
+        self.client.login(username='other', password='pass')
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+    def test_fragment_does_not_render_project_page(self):
+        """The fragment skips the per-task work of a project_detail render."""
+        for i in range(10):
+            self.project.tasks.create(name=f'Extra {i}')
+        # session, user, task, next change number (2), conditional task
+        # UPDATE, rollup upsert (4), rollup snapshot (2) and one aggregate
+        # for the counters
+        with self.assertNumQueries(13):
+            self.client.post(self.url(self.task))
+
+
+class TaskBulkActionTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='tester', password='pass')
+        self.other_user = User.objects.create_user(
+            username='other', password='pass')
+        self.client.login(username='tester', password='pass')
+        self.project = Project.objects.create(
+            name='Bulk Project',
+            description='Many tasks at once',
+            owner=self.user,
+            start_date=date.today(),
+            end_date=date.today() + timedelta(days=5)
+        )
+        self.overdue = self.project.tasks.create(
+            name='Late', end_date=date.today() - timedelta(days=1),
+            status='overdue')
+        self.outstanding = self.project.tasks.create(
+            name='On time', end_date=date.today() + timedelta(days=1))
+        self.untouched = self.project.tasks.create(name='Not ticked')
+        self.other_task = Project.objects.create(
+            name='Other Project', owner=self.other_user,
+            start_date=date.today(), end_date=date.today()
+        ).tasks.create(name='Not mine')
+        self.url = reverse('task_bulk_action', args=[self.project.id])
+
+    def post(self, action, tasks, **data):
+        return self.client.post(self.url, {
+            'action': action, 'task_ids': [task.id for task in tasks],
+            **data})
+
+    def test_complete_remembers_previous_statuses(self):
+        response = self.post('complete', [self.overdue, self.outstanding])
+        self.assertRedirects(
+            response, reverse('project_detail', args=[self.project.id]),
+            fetch_redirect_response=False)
+
+        for task, previous in ((self.overdue, 'overdue'),
+                               (self.outstanding, 'outstanding')):
+            task.refresh_from_db()
+            self.assertEqual(task.status, 'completed')
+            self.assertEqual(task.previous_status, previous)
+            self.assertIsNotNone(task.completed_at)
+        self.untouched.refresh_from_db()
+        self.assertEqual(self.untouched.status, 'outstanding')
+
+        rollup = TaskDailyRollup.objects.get(project=self.project)
+        self.assertEqual(rollup.completed, 2)
+        self.assertEqual(rollup.open_count, 1)
+
+    def test_reopen_restores_open_statuses(self):
+        self.post('complete', [self.overdue, self.outstanding])
+        self.project.status = 'closed'
+        self.project.save()
+
+        self.post('reopen', [self.overdue, self.outstanding])
+        self.overdue.refresh_from_db()
+        self.outstanding.refresh_from_db()
+        self.assertEqual(self.overdue.status, 'overdue')
+        self.assertEqual(self.outstanding.status, 'outstanding')
+        self.assertIsNone(self.outstanding.previous_status)
+        self.assertIsNone(self.outstanding.completed_at)
+
+        self.project.refresh_from_db()
+        self.assertEqual(self.project.status, 'open')
+        rollup = TaskDailyRollup.objects.get(project=self.project)
+        self.assertEqual(rollup.completed, 0)
+        self.assertEqual((rollup.open_count, rollup.overdue_count), (2, 1))
+
+    def test_delete_checks_password_once(self):
+        response = self.post('delete', [self.overdue, self.outstanding],
+                             password='wrong')
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(self.project.tasks.count(), 3)
+
+        self.post('delete', [self.overdue, self.outstanding],
+                  password='pass')
+        self.assertEqual(list(self.project.tasks.all()), [self.untouched])
+        # Sync clients are told of both deletions
+        self.assertEqual(
+            set(self.user.tombstones.values_list('object_id', flat=True)),
+            {self.overdue.id, self.outstanding.id})
+
+    def test_other_users_tasks_are_ignored(self):
+        self.post('complete', [self.other_task])
+        self.post('delete', [self.other_task], password='pass')
+        self.other_task.refresh_from_db()
+        self.assertEqual(self.other_task.status, 'outstanding')
+
+        self.client.logout()
+        self.client.login(username='other', password='pass')
+        response = self.post('complete', [self.overdue])
+        self.assertEqual(response.status_code, 404)
+
+    def test_out_of_range_ids_are_ignored(self):
+        response = self.client.post(self.url, {
+            'action': 'complete',
+            'task_ids': ['99999999999999999999', str(2 ** 63), '0',
+                         str(self.overdue.id)]})
+        self.assertEqual(response.status_code, 302)
+        self.overdue.refresh_from_db()
+        self.assertEqual(self.overdue.status, 'completed')
+
+    def test_unknown_action_changes_nothing(self):
+        self.post('archive', [self.overdue])
+        self.overdue.refresh_from_db()
+        self.assertEqual(self.overdue.status, 'overdue')
+        self.assertEqual(self.client.get(self.url).status_code, 405)
+
+    def test_one_statement_for_the_whole_selection(self):
+        tasks = [self.project.tasks.create(name=f'Extra {i}')
+                 for i in range(20)]
+        with CaptureQueriesContext(connection) as queries:
+            self.post('complete', tasks)
+        updates = [query['sql'] for query in queries
+                   if query['sql'].startswith('UPDATE "tasks_task"')]
+        self.assertEqual(len(updates), 1)
+
+        with CaptureQueriesContext(connection) as queries:
+            self.post('delete', tasks, password='pass')
+        deletes = [query['sql'] for query in queries
+                   if query['sql'].startswith('DELETE FROM "tasks_task"')]
+        self.assertEqual(len(deletes), 1)
+        self.assertEqual(self.project.tasks.count(), 3)
+
+
+class TaskRankTests(SimpleTestCase):
+    def test_rank_between_sorts_between(self):
+        self.assertLess('a', rank_between('a', 'b'))
+        self.assertLess(rank_between('a', 'b'), 'b')
+        self.assertLess(rank_between(None, 'a'), 'a')
+        self.assertGreater(rank_between('z', None), 'z')
+        self.assertEqual(rank_between(None, None), 'i')
+
+    def test_no_rank_between_equal_ranks(self):
+        with self.assertRaises(ValueError):
+            rank_between('b', 'b')
+        with self.assertRaises(ValueError):
+            rank_between('c', 'b')
+
+    def test_repeated_inserts_stay_ordered(self):
+        ranks = ['i']
+        for i in range(200):
+            # Always just after the first card: the worst case
+            ranks.insert(1, rank_between(ranks[0], ranks[1] if len(ranks) > 1
+                                         else None))
+        self.assertEqual(ranks, sorted(ranks))
+        self.assertEqual(len(set(ranks)), len(ranks))
+        self.assertTrue(all(rank[-1] != '0' for rank in ranks))
+
+    def test_spread_ranks(self):
+        ranks = spread_ranks(1000)
+        self.assertEqual(ranks, sorted(ranks))
+        self.assertEqual(len(set(ranks)), 1000)
+        self.assertLessEqual(max(map(len, ranks)), 2)
+
+
+class TaskBoardTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='tester', password='pass')
+        self.client.login(username='tester', password='pass')
+        self.project = Project.objects.create(
+            name='Board Project', description='', owner=self.user,
+            start_date=date.today(), end_date=date.today())
+        self.first, self.second, self.third = [
+            self.project.tasks.create(name=name)
+            for name in ('First', 'Second', 'Third')]
+        self.late = self.project.tasks.create(
+            name='Late', end_date=date.today() - timedelta(days=1))
+        self.late.check_status()
+
+    def column(self, status):
+        return list(self.project.tasks.filter(status=status).order_by(
+            'rank', 'id').values_list('name', flat=True))
+
+    def move(self, task, column, before=None, after=None):
+        return self.client.post(reverse('task_move', args=[task.id]), {
+            'column': column,
+            'before': before.id if before else '',
+            'after': after.id if after else '',
+        })
+
+    def test_new_tasks_go_to_the_end_of_their_column(self):
+        self.assertEqual(self.column('outstanding'),
+                         ['First', 'Second', 'Third'])
+
+    def test_board_shows_columns_in_rank_order(self):
+        response = self.client.get(
+            reverse('project_board', args=[self.project.id]))
+        self.assertEqual(response.status_code, 200)
+        columns = {column['status']: [task.name for task in column['tasks']]
+                   for column in response.context['columns']}
+        self.assertEqual(columns, {
+            'outstanding': ['First', 'Second', 'Third'],
+            'overdue': ['Late'], 'completed': []})
+
+    def test_reorder_updates_one_row(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.move(self.third, 'outstanding',
+                                 after=self.first)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.column('outstanding'),
+                         ['Third', 'First', 'Second'])
+        updates = [query['sql'] for query in queries
+                   if query['sql'].startswith('UPDATE "tasks_task"')]
+        self.assertEqual(len(updates), 1)
+        self.assertIn('"id" = %s' % self.third.id, updates[0])
+
+        self.move(self.first, 'outstanding', before=self.second)
+        self.assertEqual(self.column('outstanding'),
+                         ['Third', 'Second', 'First'])
+
+    def test_moving_to_completed_completes(self):
+        data = self.move(self.second, 'completed').json()
+        self.assertEqual(data['status'], 'completed')
+        self.assertEqual(data['counts']['completed_count'], 1)
+        self.second.refresh_from_db()
+        self.assertEqual(self.second.previous_status, 'outstanding')
+        self.assertEqual(
+            TaskDailyRollup.objects.get(project=self.project).completed, 1)
+
+        # Back out to the open columns: the end date picks the column
+        self.move(self.late, 'completed', after=self.second)
+        self.assertEqual(self.column('completed'), ['Late', 'Second'])
+        data = self.move(self.late, 'outstanding', before=self.third).json()
+        self.assertEqual(data['status'], 'overdue')
+
+    def test_no_room_between_neighbours_rebalances(self):
+        Task.objects.filter(id__in=[self.first.id, self.second.id]).update(
+            rank='')
+        response = self.move(self.third, 'outstanding',
+                             before=self.first, after=self.second)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.column('outstanding'),
+                         ['First', 'Third', 'Second'])
+
+    def test_stale_board_is_a_conflict(self):
+        self.assertEqual(
+            self.move(self.first, 'outstanding', before=self.third,
+                      after=self.second).status_code, 409)
+        self.assertEqual(self.move(self.first, 'nowhere').status_code, 400)
+
+    def test_invalid_neighbour_ids_are_a_bad_request(self):
+        for value in ['99999999999999999999', str(2 ** 63), '0', 'x']:
+            response = self.client.post(
+                reverse('task_move', args=[self.first.id]),
+                {'column': 'outstanding', 'before': value})
+            self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.column('outstanding'),
+                         ['First', 'Second', 'Third'])
+
+    def test_rebalance_job_shortens_long_ranks(self):
+        for i in range(5 * REBALANCE_LENGTH):
+            self.move(self.third, 'outstanding', before=self.first,
+                      after=self.second)
+            self.move(self.second, 'outstanding', before=self.first,
+                      after=self.third)
+        self.third.refresh_from_db()
+        self.assertGreater(len(self.third.rank), REBALANCE_LENGTH)
+        order = self.column('outstanding')
+
+        result = rebalance_board_ranks()
+        self.assertEqual(result, {'projects': 1, 'tasks': 4})
+        self.assertEqual(self.column('outstanding'), order)
+        self.assertTrue(all(len(rank) <= 2 for rank in
+                            self.project.tasks.values_list('rank',
+                                                           flat=True)))
+        self.assertEqual(rebalance_board_ranks(),
+                         {'projects': 0, 'tasks': 0})
+
+    def test_other_users_cannot_move(self):
+        User.objects.create_user(username='other', password='pass')
+        self.client.logout()
+        self.client.login(username='other', password='pass')
+        self.assertEqual(self.move(self.first, 'completed').status_code, 404)
+        self.assertEqual(self.client.get(
+            reverse('project_board', args=[self.project.id])).status_code,
+            404)
+
+
+class TaskScheduleTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='tester', password='pass')
+        self.client.login(username='tester', password='pass')
+        self.today = date.today()
+        self.project = Project.objects.create(
+            name='Schedule Project', description='', owner=self.user,
+            start_date=self.today, end_date=self.day(4))
+        # design (3 days) -> build (1 day) -> ship (no dates: 1 day), and
+        # review (2 days) on its own
+        self.design = self.project.tasks.create(
+            name='Design', start_date=self.today, end_date=self.day(2))
+        self.build = self.project.tasks.create(
+            name='Build', start_date=self.today, end_date=self.today)
+        self.ship = self.project.tasks.create(name='Ship')
+        self.review = self.project.tasks.create(
+            name='Review', start_date=self.today, end_date=self.day(1))
+        add_dependency(self.design, self.build)
+        add_dependency(self.build, self.ship)
+
+    def day(self, offset):
+        return self.today + timedelta(days=offset)
+
+    def figures(self):
+        return {name: (earliest, latest, slack)
+                for name, earliest, latest, slack in
+                self.project.tasks.values_list(
+                    'name', 'earliest_start', 'latest_start', 'slack')}
+
+    def test_earliest_and_latest_starts_follow_the_dependencies(self):
+        self.assertEqual(self.figures(), {
+            'Design': (self.today, self.today, 0),
+            'Build': (self.day(3), self.day(3), 0),
+            'Ship': (self.day(4), self.day(4), 0),
+            'Review': (self.today, self.day(3), 3),
+        })
+
+    def test_topological_order(self):
+        successors = {1: {2, 3}, 2: {4}, 3: {4}}
+        self.assertEqual(topological_order({1, 2, 3, 4}, successors),
+                         [1, 2, 3, 4])
+        with self.assertRaises(DependencyError):
+            topological_order({1, 2}, {1: {2}, 2: {1}})
+
+    def test_cycles_are_refused(self):
+        with self.assertRaises(DependencyError):
+            add_dependency(self.ship, self.design)
+        with self.assertRaises(DependencyError):
+            add_dependency(self.build, self.build)
+        with self.assertRaises(DependencyError):
+            add_dependency(self.design, self.build)
+        self.assertEqual(TaskDependency.objects.count(), 2)
+
+        response = self.client.post(
+            reverse('task_dependency_add', args=[self.design.id]),
+            {'predecessor': self.ship.id}, follow=True)
+        self.assertContains(response, 'cycle')
+        self.assertEqual(TaskDependency.objects.count(), 2)
+
+    def test_invalid_predecessor_ids(self):
+        for predecessor in ('', 'design', '-1', '9' * 30):
+            response = self.client.post(
+                reverse('task_dependency_add', args=[self.review.id]),
+                {'predecessor': predecessor}, follow=True)
+            self.assertContains(
+                response, 'Enter the ID of a task in this project.')
+        self.assertEqual(TaskDependency.objects.count(), 2)
+
+    def test_tasks_of_other_projects_cannot_be_depended_on(self):
+        other = Project.objects.create(
+            name='Other', description='', owner=self.user,
+            start_date=self.today, end_date=self.today)
+        stranger = other.tasks.create(name='Elsewhere')
+        self.client.post(
+            reverse('task_dependency_add', args=[self.review.id]),
+            {'predecessor': stranger.id})
+        with self.assertRaises(DependencyError):
+            add_dependency(stranger, self.review)
+        self.assertEqual(TaskDependency.objects.count(), 2)
+
+    def test_adding_and_removing_a_dependency_updates_the_schedule(self):
+        self.client.post(
+            reverse('task_dependency_add', args=[self.ship.id]),
+            {'predecessor': self.review.id})
+        # Review must now finish the day before ship starts
+        self.assertEqual(self.figures()['Review'],
+                         (self.today, self.day(2), 2))
+
+        self.client.post(
+            reverse('task_dependency_add', args=[self.review.id]),
+            {'predecessor': self.design.id})
+        # Review now waits for design, and ship for review
+        self.assertEqual(self.figures()['Review'],
+                         (self.day(3), self.day(2), -1))
+
+        self.client.post(reverse('task_dependency_remove',
+                                 args=[self.review.id, self.design.id]))
+        self.assertEqual(self.figures()['Review'],
+                         (self.today, self.day(2), 2))
+
+    def test_edit_recomputes_only_the_affected_subgraph(self):
+        calls = []
+        rows = scheduling._rows
+
+        def recording_rows(project, task_ids=None):
+            calls.append(task_ids)
+            return rows(project, task_ids)
+
+        with mock.patch.object(scheduling, '_rows', recording_rows), \
+                mock.patch.object(scheduling, 'compute_schedule') as full:
+            self.client.post(reverse('task_edit', args=[self.build.id]), {
+                'name': 'Build', 'description': '',
+                'start_date': self.today, 'end_date': self.day(1)})
+        full.assert_not_called()
+        # Build, its ancestor design and its descendant ship; never review
+        self.assertEqual(calls, [{self.design.id, self.build.id,
+                                  self.ship.id}])
+        self.assertEqual(self.figures(), {
+            'Design': (self.today, self.day(-1), -1),
+            'Build': (self.day(3), self.day(2), -1),
+            'Ship': (self.day(5), self.day(4), -1),
+            'Review': (self.today, self.day(3), 3),
+        })
+        # The same figures as working through the whole project
+        self.assertEqual(compute_schedule(self.project), 0)
+
+    def test_deleting_a_task_removes_its_dependencies(self):
+        self.client.post(reverse('task_delete', args=[self.build.id]),
+                         {'password': 'pass'})
+        self.assertFalse(TaskDependency.objects.exists())
+        self.assertEqual(self.figures()['Ship'],
+                         (self.today, self.day(4), 4))
+        self.assertEqual(self.figures()['Design'],
+                         (self.today, self.day(2), 2))
+
+    def test_new_project_dates_are_picked_up_by_the_schedule_page(self):
+        self.project.tasks.update(earliest_start=None)
+        response = self.client.get(
+            reverse('project_schedule', args=[self.project.id]))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([task.name for task in response.context['page']],
+                         ['Design', 'Review', 'Build', 'Ship'])
+        self.assertEqual(response.context['critical_count'], 3)
+        self.assertEqual(self.figures()['Review'],
+                         (self.today, self.day(3), 3))
+
+    def test_task_detail_lists_dependencies(self):
+        response = self.client.get(
+            reverse('task_detail', args=[self.build.id]))
+        self.assertEqual(response.context['predecessors'], [self.design])
+        self.assertEqual(response.context['successors'], [self.ship])
+        self.assertContains(response, 'on the critical path')
+
+
+class RecurrenceRuleTests(SimpleTestCase):
+    def dates(self, frequency, interval, starts_on, start, end,
+              ends_on=None):
+        return list(occurrence_dates(
+            frequency, interval, starts_on, ends_on, start, end))
+
+    def test_daily_and_weekly(self):
+        monday = date(2026, 1, 5)
+        self.assertEqual(
+            self.dates('daily', 2, monday, date(2026, 1, 8),
+                       date(2026, 1, 12)),
+            [date(2026, 1, 9), date(2026, 1, 11)])
+        self.assertEqual(
+            self.dates('weekly', 1, monday, date(2025, 12, 1),
+                       date(2026, 1, 19)),
+            [monday, date(2026, 1, 12), date(2026, 1, 19)])
+        self.assertEqual(
+            self.dates('weekly', 1, monday, monday, date(2026, 3, 1),
+                       ends_on=date(2026, 1, 18)),
+            [monday, date(2026, 1, 12)])
+
+    def test_monthly_keeps_the_day_or_the_months_last(self):
+        self.assertEqual(
+            self.dates('monthly', 1, date(2026, 1, 31), date(2026, 2, 1),
+                       date(2026, 4, 30)),
+            [date(2026, 2, 28), date(2026, 3, 31), date(2026, 4, 30)])
+        self.assertEqual(
+            self.dates('monthly', 3, date(2026, 1, 15), date(2026, 5, 1),
+                       date(2027, 1, 31)),
+            [date(2026, 7, 15), date(2026, 10, 15), date(2027, 1, 15)])
+
+
+@override_settings(RECURRENCE_HORIZON_DAYS=14)
+class TaskRecurrenceTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='tester', password='pass')
+        self.client.login(username='tester', password='pass')
+        self.today = date.today()
+        self.project = Project.objects.create(
+            name='Routine', description='', owner=self.user,
+            start_date=self.today, end_date=self.today + timedelta(days=90))
+
+    def day(self, offset):
+        return self.today + timedelta(days=offset)
+
+    def create_weekly(self):
+        response = self.client.post(
+            reverse('task_create', args=[self.project.id]), {
+                'name': 'Weekly report', 'description': 'Send it',
+                'start_date': self.today, 'end_date': self.day(1),
+                'status': 'outstanding', 'repeat': 'weekly',
+                'repeat_every': 1})
+        self.assertEqual(response.status_code, 302)
+        return TaskRecurrence.objects.get()
+
+    def occurrences(self):
+        return list(self.project.tasks.order_by('rank').values_list(
+            'occurrence_date', 'end_date'))
+
+    def test_only_occurrences_within_the_horizon_are_created(self):
+        recurrence = self.create_weekly()
+        self.assertEqual(self.occurrences(), [
+            (self.today, self.day(1)), (self.day(7), self.day(8)),
+            (self.day(14), self.day(15))])
+        self.assertEqual(recurrence.materialized_until, self.day(14))
+        self.assertTrue(all(
+            task.description == 'Send it' and task.change_seq
+            for task in self.project.tasks.all()))
+
+    def test_job_rolls_the_horizon_forward_once(self):
+        self.create_weekly()
+        using = self.project._state.db
+        self.assertEqual(materialize_due(using, self.day(28)), (1, 2))
+        self.assertEqual(len(self.occurrences()), 5)
+        # Caught up: a rerun creates nothing
+        self.assertEqual(materialize_due(using, self.day(28)), (0, 0))
+        self.assertEqual(materialize_recurrences()['tasks'], 0)
+        self.assertEqual(len(self.occurrences()), 5)
+
+    def test_closed_projects_are_not_materialized(self):
+        self.create_weekly()
+        Project.objects.filter(id=self.project.id).update(status='closed')
+        self.assertEqual(
+            materialize_due(self.project._state.db, self.day(28)), (0, 0))
+
+    def test_agenda_computes_later_occurrences(self):
+        self.create_weekly()
+        response = self.client.get(reverse('agenda'), {'days': 31})
+        entries = [(entry['day'], task.id is not None)
+                   for entry in response.context['agenda_days']
+                   for task in entry['tasks']]
+        # Rows within the horizon, worked out on the fly beyond it
+        self.assertEqual(entries, [
+            (self.day(1), True), (self.day(8), True), (self.day(15), True),
+            (self.day(22), False), (self.day(29), False)])
+        self.assertContains(response, 'Repeats')
+        self.assertEqual(TaskRecurrence.objects.get().occurrences.count(), 3)
+
+    def test_stop_repeating(self):
+        recurrence = self.create_weekly()
+        first = recurrence.occurrences.order_by('occurrence_date').first()
+        response = self.client.get(reverse('task_detail', args=[first.id]))
+        self.assertContains(response, 'Repeats every week')
+
+        self.client.post(reverse('task_recurrence_stop', args=[first.id]))
+        recurrence.refresh_from_db()
+        self.assertEqual(recurrence.ends_on, self.day(14))
+        self.assertEqual(
+            materialize_due(self.project._state.db, self.day(28)), (0, 0))
+        response = self.client.get(reverse('agenda'), {'days': 31})
+        self.assertEqual(sum(len(entry['tasks'])
+                             for entry in response.context['agenda_days']),
+                         3)
+
+    def test_repeating_task_needs_a_start_date(self):
+        response = self.client.post(
+            reverse('task_create', args=[self.project.id]), {
+                'name': 'Weekly report', 'description': '',
+                'start_date': '', 'end_date': self.day(1),
+                'status': 'outstanding', 'repeat': 'weekly'})
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(TaskRecurrence.objects.exists())
+
+
+@override_settings(DIGEST_DUE_DAYS=3, SITE_URL='https://tasks.example.com')
+class DeadlineDigestTests(TestCase):
+    def setUp(self):
+        self.today = date.today()
+        self.users = [
+            User.objects.create_user(
+                username=f'user{i}', email=f'user{i}@example.com',
+                password='pass')
+            for i in range(3)]
+        first, second, third = self.users
+        self.project = self.create_project(first, 'Launch')
+        other = self.create_project(first, 'Website')
+        self.create_task(self.project, 'Went overdue', -1)
+        self.create_task(other, 'Due tomorrow', 1)
+        self.create_task(self.project, 'Due later', 10)
+        done = self.create_task(self.project, 'Done', 1)
+        done.complete()
+        # Long overdue tasks were in an earlier digest
+        self.create_task(self.project, 'Long overdue', -5)
+        self.create_task(self.create_project(second, 'Garden'), 'Seeds', 3)
+        # The third user has nothing due
+        self.create_task(self.create_project(third, 'Later'), 'Someday', 30)
+
+    def create_project(self, owner, name):
+        return Project.objects.create(
+            name=name, description='', owner=owner,
+            start_date=self.today, end_date=self.today)
+
+    def create_task(self, project, name, days):
+        return project.tasks.create(
+            name=name, end_date=self.today + timedelta(days=days))
+
+    def test_one_email_per_user_with_tasks_due(self):
+        self.assertEqual(send_digests(batch_size=1), 2)
+        messages = {message.to[0]: message for message in mail.outbox}
+        self.assertEqual(sorted(messages),
+                         ['user0@example.com', 'user1@example.com'])
+
+        body = messages['user0@example.com'].body
+        self.assertIn('Went overdue yesterday:\n- Went overdue (Launch)',
+                      body)
+        self.assertIn('Due soon:\n- Due tomorrow (Website)', body)
+        self.assertIn('https://tasks.example.com/tasks/agenda/', body)
+        for name in ('Due later', 'Done', 'Long overdue', 'Seeds'):
+            self.assertNotIn(name, body)
+        self.assertEqual(messages['user0@example.com'].subject,
+                         '1 task(s) went overdue, 1 due soon')
+        self.assertEqual(
+            dict(DigestLog.objects.values_list('owner__username',
+                                               'task_count')),
+            {'user0': 2, 'user1': 1})
+
+    def test_rerun_sends_nothing_twice(self):
+        send_digests()
+        self.assertEqual(send_digests(), 0)
+        self.assertEqual(len(mail.outbox), 2)
+        # The next day is a new digest
+        self.assertEqual(
+            send_digests(today=self.today + timedelta(days=1)), 2)
+
+    def test_rerun_after_a_failure_carries_on(self):
+        send_batch = digest.send_digest_batch
+        batches = []
+
+        def failing_second_batch(*args):
+            batches.append(args)
+            if len(batches) > 1:
+                raise RuntimeError("Mail server went away")
+            return send_batch(*args)
+
+        with mock.patch.object(digest, 'send_digest_batch',
+                               failing_second_batch), \
+                self.assertRaises(RuntimeError):
+            send_digests(batch_size=1)
+        self.assertEqual(len(mail.outbox), 1)
+
+        # Only the user left out is sent the digest
+        self.assertEqual(send_digests(batch_size=1), 1)
+        self.assertEqual(sorted(message.to[0] for message in mail.outbox),
+                         ['user0@example.com', 'user1@example.com'])
+
+    def test_one_connection_and_bounded_queries_per_batch(self):
+        with mock.patch.object(digest, 'get_connection',
+                               wraps=digest.get_connection) as connect, \
+                CaptureQueriesContext(connection) as queries:
+            send_digests(batch_size=10)
+        connect.assert_called_once_with()
+        # owners (2 keyset pages), sent already, due tasks, users, log
+        # INSERT, then the log pruning
+        self.assertEqual(len(queries), 7)
+
+    def test_old_log_entries_are_pruned(self):
+        DigestLog.objects.create(
+            owner=self.users[2], day=self.today - timedelta(days=90))
+        send_digests()
+        self.assertEqual(DigestLog.objects.count(), 2)
+
+
+class TaskEventTests(TestCase):
+    """Task writes are announced to the project's event streams."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='tester', password='pass')
+        self.client.login(username='tester', password='pass')
+        self.project = Project.objects.create(
+            name='Live Project', description='Events', owner=self.user,
+            start_date=date.today(),
+            end_date=date.today() + timedelta(days=5))
+        self.task = self.project.tasks.create(name='Write docs')
+
+    def published(self, method, url, data=None):
+        """Events published by one request, as a listening page gets them."""
+        with mock.patch.object(LocalBroker, 'has_listeners',
+                               return_value=True), \
+                mock.patch.object(LocalBroker, 'publish') as publish, \
+                self.captureOnCommitCallbacks(execute=True):
+            getattr(self.client, method)(url, data or {})
+        return [event for project_id, event in
+                (call.args for call in publish.call_args_list)]
+
+    def test_toggle_publishes_task_and_counts(self):
+        events = self.published(
+            'post', reverse('task_toggle_complete_fragment',
+                            args=[self.task.id]))
+        self.assertEqual(len(events), 1)
+        self.assertEqual(events[0]['type'], 'task.toggled')
+        self.assertEqual(events[0]['task_id'], self.task.id)
+        self.assertEqual(events[0]['status'], 'completed')
+        self.assertEqual(events[0]['card_url'],
+                         reverse('task_card', args=[self.task.id]))
+        self.assertEqual(events[0]['counts'], {
+            'total_tasks': 1, 'completed_count': 1,
+            'outstanding_count': 0, 'overdue_count': 0})
+
+    def test_create_edit_and_delete_publish(self):
+        events = self.published(
+            'post', reverse('task_create', args=[self.project.id]),
+            {'name': 'New task', 'description': '', 'status': 'outstanding'})
+        self.assertEqual([event['type'] for event in events],
+                         ['task.created'])
+
+        events = self.published(
+            'post', reverse('task_edit', args=[self.task.id]),
+            {'name': 'Renamed', 'description': ''})
+        self.assertEqual([event['type'] for event in events],
+                         ['task.updated'])
+
+        events = self.published(
+            'post', reverse('task_delete', args=[self.task.id]),
+            {'password': 'pass'})
+        self.assertEqual(events[0]['type'], 'task.deleted')
+        self.assertEqual(events[0]['task_id'], self.task.id)
+        self.assertEqual(events[0]['counts']['total_tasks'], 1)
+
+    def test_nothing_is_queried_without_listeners(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.client.post(reverse('task_toggle_complete_fragment',
+                                     args=[self.task.id]))
+        with self.assertNumQueries(0):
+            for callback in callbacks:
+                callback()
+
+    def test_task_card_endpoint(self):
+        data = self.client.get(reverse('task_card', args=[self.task.id]))
+        self.assertEqual(data.json()['task_id'], self.task.id)
+        self.assertIn(f'id="task-card-{self.task.id}"', data.json()['html'])
+
+        User.objects.create_user(username='other', password='pass')
+        self.client.login(username='other', password='pass')
+        response = self.client.get(reverse('task_card', args=[self.task.id]))
+        self.assertEqual(response.status_code, 404)
+
+
+class TaskTransitionTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='tester', password='pass')
+        self.client.login(username='tester', password='pass')
+        self.project = Project.objects.create(
+            name='Transitions', description='', owner=self.user,
+            start_date=date.today(), end_date=date.today())
+        self.task = self.project.tasks.create(name='Contended')
+
+    def test_transition_writes_only_changed_columns(self):
+        """A stale copy's other fields are not written back."""
+        Task.objects.filter(id=self.task.id).update(name='Renamed')
+        # The next change number (2), then a single UPDATE
+        with self.assertNumQueries(3):
+            updated = self.task.transition('outstanding', status='overdue')
+        self.assertEqual(updated, 1)
+        self.task.refresh_from_db()
+        self.assertEqual(self.task.name, 'Renamed')
+        self.assertEqual(self.task.status, 'overdue')
+
+    def test_stale_transition_updates_nothing(self):
+        stale = Task.objects.get(id=self.task.id)
+        self.assertEqual(self.task.complete(), 1)
+        self.assertEqual(stale.complete(), 0)
+        # The losing copy is left as it was read
+        self.assertEqual(stale.status, 'outstanding')
+        self.assertEqual(TaskDailyRollup.objects.get().completed, 1)
+
+    def test_fragment_reports_conflict(self):
+        """A toggle lost to another request answers 409 with the card."""
+        stale = Task.objects.get(id=self.task.id)
+        original = Task.complete
+
+        def complete_after_other_request(task):
+            # Another request completes the task first
+            original(stale)
+            return original(task)
+
+        url = reverse('task_toggle_complete_fragment', args=[self.task.id])
+        with mock.patch.object(Task, 'complete', autospec=True,
+                               side_effect=complete_after_other_request):
+            response = self.client.post(url)
+        self.assertEqual(response.status_code, 409)
+        data = response.json()
+        self.assertEqual(data['status'], 'completed')
+        self.assertIn('changed by someone else', data['messages'][0])
+        self.assertEqual(TaskDailyRollup.objects.get().completed, 1)
+
+    def test_task_close_reports_conflict(self):
+        self.task.complete()
+        response = self.client.get(
+            reverse('task_close', args=[self.task.id]), follow=True)
+        self.assertContains(response, 'is already closed')
+
+
+class TaskTransitionContentionTests(TransactionTestCase):
+    THREADS = 8
+
+    def test_concurrent_completions_apply_once(self):
+        """Of many simultaneous completions exactly one takes effect."""
+        user = User.objects.create_user(username='racer', password='pass')
+        project = Project.objects.create(
+            name='Race', description='', owner=user,
+            start_date=date.today(), end_date=date.today())
+        task = project.tasks.create(name='Contended')
+
+        barrier = threading.Barrier(self.THREADS)
+        results = []
+        errors = []
+
+        def complete(copy):
+            # The in-memory test database reports a lock held by another
+            # transaction at once instead of waiting for it like a file or
+            # PostgreSQL database; wait and retry as they would. The whole
+            # completion is one transaction, so a retry starts over from
+            # the same state.
+            status = copy.status
+            for attempt in range(100):
+                try:
+                    with transaction.atomic():
+                        return copy.complete()
+                except OperationalError as exc:
+                    if 'locked' not in str(exc):
+                        raise
+                    copy.status = status
+                    copy.previous_status = copy.completed_at = None
+                    time.sleep(0.01)
+            raise AssertionError('Task stayed locked')
+
+        def worker():
+            try:
+                copy = Task.objects.select_related('project').get(id=task.id)
+                barrier.wait()
+                results.append(complete(copy))
+            except Exception as exc:
+                errors.append(exc)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker)
+                   for _ in range(self.THREADS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(sorted(results), [0] * (self.THREADS - 1) + [1])
+        # The rollup counts the completion once
+        self.assertEqual(TaskDailyRollup.objects.get().completed, 1)
+
+
+class TaskViewQueryCountTests(TestCase):
+    """
+    Task views load the task and its project in one query, so their cost
+    doesn't depend on how many tasks or projects the user has.
+    """
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='tester', password='pass')
+        self.client.login(username='tester', password='pass')
+        for i in range(3):
+            project = Project.objects.create(
+                name=f'Project {i}', description='', owner=self.user,
+                start_date=date.today(), end_date=date.today())
+            Task.objects.bulk_create(
+                Task(project=project, name=f'Task {n}',
+                     end_date=date.today() + timedelta(days=1))
+                for n in range(20))
+        self.task = project.tasks.first()
+
+    def assertQueries(self, expected, method, view, data=None, status=200):
+        url = reverse(view, args=[self.task.id])
+        with self.assertNumQueries(expected):
+            response = getattr(self.client, method)(url, data or {})
+        self.assertEqual(response.status_code, status)
+
+    def test_read_views(self):
+        # session, user, task joined with its project
+        self.assertQueries(3, 'get', 'task_edit')
+        self.assertQueries(3, 'get', 'task_description')
+        # check_status() only saves a status that actually changed; then
+        # the task's predecessors and successors
+        self.assertQueries(5, 'get', 'task_detail')
+
+    def test_write_views(self):
+        # Create today's rollup row so each toggle takes the same path
+        self.task.toggle_complete()
+        self.task.toggle_complete()
+
+        # session, user, task + project, the next change number (2),
+        # conditional UPDATE, rollup UPDATE and the rollup snapshot (2)
+        self.assertQueries(9, 'get', 'task_toggle_complete', status=302)
+        self.assertQueries(9, 'get', 'task_toggle_complete', status=302)
+        self.assertQueries(9, 'get', 'task_close', status=302)
+        # ... plus one aggregate for the counters
+        self.assertQueries(10, 'post', 'task_toggle_complete_fragment')
+        # session, user, task + project, then the form saves the row with
+        # the next change number (2); the status is unchanged. The end
+        # date changed, so the schedule is updated from this task alone:
+        # savepoint, project lock, graph, the task's row, UPDATE, release
+        self.assertQueries(12, 'post', 'task_edit', {
+            'name': 'Renamed', 'description': '', 'start_date': '',
+            'end_date': ''}, status=302)
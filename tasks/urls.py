@@ -1,13 +1,49 @@
+from django.conf import settings
 from django.urls import path
-from . import views
+from . import views, async_views
+
+# Read-only pages come from their async versions under ASGI (ASYNC_VIEWS)
+read_views = async_views if settings.ASYNC_VIEWS else views
 
 urlpatterns = [
+    # Tasks due across all of the user's projects, grouped by day
+    path('agenda/', read_views.agenda, name='agenda'),
+
+    # Chart data (JSON) read from the daily rollups, per user and per project
+    path('analytics/', views.analytics_data, name='analytics_data'),
+    path('analytics/project/<int:project_id>/',
+         views.project_analytics_data, name='project_analytics_data'),
+
     # Create a new task under a specific project
     path('project/<int:project_id>/create/',
          views.task_create, name='task_create'),
 
+    # Complete, re-open or delete the tasks ticked on a project page
+    path('project/<int:project_id>/bulk/',
+         views.task_bulk_action, name='task_bulk_action'),
+
     # View the detail of a specific task
-    path('tasks/<int:task_id>/', views.task_detail, name='task_detail'),
+    path('tasks/<int:task_id>/', read_views.task_detail, name='task_detail'),
+
+    # Full task description, loaded on demand by "read more" (JSON)
+    path('tasks/<int:task_id>/description/', views.task_description,
+         name='task_description'),
+
+    # Finish-to-start dependencies: wait for another task, or stop waiting
+    path('tasks/<int:task_id>/dependencies/add/', views.task_dependency_add,
+         name='task_dependency_add'),
+    path('tasks/<int:task_id>/dependencies/<int:predecessor_id>/remove/',
+         views.task_dependency_remove, name='task_dependency_remove'),
+
+    # Stop a recurring task repeating
+    path('tasks/<int:task_id>/recurrence/stop/', views.task_recurrence_stop,
+         name='task_recurrence_stop'),
+
+    # Drop a task between two cards of the project board (JSON)
+    path('tasks/<int:task_id>/move/', views.task_move, name='task_move'),
+
+    # Current task card and counters (JSON), fetched by live project pages
+    path('tasks/<int:task_id>/card/', views.task_card, name='task_card'),
 
     # Edit a specific task
     path('<int:task_id>/edit/', views.task_edit, name='task_edit'),
@@ -21,4 +57,9 @@ urlpatterns = [
     # Toggle the task's completion status (complete ↔ reopen)
     path('tasks/<int:task_id>/toggle_complete/',
          views.task_toggle_complete, name='task_toggle_complete'),
+
+    # Same toggle for scripts: returns the updated card and counters as JSON
+    path('tasks/<int:task_id>/toggle_complete/fragment/',
+         views.task_toggle_complete_fragment,
+         name='task_toggle_complete_fragment'),
 ]
@@ -5,25 +5,85 @@ from django.contrib import messages
 from django.urls import reverse
 from django.utils.http import urlencode
 from django.contrib.auth.hashers import check_password
-
-from .models import Task
-from .forms import TaskForm, TaskEditForm
-from projects.models import Project
+from django.http import JsonResponse
+from django.template.loader import render_to_string
+from django.template.defaultfilters import linebreaksbr
+from django.views.decorators.http import require_POST
+from django.db import transaction
+from django.db.models import Q, Sum
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from datetime import date, timedelta
+from itertools import groupby
+import heapq
+
+from .models import Task, TaskDailyRollup, TaskRecurrence
+from .ranking import rebalance_ranks
+from .recurrence import horizon, materialize, pending_occurrences
+from .scheduling import (DependencyError, add_dependency,
+                         dependency_neighbours, remove_dependency,
+                         update_schedule)
+from .forms import DependencyForm, TaskForm, TaskEditForm
+from projects.archive import recover_moved_tasks
+from projects.events import publish
+from projects.models import Project, EXCERPT_LENGTH
+from projects.sharding import on_user_shard, write_db
+
+# Default and maximum number of days shown in the agenda
+AGENDA_DEFAULT_DAYS = 7
+AGENDA_MAX_DAYS = 31
+
+# Agenda starts are kept this far from the ends of the calendar, so the
+# window, its previous/next links and the recurring rules looked up for it
+# stay within the dates Python can represent
+AGENDA_DATE_MARGIN = timedelta(
+    days=2 * AGENDA_MAX_DAYS + TaskRecurrence.MAX_DURATION_DAYS)
+
+# Default and maximum number of days returned by the chart-data endpoints
+ANALYTICS_DEFAULT_DAYS = 30
+ANALYTICS_MAX_DAYS = 365
+
+# Largest task id: posted ids beyond a 64-bit integer can't be looked up
+MAX_TASK_ID = 2 ** 63 - 1
+
+# Actions offered for the tasks ticked on project_detail, with the message
+# reporting how many tasks each one changed
+BULK_ACTIONS = {
+    'complete': "{count} task(s) marked as complete.",
+    'reopen': "{count} task(s) reopened.",
+    'delete': "{count} task(s) deleted.",
+}
 
 
 @login_required
 @never_cache
 def task_create(request, project_id):
     # Ensure only the project owner can add tasks
-    project = get_object_or_404(Project, id=project_id, owner=request.user)
+    project = get_object_or_404(
+        Project.objects.for_user(request.user), id=project_id)
 
     if request.method == 'POST':
         form = TaskForm(request.POST)
         if form.is_valid():
             task = form.save(commit=False)
             task.project = project  # Link task to the correct project
-            task.save()
+            recurrence = form.recurrence(task)
+            with transaction.atomic(using=write_db(project)):
+                if recurrence:
+                    # The task is the rule's first occurrence
+                    recurrence.save()
+                    task.recurrence = recurrence
+                    task.occurrence_date = task.start_date
+                task.save()
             task.check_status()  # Ensure status is up-to-date
+            if recurrence:
+                # Occurrences within the horizon right away; the
+                # materialize_recurrences job keeps it rolling
+                materialize([recurrence], horizon())
+            TaskDailyRollup.refresh_snapshot(project)
+            # A new task has no dependencies: only its own figures change
+            update_schedule(project, forward=[task.id], backward=[task.id])
+            _publish_task(task, 'task.created')
             messages.success(
                 request, f"Task '{task.name}' created successfully!")
             return redirect('project_detail', project_id=project.id)
@@ -37,7 +97,8 @@ def task_create(request, project_id):
 @login_required
 @never_cache
 def task_detail(request, task_id):
-    task = get_object_or_404(Task, id=task_id, project__owner=request.user)
+    task = get_object_or_404(
+        Task.objects.for_user(request.user), id=task_id)
 
     task.check_status()  # Refresh status before showing
 
@@ -47,13 +108,32 @@ def task_detail(request, task_id):
     return render(request, 'tasks/task_detail.html', {
         'task': task,
         'error_task_id': error_task_id,
+        'predecessors': list(_predecessors(task)),
+        'successors': list(_successors(task)),
+        # Only a recurring task costs the query
+        'recurrence': task.recurrence if task.recurrence_id else None,
     })
 
 
+def _predecessors(task):
+    # The tasks `task` waits for
+    return Task.objects.using(task._state.db).filter(
+        successor_links__successor_id=task.id).order_by('id').only(
+        'name', 'status', 'end_date')
+
+
+def _successors(task):
+    # The tasks waiting for `task`
+    return Task.objects.using(task._state.db).filter(
+        predecessor_links__predecessor_id=task.id).order_by('id').only(
+        'name', 'status', 'start_date')
+
+
 @login_required
 @never_cache
 def task_edit(request, task_id):
-    task = get_object_or_404(Task, id=task_id, project__owner=request.user)
+    task = get_object_or_404(
+        Task.objects.for_user(request.user), id=task_id)
     project = task.project
 
     redirect_to = request.GET.get('next', reverse(
@@ -65,6 +145,12 @@ def task_edit(request, task_id):
             task = form.save(commit=False)
             task.check_status()  # Update status after changes
             task.save()
+            if {'start_date', 'end_date'} & set(form.changed_data):
+                # Only this task's descendants (earliest starts) and
+                # ancestors (latest starts) can be affected
+                update_schedule(project, forward=[task.id],
+                                backward=[task.id])
+            _publish_task(task, 'task.updated')
             messages.success(
                 request, f"Task '{task.name}' updated successfully!")
             return redirect(redirect_to)
@@ -79,7 +165,8 @@ def task_edit(request, task_id):
 @login_required
 @never_cache
 def task_delete(request, task_id):
-    task = get_object_or_404(Task, id=task_id, project__owner=request.user)
+    task = get_object_or_404(
+        Task.objects.for_user(request.user), id=task_id)
     project = task.project
 
     # Get redirect path from POST or fallback to project page
@@ -97,7 +184,14 @@ def task_delete(request, task_id):
                 redirect_url = f"{next_url}?error_task_id={task.id}"
             return redirect(redirect_url)
 
+        task_id = task.id
+        successor_ids, predecessor_ids = dependency_neighbours(
+            project, [task_id])
         task.delete()
+        update_schedule(project, forward=successor_ids,
+                        backward=predecessor_ids)
+        TaskDailyRollup.refresh_snapshot(project)
+        publish(project, 'task.deleted', task_id=task_id)
         messages.success(request, f"Task '{task.name}' deleted successfully!")
         return redirect(next_url)
 
@@ -107,48 +201,106 @@ def task_delete(request, task_id):
 @login_required
 @never_cache
 def task_close(request, task_id):
-    task = get_object_or_404(Task, id=task_id, project__owner=request.user)
-    task.status = 'completed'
-    task.check_status()
-    task.save()
-    messages.success(request, f"Task '{task.name}' closed successfully!")
-    return redirect('project_detail', project_id=task.project.id)
-
-
-@login_required
-@never_cache
-def task_toggle_complete(request, task_id):
-    task = get_object_or_404(Task, id=task_id, project__owner=request.user)
-
+    task = get_object_or_404(
+        Task.objects.for_user(request.user), id=task_id)
     if task.status == 'completed':
-        # Revert to previous or default to 'outstanding'
-        prev_status = (task.previous_status
-                       if task.previous_status else 'outstanding')
-        task.status = prev_status
-        task.previous_status = None
-        task.check_status()
+        messages.info(request, f"Task '{task.name}' is already closed.")
+    elif task.complete():
+        TaskDailyRollup.refresh_snapshot(task.project)
+        _publish_task(task, 'task.toggled')
+        messages.success(request, f"Task '{task.name}' closed successfully!")
+    else:
+        messages.warning(request, _conflict_message(task))
+    return redirect('project_detail', project_id=task.project_id)
+
+
+def _publish_task(task, event_type):
+    # Open project pages fetch the card from card_url (it carries the
+    # viewer's own CSRF token, so it can't be rendered here)
+    publish(task.project, event_type, task_id=task.id, status=task.status,
+            card_url=reverse('task_card', args=[task.id]))
+
+
+def _task_id(value):
+    # A posted task id as an int, or None if it can't be one
+    if value and value.isdigit() and 1 <= int(value) <= MAX_TASK_ID:
+        return int(value)
+    return None
+
+
+def _conflict_message(task):
+    return (f"Task '{task.name}' was changed by someone else in the "
+            "meantime, so it was left as it is. Please check it and try "
+            "again.")
+
+
+def _reopen_closed_project(project):
+    """
+    Re-open `project` if it is closed, because it has open tasks again;
+    only if it is still closed, in case another request got there first.
+    Returns whether it was re-opened.
+    """
+    if project.status != 'closed':
+        return False
+    using = write_db(project)
+    with transaction.atomic(using=using):
+        if not Project.objects.using(using).filter(
+                pk=project.pk, status='closed').update_changed(
+                project.owner_id, status='open', closed_at=None):
+            return False
+        # This UPDATE skips Project.save(), so bring back the tasks an
+        # unfinished archive run had moved out here
+        recover_moved_tasks(project)
+    project.status = 'open'
+    project.closed_at = None
+    publish(project, 'project.reopened')
+    return True
+
+
+def _toggle_task(task):
+    """
+    Complete or re-open a task (re-opening its project if it was closed).
+    Each change is a conditional UPDATE, so of two concurrent toggles only
+    one applies. Returns (changed, messages), where messages are the
+    (level, text) pairs describing what happened; changed is False when
+    another request got there first.
+    """
+    notes = []
+    if task.status == 'completed':
+        if not task.reopen():
+            return False, [(messages.WARNING, _conflict_message(task))]
 
         # Reopen project if needed
         project = task.project
-        if project.status == 'closed':
-            project.status = 'open'
-            project.save()
-            messages.info(
-                request,
+        if _reopen_closed_project(project):
+            notes.append((
+                messages.INFO,
                 (f"Project '{project.name}'"
                  "was reopened due to current tasks open and outstanding.")
-            )
+            ))
 
-        messages.success(request, f"Task '{task.name}' reopened.")
+        notes.append((messages.SUCCESS, f"Task '{task.name}' reopened."))
 
     else:
-        # Mark as completed and store old status
-        task.previous_status = task.status
-        task.status = 'completed'
-        task.check_status()
-        messages.success(request, f"Task '{task.name}' marked as complete.")
+        if not task.complete():
+            return False, [(messages.WARNING, _conflict_message(task))]
+        notes.append(
+            (messages.SUCCESS, f"Task '{task.name}' marked as complete."))
+
+    TaskDailyRollup.refresh_snapshot(task.project)
+    _publish_task(task, 'task.toggled')
+    return True, notes
+
+
+@login_required
+@never_cache
+def task_toggle_complete(request, task_id):
+    task = get_object_or_404(
+        Task.objects.for_user(request.user), id=task_id)
 
-    task.save()
+    changed, notes = _toggle_task(task)
+    for level, text in notes:
+        messages.add_message(request, level, text)
 
     # Redirect to 'next' URL if present, else to project detail
     next_url = request.GET.get("next")
@@ -156,3 +308,391 @@ def task_toggle_complete(request, task_id):
         return redirect(next_url)
 
     return redirect('project_detail', project_id=task.project.id)
+
+
+@login_required
+@never_cache
+@require_POST
+def task_toggle_complete_fragment(request, task_id):
+    """
+    Toggle a task and return only what changed: the re-rendered task card
+    and the project's counters, instead of redirecting to a full
+    project_detail render. A toggle lost to a concurrent change answers
+    409 with the card as it now stands.
+    """
+    tasks = Task.objects.for_user(request.user)
+    task = get_object_or_404(tasks, id=task_id)
+    changed, notes = _toggle_task(task)
+    if not changed:
+        task = get_object_or_404(tasks, id=task_id)
+    return _card_response(request, task, notes, status=200 if changed else 409)
+
+
+@login_required
+@never_cache
+@require_POST
+def task_bulk_action(request, project_id):
+    """
+    Complete, re-open or delete the tasks ticked on project_detail at
+    once: a status change is one UPDATE and a deletion one DELETE for the
+    whole selection, instead of a round trip (and, for deletion, a
+    password check) per task. Statuses are kept for a later re-open the
+    way task_toggle_complete keeps them.
+    """
+    project = get_object_or_404(
+        Project.objects.for_user(request.user), id=project_id)
+    next_url = request.POST.get('next') or reverse(
+        'project_detail', kwargs={'project_id': project.id})
+    action = request.POST.get('action')
+    # Values that can't be task ids would only make the lookup fail
+    task_ids = [task_id for task_id in map(
+        _task_id, request.POST.getlist('task_ids')) if task_id is not None]
+
+    if action not in BULK_ACTIONS:
+        messages.error(request, "Please choose what to do with the tasks.")
+        return redirect(next_url)
+    if not task_ids:
+        messages.info(request, "No tasks were selected.")
+        return redirect(next_url)
+
+    if action == 'delete':
+        # One password check covers the whole selection
+        password = request.POST.get('password', '')
+        if not password or not check_password(password, request.user.password):
+            messages.error(
+                request, "Incorrect password. Tasks were not deleted.")
+            return redirect(next_url)
+
+    # Only this project's tasks, so ids of other users' tasks do nothing
+    tasks = project.tasks.filter(id__in=task_ids)
+    with transaction.atomic(using=write_db(project)):
+        if action == 'complete':
+            changed = tasks.complete_all(project)
+        elif action == 'reopen':
+            changed = tasks.reopen_all(project)
+            if changed:
+                _reopen_closed_project(project)
+        else:
+            successor_ids, predecessor_ids = dependency_neighbours(
+                project, list(tasks.values_list('id', flat=True)))
+            changed = len(tasks.delete_changed(project.owner_id))
+            update_schedule(project, forward=successor_ids,
+                            backward=predecessor_ids)
+        if changed:
+            TaskDailyRollup.refresh_snapshot(project)
+            # Open pages reload rather than fetch every card
+            publish(project, 'task.bulk', action=action)
+
+    messages.success(request, BULK_ACTIONS[action].format(count=changed))
+    return redirect(next_url)
+
+
+@login_required
+@never_cache
+@require_POST
+def task_dependency_add(request, task_id):
+    """
+    Make the task wait for another task of its project (by id) to
+    finish. Only the part of the schedule the new edge reaches is
+    recomputed.
+    """
+    tasks = Task.objects.for_user(request.user)
+    task = get_object_or_404(tasks, id=task_id)
+    form = DependencyForm(request.POST)
+    predecessor = form.is_valid() and tasks.filter(
+        project_id=task.project_id,
+        id=form.cleaned_data['predecessor']).first()
+    if not predecessor:
+        messages.error(request, "Enter the ID of a task in this project.")
+    else:
+        try:
+            add_dependency(predecessor, task)
+        except DependencyError as error:
+            messages.error(request, str(error))
+        else:
+            messages.success(
+                request,
+                f"Task '{task.name}' now waits for '{predecessor.name}'.")
+    return redirect('task_detail', task_id=task.id)
+
+
+@login_required
+@never_cache
+@require_POST
+def task_dependency_remove(request, task_id, predecessor_id):
+    """Stop the task waiting for one of its predecessors."""
+    tasks = Task.objects.for_user(request.user)
+    task = get_object_or_404(tasks, id=task_id)
+    predecessor = get_object_or_404(
+        tasks, id=predecessor_id, project_id=task.project_id)
+    if remove_dependency(predecessor, task):
+        messages.success(
+            request,
+            f"Task '{task.name}' no longer waits for '{predecessor.name}'.")
+    return redirect('task_detail', task_id=task.id)
+
+
+@login_required
+@never_cache
+@require_POST
+def task_recurrence_stop(request, task_id):
+    """
+    Stop a recurring task repeating after the occurrences already created
+    as tasks, which are left as they are.
+    """
+    task = get_object_or_404(
+        Task.objects.for_user(request.user), id=task_id,
+        recurrence__isnull=False)
+    recurrence = task.recurrence
+    last = recurrence.materialized_until or recurrence.starts_on
+    if recurrence.ends_on is None or recurrence.ends_on > last:
+        TaskRecurrence.objects.using(write_db(task)).filter(
+            pk=recurrence.pk).update(ends_on=last)
+    messages.success(
+        request, f"Task '{task.name}' no longer repeats after "
+                 f"{last:%b %d, %Y}.")
+    return redirect('task_detail', task_id=task.id)
+
+
+def _neighbour_ranks(task, data):
+    """
+    Ranks of the cards the task was dropped between, from the `before`
+    and `after` task ids posted by the board (None at a column's end).
+    """
+    ids = {key: _task_id(data.get(key)) for key in ('before', 'after')}
+    ids = {key: task_id for key, task_id in ids.items()
+           if task_id is not None and task_id != task.id}
+    ranks = dict(Task.objects.using(write_db(task)).filter(
+        project_id=task.project_id, id__in=ids.values()).values_list(
+        'id', 'rank')) if ids else {}
+    return ranks.get(ids.get('before')), ranks.get(ids.get('after'))
+
+
+@login_required
+@never_cache
+@require_POST
+def task_move(request, task_id):
+    """
+    Drop a task between two cards of a board column. Only the task's own
+    row is updated (a new rank, and the status when it crosses between
+    the completed and open columns). Answers 409 when the board was out
+    of date, so the page reloads.
+    """
+    tasks = Task.objects.for_user(request.user)
+    task = get_object_or_404(tasks, id=task_id)
+    column = request.POST.get('column')
+    if column not in dict(Task.STATUS_CHOICES):
+        return JsonResponse({'error': 'Unknown column.'}, status=400)
+    if any(request.POST.get(key) and _task_id(request.POST[key]) is None
+           for key in ('before', 'after')):
+        return JsonResponse({'error': 'Unknown task.'}, status=400)
+
+    was_completed = task.status == 'completed'
+    try:
+        moved = task.move(column, *_neighbour_ranks(task, request.POST))
+    except ValueError:
+        # No room between the two ranks (equal, or unranked tasks): spread
+        # the project's ranks out and try again
+        rebalance_ranks(task.project_id, write_db(task))
+        task = get_object_or_404(tasks, id=task_id)
+        try:
+            moved = task.move(column, *_neighbour_ranks(task, request.POST))
+        except ValueError:
+            # The neighbours posted aren't in that order any more
+            moved = 0
+    if not moved:
+        return JsonResponse({'error': 'The board has changed.'}, status=409)
+
+    if was_completed != (task.status == 'completed'):
+        if was_completed:
+            # Re-opened by the move, as by the toggle
+            _reopen_closed_project(task.project)
+        TaskDailyRollup.refresh_snapshot(task.project)
+    _publish_task(task, 'task.updated')
+    return JsonResponse({
+        'task_id': task.id,
+        'status': task.status,
+        'rank': task.rank,
+        'counts': task.project.task_counts(),
+    })
+
+
+@login_required
+@never_cache
+def task_card(request, task_id):
+    """
+    The current task card and project counters, in the same shape as the
+    toggle fragment; fetched by project pages told of a change by the
+    project's event stream.
+    """
+    task = get_object_or_404(
+        Task.objects.for_user(request.user), id=task_id)
+    return _card_response(request, task)
+
+
+def _card_response(request, task, notes=(), status=200):
+    # The card shows the same excerpt project_detail loads via for_cards()
+    task.description_excerpt = task.description[:EXCERPT_LENGTH + 1]
+    html = render_to_string('tasks/partials/task_card.html', {
+        'task': task,
+        'error_task_id': '',
+    }, request=request)
+    return JsonResponse({
+        'task_id': task.id,
+        'status': task.status,
+        'html': html,
+        'counts': task.project.task_counts(),
+        'project_status': task.project.status,
+        'messages': [text for level, text in notes],
+    }, status=status)
+
+
+@login_required
+@never_cache
+def task_description(request, task_id):
+    """
+    Full task description for the "read more" link on task cards, which
+    only load an excerpt.
+    """
+    description = get_object_or_404(
+        Task.objects.for_user(request.user).values_list(
+            'description', flat=True),
+        id=task_id)
+    return JsonResponse({
+        'id': task_id,
+        'description': description,
+        'html': linebreaksbr(description),
+    })
+
+
+def _agenda_window(request):
+    """(today, start, end, days) for ?start=YYYY-MM-DD&days=N."""
+    today = timezone.now().date()
+
+    # Date window: ?start=YYYY-MM-DD&days=N (defaults to the next 7 days)
+    try:
+        # Well-formed but impossible dates (2024-02-30) raise ValueError
+        start = parse_date(request.GET.get('start') or '') or today
+    except ValueError:
+        start = today
+    start = min(max(start, date.min + AGENDA_DATE_MARGIN),
+                date.max - AGENDA_DATE_MARGIN)
+    try:
+        days = int(request.GET.get('days', AGENDA_DEFAULT_DAYS))
+    except ValueError:
+        days = AGENDA_DEFAULT_DAYS
+    days = max(1, min(days, AGENDA_MAX_DAYS))
+    end = start + timedelta(days=days - 1)
+    return today, start, end, days
+
+
+def _agenda_tasks(user, start, end):
+    # One range query across all of the user's projects; statuses are only
+    # read here (overdue is worked out from the date), never written.
+    return (Task.objects.for_user(user)
+            .filter(end_date__range=(start, end))
+            .exclude(status='completed')
+            .order_by('end_date', 'project_id', 'id'))
+
+
+def _agenda_recurrences(user, start, end):
+    # Rules of the user's open projects that may have occurrences due in
+    # the window; which ones are still to be created is worked out in
+    # Python (see pending_occurrences)
+    return (on_user_shard(TaskRecurrence.objects.all(), user)
+            .filter(project__owner=user, project__deleted_at__isnull=True,
+                    project__status='open', duration_days__isnull=False,
+                    starts_on__lte=end)
+            .filter(Q(ends_on__isnull=True) | Q(
+                ends_on__gte=start - timedelta(
+                    days=TaskRecurrence.MAX_DURATION_DAYS)))
+            .select_related('project'))
+
+
+def _agenda_context(tasks, today, start, end, days, recurrences=()):
+    # Occurrences beyond the materialised horizon are listed alongside the
+    # tasks, in the same (end_date, project) order
+    occurrences = pending_occurrences(recurrences, start, end, today)
+    items = heapq.merge(tasks, occurrences, key=lambda item: (
+        item.end_date, item.project_id))
+
+    # Group the ordered tasks into one entry per due date
+    agenda_days = [
+        {'day': day, 'tasks': list(day_tasks)}
+        for day, day_tasks in groupby(items, key=lambda task: task.end_date)
+    ]
+    return {
+        'agenda_days': agenda_days,
+        'start': start,
+        'end': end,
+        'days': days,
+        'today': today,
+        'previous_start': start - timedelta(days=days),
+        'next_start': start + timedelta(days=days),
+    }
+
+
+@login_required
+@never_cache
+def agenda(request):
+    today, start, end, days = _agenda_window(request)
+    tasks = _agenda_tasks(request.user, start, end)
+    recurrences = _agenda_recurrences(request.user, start, end)
+    return render(request, 'tasks/agenda.html',
+                  _agenda_context(tasks, today, start, end, days,
+                                  recurrences))
+
+
+def _rollup_series(request, rollups):
+    """
+    Build a day-by-day chart series from a TaskDailyRollup queryset.
+    Days without a rollup row report zero completions and no snapshot.
+    """
+    try:
+        days = int(request.GET.get('days', ANALYTICS_DEFAULT_DAYS))
+    except ValueError:
+        days = ANALYTICS_DEFAULT_DAYS
+    days = max(1, min(days, ANALYTICS_MAX_DAYS))
+    end = timezone.now().date()
+    start = end - timedelta(days=days - 1)
+
+    # Sum across projects so the same code serves per-user charts
+    rows = (rollups
+            .filter(day__range=(start, end))
+            .values('day')
+            .annotate(completed=Sum('completed'),
+                      open=Sum('open_count'),
+                      overdue=Sum('overdue_count'))
+            .order_by('day'))
+    by_day = {row['day']: row for row in rows}
+
+    series = []
+    for offset in range(days):
+        day = start + timedelta(days=offset)
+        row = by_day.get(day, {})
+        series.append({
+            'day': day.isoformat(),
+            'completed': row.get('completed') or 0,
+            'open': row.get('open'),
+            'overdue': row.get('overdue'),
+        })
+    return JsonResponse({
+        'start': start.isoformat(),
+        'end': end.isoformat(),
+        'days': series,
+    })
+
+
+@login_required
+@never_cache
+def analytics_data(request):
+    # Throughput and open/overdue totals across all of the user's projects
+    return _rollup_series(request, request.user.task_rollups.all())
+
+
+@login_required
+@never_cache
+def project_analytics_data(request, project_id):
+    project = get_object_or_404(
+        Project.objects.for_user(request.user), id=project_id)
+    return _rollup_series(request, project.daily_rollups.all())
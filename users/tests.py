@@ -4,6 +4,7 @@ from django.contrib.auth import authenticate
 from users.forms import CustomUserCreationForm, CustomAuthenticationForm
 from django.core.exceptions import ValidationError
 from django.urls import reverse
+from django.core.cache import cache
 
 # Tests for the CustomUserCreationForm
 
@@ -110,6 +111,10 @@ class CustomAuthenticationFormTest(TestCase):
 
 
 class UserViewTests(TestCase):
+    def setUp(self):
+        # Start every test with an empty public page cache
+        cache.clear()
+
     def test_register_view_get(self):
         """GET request to registration view
         returns 200 and correct template."""
@@ -2,6 +2,7 @@ from django.shortcuts import render, redirect
 from django.contrib.auth import login, logout, authenticate, get_user_model
 from django.views.decorators.cache import never_cache
 from django.contrib import messages
+from core.page_cache import cache_public_page
 from .forms import CustomUserCreationForm, CustomAuthenticationForm
 
 User = get_user_model()
@@ -10,6 +11,7 @@ User = get_user_model()
 
 
 @never_cache
+@cache_public_page
 def login_view(request):
     login_form = CustomAuthenticationForm(request, data=request.POST or None)
     register_form = CustomUserCreationForm()
@@ -56,6 +58,7 @@ def login_view(request):
 
 
 @never_cache
+@cache_public_page
 def register_view(request):
     login_form = CustomAuthenticationForm(request)  # Blank form for display
     register_form = CustomUserCreationForm(request.POST or None)